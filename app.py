@@ -4,6 +4,9 @@ from config import Config
 from models.database import db, init_app
 from models.models import User, Category, Product
 from utils.notifications import check_low_stock
+from utils import (metrics, shared_store, passwords, tokens, order_expiry, balance, inventory, product_stats,
+                   dashboard_counters, migrations, query_plans, profiler, charts, fragment_cache, page_cache,
+                   recommendations, user_recommendations, suggest, warmup, compression, background)
 from datetime import datetime
 
 def create_app():
@@ -15,6 +18,26 @@ def create_app():
     # 初始化扩展
     # =========================
     init_app(app)
+    metrics.init_app(app)
+    shared_store.init_app(app)
+    passwords.init_app(app)
+    tokens.init_app(app)
+    order_expiry.init_app(app)
+    balance.init_app(app)
+    inventory.init_app(app)
+    product_stats.init_app(app)
+    dashboard_counters.init_app(app)
+    migrations.init_app(app)
+    query_plans.init_app(app)
+    profiler.init_app(app)
+    charts.init_app(app)
+    fragment_cache.init_app(app)
+    page_cache.init_app(app)
+    recommendations.init_app(app)
+    user_recommendations.init_app(app)
+    suggest.init_app(app)
+    warmup.init_app(app)
+    compression.init_app(app)
 
     # =========================
     # Flask-Login 配置
@@ -28,6 +51,11 @@ def create_app():
     def load_user(user_id):
         return User.query.get(int(user_id))
 
+    @login_manager.request_loader
+    def load_user_from_request(request):
+        # API 客户端：Authorization: Bearer <访问令牌>，按令牌声明构造用户，不查询 users 表
+        return tokens.user_from_request(request)
+
     # =========================
     # 注册蓝图
     # =========================
@@ -59,6 +87,7 @@ def create_app():
     # 首页路由
     # =========================
     @app.route('/')
+    @page_cache.cached_page()
     def index():
         return render_template('index.html')
 
@@ -86,15 +115,36 @@ def create_app():
             app.last_stock_check = datetime.now()
 
     # =========================
-    # 创建数据库表和示例数据
+    # 命令行：建表与示例数据（不在每个 worker 启动时执行）
     # =========================
-    with app.app_context():
-        db.create_all()
-        create_sample_data()
+    register_commands(app)
 
     return app
 
 
+def register_commands(app):
+    """注册 flask init-db / flask seed 命令"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """创建数据库表并执行迁移"""
+        init_db()
+        print('数据库初始化完成')
+
+    @app.cli.command('seed')
+    def seed_command():
+        """写入默认管理员、示例分类与示例商品"""
+        create_sample_data()
+        db.session.commit()
+        print('示例数据写入完成')
+
+
+def init_db():
+    """创建缺失的表，并执行迁移（新库上迁移只做登记）"""
+    db.create_all()
+    migrations.upgrade()
+
+
 def create_sample_data():
     """创建示例数据"""
     # 默认管理员
@@ -130,6 +180,7 @@ def create_sample_data():
                 name='维生素C 1000mg',
                 description='高效维生素C补充，增强免疫力，抗氧化，促进胶原蛋白合成',
                 category_id=vitamin_cat.id,
+                nutrient_type='vitamin',
                 price=89.90,
                 stock_quantity=100
             ),
@@ -137,6 +188,7 @@ def create_sample_data():
                 name='钙镁锌片',
                 description='复合矿物质补充，强健骨骼，维持神经肌肉正常功能',
                 category_id=mineral_cat.id,
+                nutrient_type='mineral',
                 price=129.00,
                 stock_quantity=80
             ),
@@ -144,6 +196,7 @@ def create_sample_data():
                 name='乳清蛋白粉',
                 description='优质乳清蛋白，健身必备，快速补充蛋白质',
                 category_id=protein_cat.id,
+                nutrient_type='protein',
                 price=299.00,
                 stock_quantity=50
             )
@@ -154,4 +207,10 @@ def create_sample_data():
 
 if __name__ == '__main__':
     app = create_app()
+    # 本地开发直接运行时顺带建表与写入示例数据
+    with app.app_context():
+        init_db()
+        create_sample_data()
+        db.session.commit()
+    background.start_jobs(app)
     app.run(debug=True, host='0.0.0.0', port=5000)
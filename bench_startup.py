@@ -0,0 +1,57 @@
+# bench_startup.py
+# =============================================
+# 启动耗时基准
+# 在全新的子进程中多次执行 "import app + create_app()"，统计耗时，
+# 并用 -X importtime 列出最耗时的导入模块
+# 用法: python bench_startup.py [次数]
+# =============================================
+
+import os
+import sys
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_SNIPPET = """
+import time
+started = time.perf_counter()
+from app import create_app
+create_app()
+print(time.perf_counter() - started)
+"""
+
+
+def measure(runs):
+    """返回每次冷启动耗时（秒）"""
+    env = dict(os.environ, ORDER_SWEEP_INTERVAL_SECONDS='0', BALANCE_RECONCILE_INTERVAL_SECONDS='0')
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SNIPPET], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def slowest_imports(limit=10):
+    """-X importtime 输出中累计耗时最高的模块"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+                            cwd=ROOT, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, module = line.split('|', 2)
+        rows.append((int(cumulative_us), module.rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = measure(runs)
+    print(f'create_app 冷启动 {runs} 次：'
+          f'最小 {min(timings) * 1000:.0f} ms，中位数 {statistics.median(timings) * 1000:.0f} ms，'
+          f'最大 {max(timings) * 1000:.0f} ms')
+    print('累计耗时最高的导入：')
+    for cumulative_us, module in slowest_imports():
+        print(f'  {cumulative_us / 1000:8.1f} ms  {module}')
@@ -25,10 +25,19 @@ class Config:
         f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD_ENC}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),  # 每个 worker 的连接池大小
+        'pool_recycle': 3600,                            # 早于 MySQL wait_timeout 回收连接
+        'pool_pre_ping': True                            # 借出前检测连接是否可用
+    }
 
     # JWT配置
     JWT_SECRET_KEY = SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)  # 刷新令牌有效期，同时是吊销记录的保留时间
+    # 吊销记录保存在共享存储中：为真时 SHARED_STORE_PATH 为空则启动失败（进程内存储的吊销只对单个 worker 生效）；
+    # 生产入口 wsgi.py 默认开启，本地单进程开发不需要
+    JWT_REQUIRE_SHARED_STORE = os.getenv('JWT_REQUIRE_SHARED_STORE', '0') == '1'
 
     # 文件上传配置
     UPLOAD_FOLDER = 'static/images/products'
@@ -49,3 +58,149 @@ class Config:
     # 业务配置
     LOW_STOCK_THRESHOLD = 10
     ORDER_EXPIRE_MINUTES = 30
+
+    # 超时订单清理配置
+    ORDER_SWEEP_INTERVAL_SECONDS = int(os.getenv('ORDER_SWEEP_INTERVAL_SECONDS', 60))  # 0 表示关闭后台清理
+    ORDER_SWEEP_BATCH_SIZE = 200   # 每批取消的订单数
+    ORDER_SWEEP_MAX_BATCHES = 50   # 单次清理最多批次
+
+    # 余额流水配置
+    BALANCE_CACHE_TTL = 5  # 余额读取缓存秒数
+    BALANCE_RECONCILE_INTERVAL_SECONDS = int(os.getenv('BALANCE_RECONCILE_INTERVAL_SECONDS', 300))  # 快照/对账间隔，0 表示关闭
+    BALANCE_RECONCILE_LAG_SECONDS = 60  # 对账进度只推进到该秒数之前写入的流水，更晚的每次重新扫描
+
+    # 请求剖析配置（管理员加请求头 X-Profile: 1 或参数 _profile=1 触发）
+    PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0))  # 随机抽样比例，0 表示只在管理员触发时剖析
+    PROFILER_INTERVAL = 0.005                                          # 调用栈采样间隔（秒）
+    PROFILER_DIR = os.getenv('PROFILER_DIR', 'instance/profiles')      # 结果保存目录
+    PROFILER_MAX_FILES = 200                                           # 最多保留的结果数
+
+    # 指标配置
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')  # 多进程部署时各 worker 共享的指标目录，空表示单进程
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')                  # /metrics 访问令牌，空表示只允许本机访问
+
+    # 统计图表渲染配置
+    CHART_WORKERS = int(os.getenv('CHART_WORKERS', 1))  # 渲染进程数
+    CHART_CACHE_SIZE = 64                               # 渲染结果缓存条数
+    CHART_RENDER_TIMEOUT = 30                           # 单张图渲染超时（秒）
+
+    # 共享存储与片段缓存配置
+    SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', '')  # 多 worker 共享的 SQLite 文件，空表示进程内存储
+    FRAGMENT_CACHE_SIZE = 500                               # 模板片段缓存条数
+
+    # 匿名访问整页缓存配置
+    PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+    PAGE_CACHE_TTL = 60                   # 页面新鲜期（秒）
+    PAGE_CACHE_STALE_TTL = 300            # 过期后仍可先返回旧页面、后台刷新的时长（秒）
+    PAGE_CACHE_SIZE = 2000                # 每个进程缓存的页面数
+    PAGE_CACHE_IGNORED_PARAMS = ('fbclid', 'gclid', 'spm', '_')  # 不参与缓存键的查询参数（utm_* 也会忽略）
+
+    # 商品评价配置
+    PRODUCT_DETAIL_REVIEWS = 5   # 详情页内嵌的评价条数
+    REVIEW_PAGE_SIZE = 5         # 评价接口每页条数
+    REVIEW_FRAGMENT_TTL = 60     # 评价区 HTML 片段缓存秒数（其他进程的失效延迟上限）
+
+    # “经常一起购买”推荐配置
+    RECOMMENDATION_INTERVAL_SECONDS = int(os.getenv('RECOMMENDATION_INTERVAL_SECONDS', 3600))  # 增量任务间隔，0 表示关闭
+    RECOMMENDATION_SCORE = 'lift'        # 打分方式：lift / jaccard
+    RECOMMENDATION_TOP_K = 6             # 每个商品保留的推荐数
+    RECOMMENDATION_MIN_SUPPORT = 2       # 至少共同出现在多少个订单中才推荐
+    RECOMMENDATION_BATCH_ORDERS = 5000   # 每批读取的订单ID跨度
+    RECOMMENDATION_SETTLE_MINUTES = 5    # 在订单超时时间之外再等待的分钟数
+
+    # 库存分片配置（秒杀热卖商品，用 flask stock-shards <商品ID> 开启）
+    STOCK_SHARDS = 8                      # 默认分片数
+    STOCK_REBALANCE_INTERVAL_SECONDS = int(os.getenv('STOCK_REBALANCE_INTERVAL_SECONDS', 10))  # 均分任务间隔，0 表示关闭
+
+    # 秒杀下单准入控制（只对开启库存分片的商品生效）
+    ADMISSION_ENABLED = True
+    ADMISSION_RATE = 50            # 每个商品每秒放行的下单请求数
+    ADMISSION_BURST = 100          # 令牌桶容量上限（同时不超过剩余库存）
+    ADMISSION_QUEUE_SIZE = 2000    # 每个商品的等待队列长度上限，超出直接拒绝
+    ADMISSION_POLL_INTERVAL = 1    # 客户端轮询间隔（秒），同时作为 Retry-After
+    ADMISSION_POLL_TIMEOUT = 10    # 超过该秒数未轮询的排队凭证被移出队列
+    ADMISSION_TICKET_TTL = 60      # 排队凭证有效期（秒）
+
+    # 接口限流配置：规则名 -> (次数, 窗口秒数)
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMITS = {
+        'login_ip': (20, 60),          # 同一 IP 每分钟登录尝试
+        'login_username': (5, 300),    # 同一 IP 对同一用户名 5 分钟内登录尝试（防猜密码）
+        'register_ip': (5, 3600),      # 同一 IP 每小时注册
+        'search_ip': (60, 60),         # 同一 IP 每分钟搜索（未命中页面缓存的）
+        'review_write': (10, 60)       # 同一用户每分钟新增/修改/删除评价
+    }
+
+    # 搜索输入联想配置
+    SUGGEST_TOP_K = 10                 # 每次最多返回的联想条数
+    SUGGEST_POPULAR_QUERIES = 1000     # 加入联想的热门搜索词数
+    SUGGEST_MIN_QUERY_COUNT = 3        # 搜索词至少被搜索多少次才加入联想
+    SUGGEST_REBUILD_SECONDS = int(os.getenv('SUGGEST_REBUILD_SECONDS', 600))  # 重建间隔（刷新销量排序），0 表示关闭
+    SUGGEST_VERSION_CHECK_SECONDS = 5  # 每隔多少秒检查一次其他 worker 是否修改了商品/分类
+    SUGGEST_PENDING_QUERIES_MAX = 10000  # 每个进程最多暂存的不同搜索词数，超出时丢弃次数最少的
+
+    # 订单状态实时推送（SSE）配置
+    # 每个 SSE 连接占用一个线程：gunicorn sync worker 下会占满整个进程，gunicorn.conf.py 此时默认关闭
+    EVENTS_ENABLED = os.getenv('EVENTS_ENABLED', '1') == '1'
+    EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', '')  # memory / shared_store / 模块:类名；为空时按 SHARED_STORE_PATH 自动选择
+    EVENTS_POLL_INTERVAL = 0.5         # shared_store 后端拉取新事件的间隔（秒）
+    EVENTS_RETENTION_SECONDS = 60      # shared_store 后端中事件的保留时间
+    EVENTS_HEARTBEAT_SECONDS = 15      # 心跳间隔，防止代理断开空闲连接
+    EVENTS_STREAM_SECONDS = 300        # 单个连接的最长时间，到期后客户端重连
+    EVENTS_RETRY_SECONDS = 3           # 建议客户端重连间隔（SSE retry / 503 Retry-After）
+    EVENTS_QUEUE_SIZE = 100            # 每个连接的待发送事件上限
+    EVENTS_MAX_SUBSCRIBERS = int(os.getenv('EVENTS_MAX_SUBSCRIBERS', 500))  # 每个进程的连接数上限（gthread worker 下由 gunicorn.conf.py 设为线程数的一半）
+
+    # 商品分面筛选配置
+    NUTRIENT_TYPES = {                 # 营养素类型：键存入 products.nutrient_type，值为页面显示名
+        'vitamin': '维生素',
+        'mineral': '矿物质',
+        'protein': '蛋白质',
+        'amino_acid': '氨基酸',
+        'omega3': '鱼油 / Omega-3',
+        'probiotic': '益生菌',
+        'herbal': '植物提取'
+    }
+    FACET_PRICE_BUCKETS = [100, 200, 500]  # 价格区间分界（元）：<100、100-200、200-500、≥500
+    FACET_RATING_BANDS = [4, 3, 2]     # 评分档位：N 星及以上
+    FACET_REBUILD_SECONDS = 5          # 发现其他 worker 修改后至少间隔多少秒才再次全量重建
+    FACET_MAX_IN_IDS = 1000            # 非默认排序时按商品ID IN 列表查询的最大匹配数，超出改用 SQL 条件筛选
+
+    # 后台仪表盘计数配置
+    DASHBOARD_RECONCILE_SECONDS = int(os.getenv('DASHBOARD_RECONCILE_SECONDS', 600))  # 全量校正间隔，0 表示关闭
+    DASHBOARD_PUSH_INTERVAL = 1        # 计数变化后合并推送的间隔（秒）
+
+    # 密码哈希（bcrypt）配置
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))  # 成本因子，每加一耗时翻倍；可用 flask bench-bcrypt 测量后选择
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # 每个进程同时计算哈希的线程数
+    PASSWORD_HASH_QUEUE_SIZE = 32      # 等待计算的请求数上限，超出直接返回 503
+    PASSWORD_HASH_TIMEOUT = 5          # 等待哈希结果的最长时间（秒）
+    PASSWORD_HASH_RETRY_SECONDS = 2    # 503 时的 Retry-After
+
+    # 响应压缩配置
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'  # 前面的 Nginx 已压缩时可关闭
+    COMPRESSION_GZIP_LEVEL = 6         # gzip 压缩级别（1-9）
+    COMPRESSION_BROTLI_QUALITY = 4     # brotli 压缩质量（0-11），需要安装 brotli
+    COMPRESSION_MIMETYPES = {          # 可压缩的类型 -> 最小长度（字节），未列出的类型（图片等）不压缩
+        'text/html': 1024,
+        'text/css': 1024,
+        'text/plain': 1024,
+        'text/javascript': 1024,
+        'application/javascript': 1024,
+        'application/json': 512,
+        'application/xml': 1024,
+        'image/svg+xml': 1024
+    }
+
+    # 个性化推荐（评分协同过滤）配置
+    CF_INTERVAL_SECONDS = int(os.getenv('CF_INTERVAL_SECONDS', 86400))  # 批处理任务间隔，0 表示关闭
+    CF_WORKERS = int(os.getenv('CF_WORKERS', 2))  # 计算进程数，0 表示在当前进程内计算
+    CF_TOP_N = 10             # 每个用户保留的推荐数
+    CF_NEIGHBORS = 50         # 每个商品保留的相似商品数
+    CF_ITEM_CHUNK = 1000      # 计算相似度时每批商品数
+    CF_USER_CHUNK = 2000      # 计算推荐时每批用户数
+    CF_CACHE_SIZE = 10000     # 推荐接口缓存的用户数
+    CF_CACHE_TTL = 600        # 推荐接口缓存秒数
+
+    # 启动预热配置（wsgi.py / gunicorn.conf.py 在接收流量前执行）
+    WARMUP_PATHS = ['/', '/products/', '/products/categories', '/api/health']  # 预热时访问的热点页面
@@ -0,0 +1,85 @@
+# gunicorn.conf.py
+# =============================================
+# gunicorn 预派生部署配置
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# - worker 数默认 CPU 核数 * 2 + 1，可用 GUNICORN_WORKERS 覆盖
+# - GUNICORN_WORKER_CLASS: gthread（默认，配合 GUNICORN_THREADS）/ sync / gevent（需安装 gevent）；
+#   订单状态推送（SSE）每个连接占用一个线程，sync worker 下会占满整个进程，因此 sync 时默认关闭推送（EVENTS_ENABLED=0）
+# - preload_app：主进程加载应用并预编译模板、访问热点页面，fork 后各 worker 共享；
+#   fork 后每个 worker 丢弃继承的连接池，重新建立自己的连接并启动后台任务
+# - 平滑重启：kill -HUP <master> 逐个替换 worker；
+#   preload 模式下 HUP 不会重新加载代码，发布新代码用 USR2 启动新主进程，再向旧主进程发 WINCH、QUIT
+# =============================================
+
+import os
+import glob
+import multiprocessing
+
+# 告诉 wsgi.py 预热与后台任务由下面的钩子负责
+os.environ.setdefault('APP_PREFORK', '1')
+# 多 worker 时指标需要跨进程汇总
+os.environ.setdefault('METRICS_MULTIPROC_DIR', 'instance/metrics')
+# 缓存版本号等需要在 worker 之间共享
+os.environ.setdefault('SHARED_STORE_PATH', 'instance/shared_store.sqlite3')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# gthread 下每个 SSE 连接长期占用一个线程，线程数要留出给普通请求的余量
+threads = int(os.getenv('GUNICORN_THREADS', 16 if worker_class == 'gthread' else 1))
+if worker_class == 'sync':
+    os.environ.setdefault('EVENTS_ENABLED', '0')
+elif worker_class == 'gthread':
+    # SSE 连接最多占一半线程，超出时返回 503，客户端退避重连
+    os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', str(max(threads // 2, 1)))
+worker_connections = 1000  # gevent 每个 worker 的最大并发连接
+
+# gevent 需要在导入应用之前打补丁，因此不预加载
+preload_app = worker_class != 'gevent'
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+max_requests = 2000          # worker 处理一定请求数后重启，避免内存缓慢增长
+max_requests_jitter = 200    # 错开各 worker 的重启时间
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """主进程启动：清理上次运行遗留的指标文件"""
+    directory = os.environ.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.remove(path)
+
+
+def when_ready(server):
+    """preload 模式下在 fork 之前预热模板与热点页面，并关闭主进程中的数据库连接"""
+    if not server.cfg.preload_app:
+        return
+    from wsgi import app
+    from models.database import db
+    from utils import warmup
+
+    warmup.warm_up(app, pool=False)
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    """worker 初始化完成、开始接收请求之前：重建连接池、预热并启动后台任务"""
+    from wsgi import app
+    from models.database import db
+    from utils import background, warmup
+
+    with app.app_context():
+        # close=False：不关闭从主进程继承的连接（它们属于父进程），只丢弃引用
+        db.engine.dispose(close=False)
+
+    if worker.cfg.preload_app:
+        warmup.warm_pool(app)
+    else:
+        warmup.warm_up(app)
+    background.start_jobs(app)
@@ -0,0 +1,8 @@
+"""订单超时清理索引 orders(status, created_at)"""
+from utils.migrations import create_index, drop_index
+
+
+def upgrade(conn):
+    create_index(conn, 'orders', 'idx_orders_status_created', ['status', 'created_at'])
+    # 单列 status 索引已被复合索引的前缀覆盖
+    drop_index(conn, 'orders', 'idx_orders_status')
@@ -0,0 +1,42 @@
+"""支付记录幂等键与 Decimal 余额"""
+from sqlalchemy import inspect, text, Numeric, MetaData, Table, Column, Integer, String, DateTime, ForeignKey
+from utils.migrations import add_column, create_index, has_column
+
+metadata = MetaData()
+
+# 仅用于外键引用，不会创建
+Table('users', metadata, Column('id', Integer, primary_key=True))
+Table('orders', metadata, Column('id', Integer, primary_key=True))
+
+# 早期的库（create_all 时还没有支付模型）没有 payments 表：按本迁移时的结构建出，之后的迁移照常执行
+payments = Table(
+    'payments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('order_id', Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('payment_method', String(50), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('status', String(20)),
+    Column('idempotency_key', String(64), nullable=False),
+    Column('transaction_id', String(100), unique=True),
+    Column('failure_reason', String(200)),
+    Column('paid_at', DateTime),
+    Column('created_at', DateTime)
+)
+
+
+def upgrade(conn):
+    # users.balance：旧库缺列时补上，MySQL 上把 FLOAT 改为 DECIMAL
+    if not has_column(conn, 'users', 'balance'):
+        add_column(conn, 'users', 'balance', "DECIMAL(10,2) DEFAULT 1000.00")
+    elif conn.dialect.name == 'mysql':
+        column = next(c for c in inspect(conn).get_columns('users') if c['name'] == 'balance')
+        if not isinstance(column['type'], Numeric) or column['type'].asdecimal is False:
+            conn.execute(text("ALTER TABLE users MODIFY balance DECIMAL(10,2) DEFAULT 1000.00"))
+
+    # payments：每次支付尝试一条记录，旧数据允许新列为空
+    payments.create(conn, checkfirst=True)
+    add_column(conn, 'payments', 'user_id', 'INTEGER NULL')
+    add_column(conn, 'payments', 'idempotency_key', 'VARCHAR(64) NULL')
+    add_column(conn, 'payments', 'failure_reason', 'VARCHAR(200) NULL')
+    create_index(conn, 'payments', 'idempotency_key', ['idempotency_key'], unique=True)
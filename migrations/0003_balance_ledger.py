@@ -0,0 +1,31 @@
+"""余额流水表 balance_entries 与快照表 balance_snapshots"""
+from sqlalchemy import MetaData, Table, Column, Integer, Numeric, String, DateTime, ForeignKey, Index
+
+metadata = MetaData()
+
+# 仅用于外键引用，不会创建
+Table('users', metadata, Column('id', Integer, primary_key=True))
+
+balance_entries = Table(
+    'balance_entries', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+    Column('amount', Numeric(10, 2), nullable=False),
+    Column('entry_type', String(20), nullable=False),
+    Column('reference', String(64)),
+    Column('created_at', DateTime),
+    Index('idx_balance_entries_user', 'user_id', 'id')
+)
+
+balance_snapshots = Table(
+    'balance_snapshots', metadata,
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('balance', Numeric(10, 2), nullable=False),
+    Column('last_entry_id', Integer, nullable=False, default=0),
+    Column('updated_at', DateTime)
+)
+
+
+def upgrade(conn):
+    balance_entries.create(conn, checkfirst=True)
+    balance_snapshots.create(conn, checkfirst=True)
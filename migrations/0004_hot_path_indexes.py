@@ -0,0 +1,23 @@
+"""热点查询复合索引：订单列表、商品评价、购物车唯一键、上架商品分类"""
+from sqlalchemy import text
+from utils.migrations import create_index, has_index
+
+
+def upgrade(conn):
+    # 订单列表：WHERE user_id = ? ORDER BY created_at DESC
+    create_index(conn, 'orders', 'idx_orders_user_created', ['user_id', 'created_at'])
+
+    # 商品详情评价：WHERE product_id = ? AND is_verified = 1 ORDER BY created_at DESC
+    create_index(conn, 'reviews', 'idx_reviews_product_verified_created',
+                 ['product_id', 'is_verified', 'created_at'])
+
+    # 商品列表：WHERE is_active = 1 [AND category_id = ?]
+    create_index(conn, 'products', 'idx_products_active_category', ['is_active', 'category_id'])
+
+    # 购物车同一用户同一商品只保留一行（加购是覆盖数量，保留最新一行）
+    if not has_index(conn, 'cart_items', 'uq_cart_items_user_product', ['user_id', 'product_id']):
+        conn.execute(text(
+            'DELETE FROM cart_items WHERE id NOT IN ('
+            'SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM cart_items GROUP BY user_id, product_id) AS keep)'
+        ))
+        create_index(conn, 'cart_items', 'uq_cart_items_user_product', ['user_id', 'product_id'], unique=True)
@@ -0,0 +1,36 @@
+"""共同购买推荐：product_pair_counts、product_recommendations 与任务水位表 job_state"""
+from sqlalchemy import MetaData, Table, Column, Integer, Float, String, DateTime, ForeignKey
+
+metadata = MetaData()
+
+# 仅用于外键引用，不会创建
+Table('products', metadata, Column('id', Integer, primary_key=True))
+
+product_pair_counts = Table(
+    'product_pair_counts', metadata,
+    Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+    Column('other_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+    Column('count', Integer, nullable=False, default=0)
+)
+
+product_recommendations = Table(
+    'product_recommendations', metadata,
+    Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+    Column('rank', Integer, primary_key=True, autoincrement=False),
+    Column('recommended_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+    Column('score', Float, nullable=False)
+)
+
+job_state = Table(
+    'job_state', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('last_id', Integer, nullable=False, default=0),
+    Column('counter', Integer, nullable=False, default=0),
+    Column('updated_at', DateTime)
+)
+
+
+def upgrade(conn):
+    product_pair_counts.create(conn, checkfirst=True)
+    product_recommendations.create(conn, checkfirst=True)
+    job_state.create(conn, checkfirst=True)
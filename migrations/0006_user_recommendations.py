@@ -0,0 +1,20 @@
+"""个性化推荐结果：user_recommendations"""
+from sqlalchemy import MetaData, Table, Column, Integer, Float, ForeignKey
+
+metadata = MetaData()
+
+# 仅用于外键引用，不会创建
+Table('users', metadata, Column('id', Integer, primary_key=True))
+Table('products', metadata, Column('id', Integer, primary_key=True))
+
+user_recommendations = Table(
+    'user_recommendations', metadata,
+    Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+    Column('rank', Integer, primary_key=True, autoincrement=False),
+    Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False),
+    Column('score', Float, nullable=False)
+)
+
+
+def upgrade(conn):
+    user_recommendations.create(conn, checkfirst=True)
@@ -0,0 +1,20 @@
+"""秒杀商品库存分片：products.is_sharded 与 product_stock_shards"""
+from sqlalchemy import MetaData, Table, Column, Integer, ForeignKey
+from utils.migrations import add_column
+
+metadata = MetaData()
+
+# 仅用于外键引用，不会创建
+Table('products', metadata, Column('id', Integer, primary_key=True))
+
+product_stock_shards = Table(
+    'product_stock_shards', metadata,
+    Column('product_id', Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True),
+    Column('shard', Integer, primary_key=True, autoincrement=False),
+    Column('quantity', Integer, nullable=False, default=0)
+)
+
+
+def upgrade(conn):
+    add_column(conn, 'products', 'is_sharded', 'BOOLEAN NOT NULL DEFAULT 0')
+    product_stock_shards.create(conn, checkfirst=True)
@@ -0,0 +1,16 @@
+"""搜索词统计：search_queries"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, Index
+
+metadata = MetaData()
+
+search_queries = Table(
+    'search_queries', metadata,
+    Column('query', String(100), primary_key=True),
+    Column('count', Integer, nullable=False, default=0),
+    Column('updated_at', DateTime),
+    Index('idx_search_queries_count', 'count')
+)
+
+
+def upgrade(conn):
+    search_queries.create(conn, checkfirst=True)
@@ -0,0 +1,6 @@
+"""商品分面筛选：products.nutrient_type"""
+from utils.migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'products', 'nutrient_type', 'VARCHAR(50)')
@@ -0,0 +1,29 @@
+"""商品统计列与排序索引：products.sales_count / average_rating / review_count"""
+from sqlalchemy import text
+from utils.migrations import add_column, create_index, has_column
+
+
+def upgrade(conn):
+    backfill = not has_column(conn, 'products', 'sales_count')
+    add_column(conn, 'products', 'sales_count', 'INTEGER NOT NULL DEFAULT 0')
+    # 线上表结构中已有这两列（此前未使用），存在时跳过
+    add_column(conn, 'products', 'average_rating', 'DECIMAL(3,2) DEFAULT 0')
+    add_column(conn, 'products', 'review_count', 'INTEGER DEFAULT 0')
+
+    if backfill:
+        conn.execute(text(
+            "UPDATE products SET sales_count = COALESCE(("
+            "SELECT SUM(oi.quantity) FROM order_items oi JOIN orders o ON o.id = oi.order_id "
+            "WHERE oi.product_id = products.id AND o.status IN ('paid', 'confirmed', 'shipped', 'delivered')), 0)"
+        ))
+        conn.execute(text(
+            "UPDATE products SET "
+            "review_count = (SELECT COUNT(*) FROM reviews r WHERE r.product_id = products.id), "
+            "average_rating = COALESCE((SELECT AVG(r.rating) FROM reviews r WHERE r.product_id = products.id), 0)"
+        ))
+
+    # 列表排序：WHERE is_active = 1 ORDER BY <列>, id
+    create_index(conn, 'products', 'idx_products_active_price', ['is_active', 'price'])
+    create_index(conn, 'products', 'idx_products_active_sales', ['is_active', 'sales_count'])
+    create_index(conn, 'products', 'idx_products_active_rating', ['is_active', 'average_rating'])
+    create_index(conn, 'products', 'idx_products_active_created', ['is_active', 'created_at'])
@@ -0,0 +1,7 @@
+"""后台仪表盘：orders.created_at 单列索引（最近订单）"""
+from utils.migrations import create_index
+
+
+def upgrade(conn):
+    # 最近订单：ORDER BY created_at DESC LIMIT 10，不再全表扫描后排序
+    create_index(conn, 'orders', 'idx_orders_created', ['created_at'])
@@ -0,0 +1,6 @@
+"""JWT 吊销：users.token_version"""
+from utils.migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, 'users', 'token_version', 'INTEGER NOT NULL DEFAULT 0')
@@ -0,0 +1,8 @@
+"""支付幂等键改为按用户唯一：(user_id, idempotency_key)"""
+from utils.migrations import create_index, drop_index
+
+
+def upgrade(conn):
+    # 原来全局唯一：其他用户恰好使用同一个键时会拿到别人的支付记录
+    create_index(conn, 'payments', 'uq_payments_user_idempotency', ['user_id', 'idempotency_key'], unique=True)
+    drop_index(conn, 'payments', 'idempotency_key')
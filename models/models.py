@@ -18,25 +18,40 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False) # 登录用户名
     email = db.Column(db.String(100), unique=True, nullable=False)   # 邮箱
     password_hash = db.Column(db.String(255), nullable=False)        # 密码哈希
-    balance = db.Column(db.Float, default=1000)                      # 用户余额
+    balance = db.Column(db.Numeric(10,2), default=1000)              # 用户余额（由余额流水对账任务回写，实时余额见 utils/balance.py）
     full_name = db.Column(db.String(100))                             # 用户全名
     phone = db.Column(db.String(20))                                  # 电话
     address = db.Column(db.Text)                                      # 收货地址
     is_admin = db.Column(db.Boolean, default=False)                  # 是否为管理员
     created_at = db.Column(db.DateTime, default=datetime.now)        # 创建时间
+    token_version = db.Column(db.Integer, nullable=False, default=0)  # 令牌版本，低于此版本的 JWT 视为已吊销（见 utils/tokens.py）
 
     # 关系映射
     orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')  # 用户订单
     cart_items = db.relationship('CartItem', backref='user', lazy=True, cascade='all, delete-orphan')  # 购物车商品
     # reviews 通过 Review.user 的 backref 自动生成
 
-    # 设置密码（明文存储，不推荐生产使用）
+    # 设置密码（bcrypt 哈希，在 utils/passwords 的有界线程池中计算）
     def set_password(self, password):
-        self.password_hash = password
+        from utils.passwords import hash_password  # 延迟导入，避免循环依赖
+        self.password_hash = hash_password(password)
+        if self.id is not None:
+            self.revoke_tokens()  # 修改密码后之前签发的令牌全部失效
 
-    # 验证密码
+    # 验证密码；旧的明文密码或成本因子已调整的哈希在验证通过后重新哈希（由调用方提交）
     def check_password(self, password):
-        return self.password_hash == password
+        from utils.passwords import hash_password, verify_password, HashingBusy
+        matched, needs_rehash = verify_password(self.password_hash, password)
+        if needs_rehash:
+            try:
+                self.password_hash = hash_password(password)
+            except HashingBusy:
+                pass  # 繁忙时本次只完成登录，下次登录再重新哈希
+        return matched
+
+    # 吊销该用户已签发的全部 JWT（令牌版本加一，提交后生效）
+    def revoke_tokens(self):
+        self.token_version = (self.token_version or 0) + 1
 
     # 转换为字典（用于 JSON 返回）
     def to_dict(self):
@@ -75,6 +90,13 @@ class Category(db.Model):
 # =============================================
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('idx_products_active_category', 'is_active', 'category_id'),  # 商品列表/分类筛选
+        db.Index('idx_products_active_price', 'is_active', 'price'),            # 列表排序：价格
+        db.Index('idx_products_active_sales', 'is_active', 'sales_count'),      # 列表排序：销量
+        db.Index('idx_products_active_rating', 'is_active', 'average_rating'),  # 列表排序：评分
+        db.Index('idx_products_active_created', 'is_active', 'created_at'),    # 列表排序：上架时间
+    )
 
     id = db.Column(db.Integer, primary_key=True)             # 商品ID
     name = db.Column(db.String(200), nullable=False)        # 商品名称
@@ -83,13 +105,27 @@ class Product(db.Model):
     price = db.Column(db.Numeric(10,2), nullable=False)     # 单价
     stock_quantity = db.Column(db.Integer, nullable=False)  # 库存数量
     image_url = db.Column(db.String(500))                   # 商品图片URL
+    nutrient_type = db.Column(db.String(50))                # 营养素类型（NUTRIENT_TYPES 中的键，用于分面筛选）
     is_active = db.Column(db.Boolean, default=True)         # 是否上架
+    is_sharded = db.Column(db.Boolean, nullable=False, default=False)  # 库存是否拆分到分片计数行（秒杀热卖商品）
     created_at = db.Column(db.DateTime, default=datetime.now)  # 创建时间
+    # 以下统计列由 utils/product_stats 在订单/评价写入时同事务维护
+    sales_count = db.Column(db.Integer, nullable=False, default=0)     # 销量（已支付及之后状态的订单件数）
+    average_rating = db.Column(db.Numeric(3, 2), default=0)          # 平均评分
+    review_count = db.Column(db.Integer, default=0)                   # 评价数
 
     order_items = db.relationship('OrderItem', backref='product', lazy=True, cascade='all, delete-orphan')  # 订单项
     cart_items = db.relationship('CartItem', backref='product', lazy=True, cascade='all, delete-orphan')   # 购物车项
     # reviews 通过 Review.product 的 backref 自动生成
 
+    @property
+    def available_stock(self):
+        """可售库存：分片商品为各分片之和（短时缓存），其余即 stock_quantity"""
+        if not self.is_sharded:
+            return self.stock_quantity
+        from utils.inventory import stock_total  # 延迟导入，避免循环依赖
+        return stock_total(self.id)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -98,16 +134,37 @@ class Product(db.Model):
             'category_id': self.category_id,
             'category_name': self.category.name if self.category else None,
             'price': float(self.price),
-            'stock_quantity': self.stock_quantity,
+            'stock_quantity': self.available_stock,
             'image_url': self.image_url,
+            'nutrient_type': self.nutrient_type,
+            'sales_count': self.sales_count,
+            'average_rating': float(self.average_rating or 0),
+            'review_count': self.review_count,
             'is_active': self.is_active
         }
 
+# =============================================
+# 商品库存分片（is_sharded 商品的库存分散在多行，下单时随机扣减其中一行）
+# =============================================
+class ProductStockShard(db.Model):
+    __tablename__ = 'product_stock_shards'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)  # 商品ID
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 分片编号，从 0 开始
+    quantity = db.Column(db.Integer, nullable=False, default=0)           # 该分片的库存
+
+    product = db.relationship('Product', backref=db.backref('stock_shards', lazy=True, cascade='all, delete-orphan'))
+
 # =============================================
 # 订单模型
 # =============================================
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('idx_orders_status_created', 'status', 'created_at'),  # 超时订单清理
+        db.Index('idx_orders_user_created', 'user_id', 'created_at'),    # 用户订单列表
+        db.Index('idx_orders_created', 'created_at'),                    # 后台最近订单
+    )
 
     id = db.Column(db.Integer, primary_key=True)               # 订单ID
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # 用户ID
@@ -165,6 +222,9 @@ class OrderItem(db.Model):
 # =============================================
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_items_user_product'),  # 同一商品只占一行
+    )
 
     id = db.Column(db.Integer, primary_key=True)                     # 购物车项ID
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # 用户ID
@@ -184,11 +244,86 @@ class CartItem(db.Model):
             'subtotal': float(self.product.price * self.quantity)
         }
 
+# =============================================
+# 支付记录模型（每次支付尝试一条）
+# =============================================
+class Payment(db.Model):
+    __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('uq_payments_user_idempotency', 'user_id', 'idempotency_key', unique=True),  # 幂等键按用户唯一
+    )
+
+    id = db.Column(db.Integer, primary_key=True)                     # 支付记录ID
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)  # 订单ID
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)    # 付款用户ID
+    payment_method = db.Column(db.String(50), nullable=False)        # 支付方式
+    amount = db.Column(db.Numeric(10,2), nullable=False)             # 支付金额
+    status = db.Column(db.String(20), default='pending')             # 支付状态: pending/success/failed
+    idempotency_key = db.Column(db.String(64), nullable=False)       # 幂等键，同一用户重复提交返回同一记录
+    transaction_id = db.Column(db.String(100), unique=True)          # 交易流水号（成功时生成）
+    failure_reason = db.Column(db.String(200))                       # 失败原因
+    paid_at = db.Column(db.DateTime)                                 # 支付时间
+    created_at = db.Column(db.DateTime, default=datetime.now)        # 创建时间
+
+    order = db.relationship('Order', backref=db.backref('payments', lazy=True, cascade='all, delete-orphan'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'payment_method': self.payment_method,
+            'amount': float(self.amount),
+            'status': self.status,
+            'transaction_id': self.transaction_id,
+            'failure_reason': self.failure_reason,
+            'paid_at': self.paid_at.isoformat() if self.paid_at else None
+        }
+
+# =============================================
+# 余额流水模型（只追加，不修改）
+# =============================================
+class BalanceEntry(db.Model):
+    __tablename__ = 'balance_entries'
+    __table_args__ = (
+        db.Index('idx_balance_entries_user', 'user_id', 'id'),  # 按用户读取快照之后的流水
+    )
+
+    id = db.Column(db.Integer, primary_key=True)                     # 流水ID（单调递增）
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # 用户ID
+    amount = db.Column(db.Numeric(10,2), nullable=False)             # 变动金额（收入为正，支出为负）
+    entry_type = db.Column(db.String(20), nullable=False)            # 类型: topup/payment/refund/adjust
+    reference = db.Column(db.String(64))                             # 关联业务，如 payment:1、order:2
+    created_at = db.Column(db.DateTime, default=datetime.now)        # 创建时间
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'amount': float(self.amount),
+            'entry_type': self.entry_type,
+            'reference': self.reference,
+            'created_at': self.created_at.isoformat()
+        }
+
+# =============================================
+# 余额快照模型（每个用户一行）
+# 当前余额 = 快照余额 + last_entry_id 之后的流水之和
+# =============================================
+class BalanceSnapshot(db.Model):
+    __tablename__ = 'balance_snapshots'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)  # 用户ID
+    balance = db.Column(db.Numeric(10,2), nullable=False)            # 快照时余额
+    last_entry_id = db.Column(db.Integer, nullable=False, default=0) # 已并入快照的最后一条流水ID
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 快照时间
+
 # =============================================
 # 商品评价模型
 # =============================================
 class Review(db.Model):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        db.Index('idx_reviews_product_verified_created', 'product_id', 'is_verified', 'created_at'),  # 商品详情评价
+    )
 
     id = db.Column(db.Integer, primary_key=True)                     # 评价ID
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # 用户ID
@@ -242,3 +377,62 @@ class Article(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.now())    # 创建时间
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())  # 更新时间
 
+
+# =============================================
+# 商品共同购买计数（稀疏矩阵，按订单累计）
+# product_id == other_id 的行为包含该商品的订单数
+# =============================================
+class ProductPairCount(db.Model):
+    __tablename__ = 'product_pair_counts'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)  # 商品ID
+    other_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)    # 共同出现的商品ID
+    count = db.Column(db.Integer, nullable=False, default=0)  # 同时出现的订单数
+
+# =============================================
+# 商品推荐结果（每个商品前 K 个，按 rank 排序）
+# =============================================
+class ProductRecommendation(db.Model):
+    __tablename__ = 'product_recommendations'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)  # 商品ID
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 名次，从 1 开始
+    recommended_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)  # 推荐商品ID
+    score = db.Column(db.Float, nullable=False)  # 得分（lift 或 Jaccard）
+
+    recommended = db.relationship('Product', foreign_keys=[recommended_id])
+
+# =============================================
+# 个性化推荐结果（基于评分的物品协同过滤）
+# =============================================
+class UserRecommendation(db.Model):
+    __tablename__ = 'user_recommendations'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)  # 用户ID
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 名次，从 1 开始
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)  # 推荐商品ID
+    score = db.Column(db.Float, nullable=False)  # 预测得分
+
+# =============================================
+# 搜索词统计（输入联想中的热门搜索词）
+# =============================================
+class SearchQuery(db.Model):
+    __tablename__ = 'search_queries'
+    __table_args__ = (
+        db.Index('idx_search_queries_count', 'count'),  # 按次数取热门搜索词
+    )
+
+    text = db.Column('query', db.String(100), primary_key=True)  # 搜索词（小写、合并空白）；属性名不用 query，避免遮住 Model.query
+    count = db.Column(db.Integer, nullable=False, default=0)     # 被搜索次数
+    updated_at = db.Column(db.DateTime, default=datetime.now)    # 最近一次写入时间
+
+# =============================================
+# 批处理任务状态（增量任务的水位线）
+# =============================================
+class JobState(db.Model):
+    __tablename__ = 'job_state'
+
+    name = db.Column(db.String(64), primary_key=True)          # 任务名
+    last_id = db.Column(db.Integer, nullable=False, default=0)  # 已处理到的最大ID
+    counter = db.Column(db.Integer, nullable=False, default=0)  # 任务自定义累计值（如已处理订单数）
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 更新时间
@@ -26,7 +26,7 @@ CREATE TABLE `cart_items` (
   `quantity` int NOT NULL,           -- 商品数量
   `added_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,  -- 添加时间，默认当前时间
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`),
+  UNIQUE KEY `uq_cart_items_user_product` (`user_id`,`product_id`),  -- 同一用户同一商品只占一行
   KEY `product_id` (`product_id`),
   CONSTRAINT `cart_items_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
   CONSTRAINT `cart_items_ibfk_2` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`)
@@ -99,8 +99,9 @@ CREATE TABLE `orders` (
   `payment_method` varchar(50) DEFAULT NULL,  -- 支付方式
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,  -- 创建时间
   PRIMARY KEY (`id`),
-  KEY `idx_orders_user` (`user_id`),
-  KEY `idx_orders_status` (`status`),
+  KEY `idx_orders_user_created` (`user_id`,`created_at`),  -- 用户订单列表
+  KEY `idx_orders_status_created` (`status`,`created_at`),  -- 超时订单清理
+  KEY `idx_orders_created` (`created_at`),  -- 后台最近订单
   CONSTRAINT `orders_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
@@ -118,16 +119,22 @@ DROP TABLE IF EXISTS `payments`;
 CREATE TABLE `payments` (
   `id` int NOT NULL AUTO_INCREMENT,
   `order_id` int NOT NULL,  -- 关联订单ID
+  `user_id` int NOT NULL,   -- 付款用户ID
   `payment_method` varchar(50) NOT NULL,  -- 支付方式
   `amount` decimal(10,2) NOT NULL,        -- 支付金额
   `status` enum('pending','success','failed','cancelled') DEFAULT 'pending', -- 支付状态
+  `idempotency_key` varchar(64) NOT NULL,     -- 幂等键，重复提交返回同一记录
   `transaction_id` varchar(100) DEFAULT NULL,  -- 支付平台交易ID
+  `failure_reason` varchar(200) DEFAULT NULL, -- 失败原因
   `paid_at` timestamp NULL DEFAULT NULL,      -- 支付时间
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP, -- 创建时间
   PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_payments_user_idempotency` (`user_id`,`idempotency_key`),  -- 幂等键按用户唯一
   UNIQUE KEY `transaction_id` (`transaction_id`),  -- 交易ID唯一
   KEY `order_id` (`order_id`),
-  CONSTRAINT `payments_ibfk_1` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`)
+  KEY `user_id` (`user_id`),
+  CONSTRAINT `payments_ibfk_1` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`),
+  CONSTRAINT `payments_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- 数据导入：payments（目前为空）
@@ -136,6 +143,121 @@ LOCK TABLES `payments` WRITE;
 /*!40000 ALTER TABLE `payments` ENABLE KEYS */;
 UNLOCK TABLES;
 
+-- =============================================
+-- 表结构：balance_entries（余额流水表）
+-- 只追加不修改，充值/支付/退款各记一条
+-- =============================================
+DROP TABLE IF EXISTS `balance_entries`;
+CREATE TABLE `balance_entries` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `user_id` int NOT NULL,                 -- 用户ID
+  `amount` decimal(10,2) NOT NULL,        -- 变动金额（收入为正，支出为负）
+  `entry_type` varchar(20) NOT NULL,      -- 类型：topup/payment/refund/adjust
+  `reference` varchar(64) DEFAULT NULL,   -- 关联业务，如 payment:1
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `idx_balance_entries_user` (`user_id`,`id`),  -- 按用户读取快照之后的流水
+  CONSTRAINT `balance_entries_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：balance_snapshots（余额快照表）
+-- 当前余额 = balance + last_entry_id 之后的流水之和
+-- =============================================
+DROP TABLE IF EXISTS `balance_snapshots`;
+CREATE TABLE `balance_snapshots` (
+  `user_id` int NOT NULL,                 -- 用户ID
+  `balance` decimal(10,2) NOT NULL,       -- 快照余额
+  `last_entry_id` int NOT NULL DEFAULT '0', -- 已并入快照的最后一条流水ID
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`user_id`),
+  CONSTRAINT `balance_snapshots_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：product_pair_counts（商品共同购买计数）
+-- product_id = other_id 的行为包含该商品的订单数
+-- =============================================
+DROP TABLE IF EXISTS `product_pair_counts`;
+CREATE TABLE `product_pair_counts` (
+  `product_id` int NOT NULL,              -- 商品ID
+  `other_id` int NOT NULL,                -- 共同出现的商品ID
+  `count` int NOT NULL DEFAULT '0',       -- 同时出现的订单数
+  PRIMARY KEY (`product_id`,`other_id`),
+  KEY `other_id` (`other_id`),
+  CONSTRAINT `product_pair_counts_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `product_pair_counts_ibfk_2` FOREIGN KEY (`other_id`) REFERENCES `products` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：product_recommendations（“经常一起购买”推荐结果）
+-- 每个商品保留前 K 个，按 rank 读取
+-- =============================================
+DROP TABLE IF EXISTS `product_recommendations`;
+CREATE TABLE `product_recommendations` (
+  `product_id` int NOT NULL,              -- 商品ID
+  `rank` int NOT NULL,                    -- 名次，从 1 开始
+  `recommended_id` int NOT NULL,          -- 推荐商品ID
+  `score` float NOT NULL,                 -- 得分（lift 或 Jaccard）
+  PRIMARY KEY (`product_id`,`rank`),
+  KEY `recommended_id` (`recommended_id`),
+  CONSTRAINT `product_recommendations_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `product_recommendations_ibfk_2` FOREIGN KEY (`recommended_id`) REFERENCES `products` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：job_state（批处理任务水位线）
+-- =============================================
+DROP TABLE IF EXISTS `job_state`;
+CREATE TABLE `job_state` (
+  `name` varchar(64) NOT NULL,            -- 任务名
+  `last_id` int NOT NULL DEFAULT '0',     -- 已处理到的最大ID
+  `counter` int NOT NULL DEFAULT '0',     -- 任务自定义累计值
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：user_recommendations（个性化推荐结果）
+-- 由评分协同过滤批处理任务生成，每个用户保留前 N 个，按 rank 读取
+-- =============================================
+DROP TABLE IF EXISTS `user_recommendations`;
+CREATE TABLE `user_recommendations` (
+  `user_id` int NOT NULL,                 -- 用户ID
+  `rank` int NOT NULL,                    -- 名次，从 1 开始
+  `product_id` int NOT NULL,              -- 推荐商品ID
+  `score` float NOT NULL,                 -- 预测得分
+  PRIMARY KEY (`user_id`,`rank`),
+  KEY `product_id` (`product_id`),
+  CONSTRAINT `user_recommendations_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `user_recommendations_ibfk_2` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：product_stock_shards（秒杀商品库存分片）
+-- products.is_sharded = 1 的商品下单时随机扣减其中一行，后台任务定期均分
+-- =============================================
+DROP TABLE IF EXISTS `product_stock_shards`;
+CREATE TABLE `product_stock_shards` (
+  `product_id` int NOT NULL,              -- 商品ID
+  `shard` int NOT NULL,                   -- 分片编号，从 0 开始
+  `quantity` int NOT NULL DEFAULT '0',    -- 该分片的库存
+  PRIMARY KEY (`product_id`,`shard`),
+  CONSTRAINT `product_stock_shards_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- =============================================
+-- 表结构：search_queries（搜索词统计，用于输入联想）
+-- =============================================
+DROP TABLE IF EXISTS `search_queries`;
+CREATE TABLE `search_queries` (
+  `query` varchar(100) NOT NULL,          -- 搜索词（小写、合并空白）
+  `count` int NOT NULL DEFAULT '0',       -- 被搜索次数
+  `updated_at` datetime DEFAULT NULL,     -- 最近一次写入时间
+  PRIMARY KEY (`query`),
+  KEY `idx_search_queries_count` (`count`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 -- =============================================
 -- 表结构：products（商品表）
 -- 存储系统中所有商品信息
@@ -149,23 +271,30 @@ CREATE TABLE `products` (
   `price` decimal(10,2) NOT NULL,      -- 价格
   `stock_quantity` int NOT NULL,        -- 库存数量
   `image_url` varchar(500) DEFAULT NULL, -- 图片URL
+  `nutrient_type` varchar(50) DEFAULT NULL, -- 营养素类型（分面筛选）
   `is_active` tinyint(1) DEFAULT '1',  -- 是否上架
+  `is_sharded` tinyint(1) NOT NULL DEFAULT '0', -- 库存是否拆分到 product_stock_shards
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `average_rating` decimal(3,2) DEFAULT '0.00', -- 平均评分
   `review_count` int DEFAULT '0',       -- 评论数量
+  `sales_count` int NOT NULL DEFAULT '0', -- 销量（已支付及之后状态的订单件数）
   PRIMARY KEY (`id`),
   KEY `idx_products_category` (`category_id`),
-  KEY `idx_products_active` (`is_active`),
+  KEY `idx_products_active_category` (`is_active`,`category_id`),  -- 商品列表/分类筛选
+  KEY `idx_products_active_price` (`is_active`,`price`),           -- 列表排序：价格
+  KEY `idx_products_active_sales` (`is_active`,`sales_count`),     -- 列表排序：销量
+  KEY `idx_products_active_rating` (`is_active`,`average_rating`), -- 列表排序：评分
+  KEY `idx_products_active_created` (`is_active`,`created_at`),    -- 列表排序：上架时间
   CONSTRAINT `products_ibfk_1` FOREIGN KEY (`category_id`) REFERENCES `categories` (`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- 示例数据：products
 LOCK TABLES `products` WRITE;
 INSERT INTO `products` VALUES
-(1,'维生素C 1000mg','高效维生素C补充，增强免疫力',1,89.90,100,NULL,1,'2025-11-23 13:51:37',0.00,0),
-(2,'钙镁锌片','复合矿物质补充，强健骨骼',2,129.00,80,NULL,1,'2025-11-23 13:51:37',0.00,0),
-(3,'乳清蛋白粉','优质乳清蛋白，健身必备',3,299.00,50,NULL,1,'2025-11-23 13:51:37',0.00,0),
-(4,'BCAA氨基酸','支链氨基酸，运动恢复',4,199.00,60,NULL,1,'2025-11-23 13:51:37',0.00,0);
+(1,'维生素C 1000mg','高效维生素C补充，增强免疫力',1,89.90,100,NULL,'vitamin',1,0,'2025-11-23 13:51:37',0.00,0,0),
+(2,'钙镁锌片','复合矿物质补充，强健骨骼',2,129.00,80,NULL,'mineral',1,0,'2025-11-23 13:51:37',0.00,0,0),
+(3,'乳清蛋白粉','优质乳清蛋白，健身必备',3,299.00,50,NULL,'protein',1,0,'2025-11-23 13:51:37',0.00,0,0),
+(4,'BCAA氨基酸','支链氨基酸，运动恢复',4,199.00,60,NULL,'amino_acid',1,0,'2025-11-23 13:51:37',0.00,0,0);
 UNLOCK TABLES;
 
 -- =============================================
@@ -187,7 +316,7 @@ CREATE TABLE `reviews` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `unique_user_product_order` (`user_id`,`product_id`,`order_id`),  -- 同一用户同一订单同一商品唯一
   KEY `order_id` (`order_id`),
-  KEY `idx_reviews_product` (`product_id`),
+  KEY `idx_reviews_product_verified_created` (`product_id`,`is_verified`,`created_at`),  -- 商品详情评价
   KEY `idx_reviews_user` (`user_id`),
   CONSTRAINT `reviews_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
   CONSTRAINT `reviews_ibfk_2` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`),
@@ -261,11 +390,13 @@ CREATE TABLE `users` (
   `username` varchar(50) NOT NULL,       -- 用户名，唯一
   `email` varchar(100) NOT NULL,         -- 邮箱，唯一
   `password_hash` varchar(255) NOT NULL, -- 密码哈希
+  `balance` decimal(10,2) DEFAULT '1000.00', -- 账户余额
   `full_name` varchar(100) DEFAULT NULL, -- 真实姓名
   `phone` varchar(20) DEFAULT NULL,      -- 电话
   `address` text,                        -- 默认地址
   `is_admin` tinyint NOT NULL DEFAULT '0' COMMENT '是否为管理员：0-否，1-是',
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  `token_version` int NOT NULL DEFAULT '0',  -- 令牌版本，修改密码/权限时加一，使之前签发的 JWT 失效
   PRIMARY KEY (`id`),
   UNIQUE KEY `username` (`username`),
   UNIQUE KEY `email` (`email`)
@@ -274,8 +405,8 @@ CREATE TABLE `users` (
 -- 示例数据：users
 LOCK TABLES `users` WRITE;
 INSERT INTO `users` VALUES
-(1,'user1','user@qq.com','Aa123456','用户',NULL,NULL,0,'2025-12-07 01:22:29'),
-(4,'admin','admin@example.com','Aa123456','管理员',NULL,NULL,1,'2025-12-07 01:15:00');
+(1,'user1','user@qq.com','Aa123456',1000.00,'用户',NULL,NULL,0,'2025-12-07 01:22:29',0),
+(4,'admin','admin@example.com','Aa123456',1000.00,'管理员',NULL,NULL,1,'2025-12-07 01:15:00',0);
 UNLOCK TABLES;
 
 /*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
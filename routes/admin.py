@@ -1,13 +1,9 @@
 import os
 import uuid
-from decimal import Decimal
-from io import BytesIO
-import base64
-import matplotlib.pyplot as plt
 from werkzeug.utils import secure_filename
 from sqlalchemy import func
-from matplotlib import rcParams
-from flask import request, redirect, url_for, flash, jsonify, Blueprint, render_template
+from sqlalchemy.orm import joinedload
+from flask import request, redirect, url_for, flash, jsonify, Blueprint, render_template, abort, Response, current_app
 from flask_login import current_user, login_required
 
 """
@@ -23,6 +19,7 @@ from models.models import (
     OrderItem,
     Review
 )
+from utils import balance, charts, profiler, inventory, live_events, dashboard_counters
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -73,18 +70,15 @@ def check_admin():
 @admin_bp.route('/')
 @login_required
 def dashboard():
-    """后台首页统计数据"""
-    total_users = User.query.count()
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
+    """后台首页统计数据（计数读取 utils/dashboard_counters 维护的值，页面打开后经 SSE 实时更新）"""
+    counters = dashboard_counters.get_counters()
 
-    # 最近 10 条订单
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+    # 最近 10 条订单（idx_orders_created）
+    recent_orders = Order.query.options(joinedload(Order.user)) \
+        .order_by(Order.created_at.desc()).limit(10).all()
 
     return render_template('admin/dashboard.html',
-                           total_users=total_users,
-                           total_products=total_products,
-                           total_orders=total_orders,
+                           counters=counters,
                            recent_orders=recent_orders)
 
 
@@ -144,7 +138,10 @@ def update_user(user_id):
     user.full_name = data.get('full_name', user.full_name)
     user.phone = data.get('phone', user.phone)
     user.address = data.get('address', user.address)
-    user.is_admin = data.get('is_admin') == '1'
+    is_admin = data.get('is_admin') == '1'
+    if user.is_admin != is_admin:
+        user.is_admin = is_admin
+        user.revoke_tokens()  # 令牌中带有管理员标记，权限变化后需重新登录
 
     db.session.commit()
     flash('用户信息更新成功', 'success')
@@ -195,6 +192,7 @@ def create_product():
         name=data.get('name'),
         description=data.get('description'),
         category_id=int(data.get('category_id')),
+        nutrient_type=data.get('nutrient_type') or None,
         price=float(data.get('price', 0)),
         stock_quantity=int(data.get('stock_quantity', 0)),
         image_url=image_path,
@@ -216,8 +214,18 @@ def update_product(product_id):
     product.name = data.get('name', product.name)
     product.description = data.get('description', product.description)
     product.category_id = int(data.get('category_id', product.category_id))
+    if 'nutrient_type' in data:
+        product.nutrient_type = data.get('nutrient_type') or None
     product.price = float(data.get('price', product.price))
-    product.stock_quantity = int(data.get('stock_quantity', product.stock_quantity))
+    # 分片商品的 stock_quantity 只是启用分片时的值，当前库存以各分片之和为准
+    current_stock = product.available_stock
+    stock_quantity = int(data.get('stock_quantity', current_stock))
+    if product.is_sharded:
+        # 分片商品的表单值为总库存，重新均分到各分片
+        if stock_quantity != current_stock:
+            inventory.set_sharded_stock(product, stock_quantity)
+    else:
+        product.stock_quantity = stock_quantity
     product.is_active = data.get('is_active') == '1'
 
     # 新图覆盖旧图
@@ -276,12 +284,17 @@ def update_order_status(order_id):
         return redirect(url_for('admin.manage_orders'))
 
     try:
+        previous = order.status
         # 若进入 refunded 状态，则执行退款
-        if new_status == 'refunded' and order.status != 'refunded':
-            order.user.balance = Decimal(order.user.balance) + Decimal(order.total_amount)
-
-        order.status = new_status
+        if new_status == 'refunded':
+            if not _mark_refunded(order):
+                db.session.rollback()
+                flash('订单状态已变化，请刷新后重试', 'error')
+                return redirect(url_for('admin.manage_orders'))
+        else:
+            order.status = new_status
         db.session.commit()
+        live_events.order_status_changed(order, previous)
         flash(f'订单状态已更新为 {new_status}', 'success')
     except Exception as e:
         db.session.rollback()
@@ -290,6 +303,30 @@ def update_order_status(order_id):
     return redirect(url_for('admin.manage_orders'))
 
 
+def _mark_refunded(order):
+    """
+    refund_requested → refunded：带状态条件的 UPDATE，只有本次请求改成功时才追加退款流水，
+    重复提交或两个管理员同时审核不会重复退款；返回是否由本次请求完成
+    """
+    updated = Order.query.filter(Order.id == order.id, Order.status == 'refund_requested') \
+        .update({Order.status: 'refunded'}, synchronize_session=False)
+    if updated != 1:
+        return False
+    balance.credit(order.user_id, order.total_amount, 'refund', reference=f'order:{order.id}')
+    # 批量 UPDATE 不经过 flush，待处理退款数需单独登记
+    dashboard_counters.status_changed(order, 'refund_requested', 'refunded')
+    return True
+
+
+@admin_bp.route('/orders/events')
+@login_required
+def order_events():
+    """订单状态实时推送（SSE，全部订单）"""
+    if not current_user.is_admin:
+        abort(403)
+    return live_events.stream([live_events.ADMIN_CHANNEL])
+
+
 @admin_bp.route('/orders/<int:order_id>')
 @login_required
 def order_detail(order_id):
@@ -312,12 +349,14 @@ def approve_refund(order_id):
         flash('该订单没有退款申请', 'error')
         return redirect(url_for('admin.manage_orders'))
 
-    # 执行退款
-    order.user.balance = Decimal(order.user.balance) + Decimal(order.total_amount)
-    order.status = 'refunded'
-
     try:
+        # 执行退款（追加退款流水）
+        if not _mark_refunded(order):
+            db.session.rollback()
+            flash('该订单已处理过退款', 'error')
+            return redirect(url_for('admin.manage_orders'))
         db.session.commit()
+        live_events.order_status_changed(order, 'refund_requested')
         flash(f'订单 {order.id} 退款成功，用户余额已更新', 'success')
     except Exception as e:
         db.session.rollback()
@@ -500,20 +539,8 @@ def article_delete(article_id):
     return redirect(url_for('admin.article_list'))
 
 
-@admin_bp.route('/dashboard/stats')
-@login_required
-def dashboard_stats():
-    """
-    后台统计面板
-    - 每日订单数量与销售额（柱状 + 折线）
-    - 按品类销售额分布（饼图）
-    图像使用内存缓冲，并转为 Base64 供 HTML 显示
-    """
-
-    # 解决中文字体和负号显示问题
-    rcParams['font.sans-serif'] = ['SimHei']
-    rcParams['axes.unicode_minus'] = False
-
+def _dashboard_series():
+    """统计面板使用的数据序列（可直接序列化为 JSON）"""
     # ===================== 每日订单销量与金额 =====================
     # 联结 Order 与 OrderItem，按日期统计销量与销售额
     daily_sales = db.session.query(
@@ -525,37 +552,7 @@ def dashboard_stats():
      .order_by(func.date(Order.created_at)) \
      .all()
 
-    # 转换为可绘图格式
-    days = [row.day.strftime('%Y-%m-%d') for row in daily_sales] if daily_sales else []
-    quantities = [row.total_quantity for row in daily_sales] if daily_sales else []
-    sales = [float(row.total_sales) for row in daily_sales] if daily_sales else []
-
-    # 绘制柱状图 + 折线图（双轴）
-    fig1, ax1 = plt.subplots(figsize=(12, 6))
-    ax1.bar(days, quantities, color='skyblue', label='订单数量')
-    ax1.set_xlabel('日期')
-    ax1.set_ylabel('订单数量', color='blue')
-    ax1.tick_params(axis='y', labelcolor='blue')
-    ax1.set_xticks(range(len(days)))
-    ax1.set_xticklabels(days, rotation=45, ha='right')
-
-    ax2 = ax1.twinx()
-    ax2.plot(days, sales, color='orange', marker='o', label='销售额')
-    ax2.set_ylabel('销售额（元）', color='orange')
-    ax2.tick_params(axis='y', labelcolor='orange')
-
-    # 防止图像元素被遮挡
-    fig1.tight_layout()
-    plt.title('每日订单数量与销售额统计')
-
-    # 转为 Base64 方便前端展示
-    buf1 = BytesIO()
-    plt.savefig(buf1, format='png', bbox_inches='tight')
-    plt.close(fig1)
-    buf1.seek(0)
-    daily_plot = base64.b64encode(buf1.getvalue()).decode()
-
-    # ===================== 按品类销售额饼图 =====================
+    # ===================== 按品类销售额 =====================
     category_sales = db.session.query(
         Category.name,
         func.sum(OrderItem.quantity * OrderItem.unit_price).label('total_sales')
@@ -563,23 +560,96 @@ def dashboard_stats():
      .join(OrderItem, OrderItem.product_id == Product.id) \
      .group_by(Category.id).all()
 
-    labels = [row.name for row in category_sales]
-    values = [float(row.total_sales) for row in category_sales]
+    return {
+        'daily_sales': {
+            'days': [str(row.day) for row in daily_sales],  # MySQL 返回 date，SQLite 返回字符串
+            'quantities': [int(row.total_quantity or 0) for row in daily_sales],
+            'sales': [float(row.total_sales or 0) for row in daily_sales]
+        },
+        'category_sales': {
+            'labels': [row.name for row in category_sales],
+            'values': [float(row.total_sales or 0) for row in category_sales]
+        }
+    }
 
-    fig2, ax3 = plt.subplots(figsize=(8, 8))
-    ax3.pie(values, labels=labels, autopct='%1.1f%%', startangle=140)
-    ax3.axis('equal')  # 保持饼图为正圆
-    plt.title('按品类销量分布')
 
-    buf2 = BytesIO()
-    plt.savefig(buf2, format='png', bbox_inches='tight')
-    plt.close(fig2)
-    buf2.seek(0)
-    category_plot = base64.b64encode(buf2.getvalue()).decode()
+@admin_bp.route('/dashboard/stats')
+@login_required
+def dashboard_stats():
+    """
+    后台统计面板
+    - 每日订单数量与销售额（柱状 + 折线）
+    - 按品类销售额分布（饼图）
+    图像由 utils.charts 在渲染进程中生成并按数据内容缓存；?format=svg 输出矢量图
+    """
+    fmt = request.args.get('format', 'png')
+    if fmt not in charts.FORMATS:
+        abort(400)
+
+    series = _dashboard_series()
+    plots = {}
+    for kind, data in series.items():
+        # 没有数据时不绘图（各项为 0 的饼图会报错），模板显示“暂无数据”
+        empty = not data['days'] if kind == 'daily_sales' else not any(data['values'])
+        if empty:
+            plots[kind] = None
+            continue
+        try:
+            plots[kind] = charts.render(kind, data, fmt)
+        except Exception as e:
+            current_app.logger.error(f'统计图表渲染失败 {kind}: {str(e)}')
+            plots[kind] = None
 
     # 返回模板，并携带两张图的 Base64 字符串
     return render_template(
         'admin/dashboard_stats.html',
-        daily_plot=daily_plot,
-        category_plot=category_plot
+        daily_plot=plots['daily_sales'],
+        category_plot=plots['category_sales'],
+        plot_mime=charts.FORMATS[fmt]
     )
+
+
+@admin_bp.route('/dashboard/stats/data')
+@login_required
+def dashboard_stats_data():
+    """
+    统计面板的原始数据序列，供前端自行绘图
+    以数据内容哈希作为 ETag，数据未变化时返回 304
+    """
+    series = _dashboard_series()
+    response = jsonify({'success': True, 'data': series})
+    response.set_etag(charts.series_version('dashboard', series))
+    return response.make_conditional(request)
+
+
+# ===============================
+# 请求剖析结果（火焰图）
+# ===============================
+@admin_bp.route('/profiles')
+@login_required
+def profile_list():
+    """已保存的请求剖析结果列表"""
+    return render_template('admin/profiles.html', profiles=profiler.list_profiles())
+
+
+@admin_bp.route('/profiles/<profile_id>')
+@login_required
+def profile_detail(profile_id):
+    """单次请求的火焰图与 SQL 时间线"""
+    record = profiler.load_profile(profile_id)
+    if record is None:
+        abort(404)
+    rects, max_depth = profiler.flame_graph(record['stacks'])
+    return render_template('admin/profile_detail.html', profile=record, rects=rects, max_depth=max_depth,
+                           samples=sum(record['stacks'].values()))
+
+
+@admin_bp.route('/profiles/<profile_id>/collapsed')
+@login_required
+def profile_collapsed(profile_id):
+    """下载折叠栈文本（flamegraph.pl / speedscope 格式）"""
+    record = profiler.load_profile(profile_id)
+    if record is None:
+        abort(404)
+    return Response(profiler.collapsed_text(record), mimetype='text/plain',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.folded'})
@@ -1,15 +1,18 @@
 # routes/auth.py
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from flask_login import login_user, logout_user, login_required
 from models.database import db
 from models.models import User
+from utils import tokens
+from utils.rate_limit import rate_limit, is_post, submitted_username
 
 auth_bp = Blueprint('auth', __name__)
 
 
 # ---------------------- 用户注册 ----------------------
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limit('register_ip', when=is_post)
 def register():
     # GET 请求：返回注册页面
     if request.method == 'GET':
@@ -64,6 +67,8 @@ def register():
 
 # ---------------------- 用户登录 ----------------------
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login_ip', when=is_post)
+@rate_limit('login_username', by=submitted_username, when=is_post)
 def login():
     # GET 请求：返回登录页面
     if request.method == 'GET':
@@ -77,13 +82,14 @@ def login():
 
     # 验证密码是否正确
     if user and user.check_password(data.get('password')):
+        if db.session.is_modified(user):
+            db.session.commit()  # 明文密码或旧成本因子的哈希已重新哈希
         login_user(user)  # 本地 session 登录
-        access_token = create_access_token(identity=user.id)  # 为 API 创建 JWT
 
-        # JSON 登录（适用于 SPA、移动端等）
+        # JSON 登录（适用于 SPA、移动端等）：返回访问令牌与刷新令牌，之后的请求带 Authorization: Bearer <访问令牌>
         if request.is_json:
             return jsonify({
-                'access_token': access_token,
+                **tokens.issue_tokens(user),
                 'user': user.to_dict(),
                 'is_admin': user.is_admin  # 是否管理员
             }), 200
@@ -111,3 +117,32 @@ def logout():
     logout_user()  # 清除登录状态
     flash('已退出登录', 'success')
     return redirect(url_for('index'))
+
+
+# ---------------------- JWT 刷新与注销 ----------------------
+@auth_bp.route('/token/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh_token():
+    """用刷新令牌换取新的访问令牌（按最新的管理员标记与令牌版本签发）"""
+    user = db.session.get(User, int(get_jwt_identity()))
+    if user is None:
+        return jsonify({'error': '用户不存在'}), 401
+    return jsonify({'access_token': tokens.issue_access_token(user)}), 200
+
+
+@auth_bp.route('/token/revoke', methods=['POST'])
+@jwt_required(verify_type=False)
+def revoke_token():
+    """
+    注销请求所带的令牌（访问令牌或刷新令牌）
+    JSON 中 all 为 true 时注销该用户在所有设备上的令牌
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('all'):
+        user = db.session.get(User, int(get_jwt_identity()))
+        if user is not None:
+            user.revoke_tokens()
+            db.session.commit()
+    else:
+        tokens.revoke(get_jwt())
+    return jsonify({'message': '令牌已注销'}), 200
@@ -1,7 +1,11 @@
 from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from models.database import db
 from models.models import CartItem, Product, Order, OrderItem
+from utils import recommendations
+from utils.inventory import reserve_stock, OutOfStock
+from utils.admission import admission_control
 
 cart_bp = Blueprint('cart', __name__)
 
@@ -31,7 +35,10 @@ def get_cart():
             'subtotal': subtotal
         })
 
-    return render_template('cart.html', cart_items=cart_data, total_amount=total_amount)
+    # 购物车推荐：按购物车内商品的“经常一起购买”结果合并
+    suggestions = recommendations.for_cart([item['product_id'] for item in cart_data])
+
+    return render_template('cart.html', cart_items=cart_data, total_amount=total_amount, suggestions=suggestions)
 
 
 # ---------------------- 添加/更新购物车 ----------------------
@@ -62,7 +69,7 @@ def add_to_cart():
     product = Product.query.get_or_404(product_id)
 
     # 库存检查
-    if product.stock_quantity < quantity:
+    if product.available_stock < quantity:
         msg = '库存不足'
         if request.is_json:
             return jsonify({'error': msg}), 400
@@ -77,7 +84,14 @@ def add_to_cart():
         cart_item = CartItem(user_id=current_user.id, product_id=product_id, quantity=quantity)
         db.session.add(cart_item)
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # 并发加购撞上 (user_id, product_id) 唯一键，改为更新已有行
+        db.session.rollback()
+        CartItem.query.filter_by(user_id=current_user.id, product_id=product_id) \
+            .update({CartItem.quantity: quantity})
+        db.session.commit()
 
     msg = '已添加/更新购物车'
     if request.is_json:
@@ -108,6 +122,7 @@ def remove_cart_item(item_id):
 # ---------------------- 结算购物车 → 生成订单 ----------------------
 @cart_bp.route('/checkout', methods=['POST'])
 @login_required
+@admission_control
 def checkout():
     # 查询用户全部购物车条目
     cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
@@ -121,7 +136,7 @@ def checkout():
 
     # 遍历每一项，检查库存 + 累计金额
     for item in cart_items:
-        if item.quantity > item.product.stock_quantity:
+        if item.quantity > item.product.available_stock:
             flash(f"{item.product.name} 库存不足", 'error')
             return redirect(url_for('cart.get_cart'))
 
@@ -140,7 +155,15 @@ def checkout():
     db.session.add(order)
     db.session.flush()  # 立刻生成 order.id，用来关联 order item
 
-    # 写入订单项 + 扣库存 + 清空购物车
+    # 扣库存（条件更新，并发下不足时整单回滚）
+    try:
+        reserve_stock([(item.product, item.quantity) for item in cart_items])
+    except OutOfStock as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('cart.get_cart'))
+
+    # 写入订单项 + 清空购物车
     for item in cart_items:
         db.session.add(OrderItem(
             order_id=order.id,
@@ -148,8 +171,6 @@ def checkout():
             quantity=item.quantity,
             unit_price=item.product.price
         ))
-        # 扣减库存
-        item.product.stock_quantity -= item.quantity
         # 删除购物车记录
         db.session.delete(item)
 
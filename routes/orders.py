@@ -2,6 +2,10 @@ from flask import Blueprint, request, jsonify, render_template, flash, redirect,
 from flask_login import login_required, current_user
 from models.database import db
 from models.models import Order, OrderItem, CartItem, Product, Review
+from utils.inventory import restore_stock_for_orders, reserve_stock, OutOfStock
+from utils.admission import admission_control, admit
+from utils.rate_limit import rate_limit
+from utils import live_events, product_stats, dashboard_counters
 
 # 创建订单蓝图，管理所有订单相关接口
 orders_bp = Blueprint('orders', __name__, url_prefix='/orders')
@@ -59,6 +63,7 @@ def get_order(order_id):
 # ===============================
 @orders_bp.route('/', methods=['POST'])
 @login_required
+@admission_control
 def create_order():
     # 获取表单或 JSON 数据
     data = request.get_json() or request.form
@@ -80,8 +85,8 @@ def create_order():
     for item in cart_items:
         product = Product.query.get(item.product_id)
 
-        # 库存不足校验
-        if product.stock_quantity < item.quantity:
+        # 库存不足校验（提前拒绝，最终以扣减时的条件更新为准）
+        if product.available_stock < item.quantity:
             msg = f'产品 {product.name} 库存不足'
             if request.is_json:
                 return jsonify({'error': msg}), 400
@@ -111,7 +116,7 @@ def create_order():
     db.session.add(order)
     db.session.flush()  # 提前获取订单 ID
 
-    # 创建订单项并扣减库存
+    # 创建订单项
     for item in order_items_data:
         order_item = OrderItem(
             order_id=order.id,
@@ -120,7 +125,16 @@ def create_order():
             unit_price=item['unit_price']
         )
         db.session.add(order_item)
-        item['product'].stock_quantity -= item['quantity']
+
+    # 扣减库存（条件更新，并发下不足时整单回滚）
+    try:
+        reserve_stock([(item['product'], item['quantity']) for item in order_items_data])
+    except OutOfStock as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'error')
+        return redirect(url_for('cart.get_cart'))
 
     # 清空购物车
     CartItem.query.filter_by(user_id=current_user.id).delete()
@@ -162,14 +176,29 @@ def cancel_order(order_id):
             flash(msg, 'error')
             return redirect(url_for('orders.get_order', order_id=order_id))
 
-    # 取消订单后还原库存
-    for item in order.order_items:
-        product = Product.query.get(item.product_id)
-        product.stock_quantity += item.quantity
+    # 带状态条件更新：与超时清理或重复提交并发时只有一个能取消成功，库存只还原一次
+    previous = order.status
+    updated = Order.query.filter(
+        Order.id == order.id,
+        Order.status == previous
+    ).update({Order.status: 'cancelled'}, synchronize_session=False)
+    if updated != 1:
+        db.session.rollback()
+        msg = '订单状态已变化，无法取消'
+        if request.is_json:
+            return jsonify({'error': msg}), 409
+        else:
+            flash(msg, 'error')
+            return redirect(url_for('orders.get_order', order_id=order_id))
 
-    # 更新订单状态
-    order.status = 'cancelled'
+    # 取消订单后还原库存
+    restore_stock_for_orders([order.id])
+    # 状态由批量 UPDATE 修改，不经过 flush，这里直接修正销量与仪表盘计数
+    if previous in product_stats.COUNTED_STATUSES:
+        product_stats.add_sales([order.id], -1)
+    dashboard_counters.status_changed(order, previous, 'cancelled')
     db.session.commit()
+    live_events.order_status_changed(order, previous)
 
     # 返回结果
     if request.is_json:
@@ -183,6 +212,7 @@ def cancel_order(order_id):
 # 提交评论
 # ===============================
 @orders_bp.route('/<int:order_id>/review', methods=['POST'])
+@rate_limit('review_write', by='user')
 @login_required
 def submit_review(order_id):
     # 查询订单
@@ -262,6 +292,7 @@ def confirm_order(order_id):
     # 更新订单状态为“已收货”
     order.status = 'delivered'
     db.session.commit()
+    live_events.order_status_changed(order, 'shipped')
 
     # 返回结果
     if request.is_json:
@@ -299,8 +330,10 @@ def request_refund(order_id):
             return redirect(url_for('orders.get_order', order_id=order_id))
 
     # 更新订单状态为退款申请中
+    previous = order.status
     order.status = 'refund_requested'
     db.session.commit()
+    live_events.order_status_changed(order, previous)
 
     msg = '退款申请已提交'
 
@@ -310,3 +343,29 @@ def request_refund(order_id):
     else:
         flash(msg, 'success')
         return redirect(url_for('orders.get_order', order_id=order_id))
+
+
+# ===============================
+# 订单状态实时推送（SSE，本人订单）
+# ===============================
+@orders_bp.route('/events')
+@login_required
+def order_events():
+    return live_events.stream([live_events.user_channel(current_user.id)])
+
+
+# ===============================
+# 秒杀排队状态轮询
+# ===============================
+@orders_bp.route('/admission/<ticket>')
+@login_required
+def admission_status(ticket):
+    decision = admit(current_user.id, ticket, consume=False)
+    messages = {
+        'admitted': '已轮到您，正在提交订单',
+        'queued': '排队中',
+        'sold_out': f'{decision.product} 已售罄',
+        'busy': '下单人数过多，请稍后再试'
+    }
+    return jsonify({'status': decision.status, 'ticket': decision.ticket, 'position': decision.position,
+                    'message': messages[decision.status]})
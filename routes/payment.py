@@ -1,7 +1,10 @@
-from flask import Blueprint, render_template, jsonify, url_for
+from flask import Blueprint, render_template, jsonify, url_for, request
 from flask_login import login_required, current_user
 from models.database import db
-from models.models import Order, User
+from models.models import Order
+from utils.payments import pay_order_with_balance, new_idempotency_key, IdempotencyConflict
+from utils.balance import get_balance
+from utils import live_events
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -13,7 +16,8 @@ payment_bp = Blueprint('payment', __name__)
 def payment_page(order_id):
     # 查询当前用户的订单，不允许越权访问
     order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
-    return render_template('payment/payment.html', order=order)
+    # 每次打开支付页生成一个幂等键，页面内重复点击共用该键
+    return render_template('payment/payment.html', order=order, idempotency_key=new_idempotency_key())
 
 # ===============================
 # 支付订单逻辑
@@ -23,30 +27,42 @@ def payment_page(order_id):
 def pay_order(order_id):
     # 查询订单并验证用户权限
     order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
-    user = db.session.query(User).filter_by(id=current_user.id).first()
 
-    # 若订单已支付，直接返回错误信息
-    if order.status == 'paid':
-        return jsonify({'success': False, 'message': '订单已支付', 'balance': float(user.balance)})
-
-    # 检查用户余额是否足够
-    if user.balance < float(order.total_amount):
-        return jsonify({'success': False, 'message': '余额不足', 'balance': float(user.balance)})
-
-    # 扣款并标记订单为已支付
-    user.balance -= float(order.total_amount)
-    order.status = 'paid'
+    # 幂等键：优先取请求头，其次取 JSON 字段，都没有则本次请求单独生成
+    data = request.get_json(silent=True) or {}
+    idempotency_key = (request.headers.get('Idempotency-Key')
+                       or data.get('idempotency_key')
+                       or new_idempotency_key())
 
     try:
-        # 提交事务
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'message': f'支付成功，扣除 ¥{order.total_amount}',
-            'balance': float(user.balance),
-            'redirect': url_for('orders.get_order', order_id=order.id)
-        })
+        payment, replayed = pay_order_with_balance(order, current_user.id, idempotency_key[:64])
+    except IdempotencyConflict:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': '幂等键已用于其他订单，请刷新支付页面后重试'}), 409
     except Exception as e:
         # 出错则回滚事务
         db.session.rollback()
-        return jsonify({'success': False, 'message': f'支付失败: {str(e)}', 'balance': float(user.balance)})
+        balance = get_balance(current_user.id)
+        return jsonify({'success': False, 'message': f'支付失败: {str(e)}', 'balance': float(balance)})
+
+    balance = get_balance(current_user.id, use_cache=False)
+
+    if payment.status != 'success':
+        return jsonify({
+            'success': False,
+            'message': payment.failure_reason or '支付处理中，请稍后刷新',
+            'payment': payment.to_dict(),
+            'balance': float(balance)
+        })
+
+    # 状态由批量 UPDATE 修改，提交后 order 已过期，读取到的是 paid；重复提交不再推送
+    if not replayed:
+        live_events.order_status_changed(order, 'pending')
+
+    return jsonify({
+        'success': True,
+        'message': f'支付成功，扣除 ¥{payment.amount}',
+        'payment': payment.to_dict(),
+        'balance': float(balance),
+        'redirect': url_for('orders.get_order', order_id=order.id)
+    })
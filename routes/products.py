@@ -1,27 +1,82 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app
+from sqlalchemy.orm import joinedload
 from models.models import Product, Category, Review
+from utils.reviews import review_page, review_block, format_review
+from utils.page_cache import cached_page, add_tags
+from utils import recommendations, facets, product_stats
+from utils.rate_limit import rate_limit
+from utils.suggest import suggest, record_search
 
 products_bp = Blueprint('products', __name__)
 
+SORT_LABELS = {'': '默认', 'newest': '最新上架', 'sales': '销量', 'rating': '评分',
+               'price_asc': '价格从低到高', 'price_desc': '价格从高到低'}
+
 # ===============================
-# 获取商品列表，支持分类筛选和搜索
+# 获取商品列表，支持分类、价格、库存、评分、营养素分面筛选、搜索和排序
 # ===============================
 @products_bp.route('/', methods=['GET'])
+@record_search
+@cached_page(tags=['categories', 'facets'])
+@rate_limit('search_ip', when=lambda: bool(request.args.get('search')))  # 只限制未命中页面缓存的搜索
 def get_products():
     category_id = request.args.get('category_id')
     search = request.args.get('search', '')
+    sort = request.args.get('sort', '')
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 12, type=int)
+    after = request.args.get('after')
+
+    # 分面计数与筛选都在内存位图上完成
+    index = facets.get_index()
+    selection = facets.parse_selection(request.args)
+    result = index.filter(selection, search)
 
     # 构建查询条件：只显示上架商品
     query = Product.query.filter_by(is_active=True)
-    if category_id and category_id != 'all':
+    total = None
+    if set(selection) - {'category'} or search:
+        # 其他分面或搜索：按位图筛出的商品ID分页，IN 列表的长度有上限
+        if sort not in product_stats.SORTS:
+            # 默认按商品ID排序，与槽位顺序一致：只取到当前页（或游标后一页）为止的ID，总数取位图计数
+            if request.args.get('format') == 'json' and after:
+                ids = index.product_ids(result.bitmap, limit=per_page + 1,
+                                        after=int(after) if after.isdigit() else None)
+            else:
+                ids = index.product_ids(result.bitmap, limit=max(page, 1) * per_page)
+            query = query.filter(Product.id.in_(ids))
+            total = result.total
+        elif result.total <= current_app.config['FACET_MAX_IN_IDS']:
+            query = query.filter(Product.id.in_(index.product_ids(result.bitmap)))
+        else:
+            # 匹配的商品太多：改用等价的 SQL 条件，由数据库按排序列索引分页
+            query = query.filter(*facets.sql_conditions(selection, search))
+    elif category_id and category_id != 'all':
         query = query.filter_by(category_id=category_id)
-    if search:
-        query = query.filter(Product.name.like(f'%{search}%'))
+    if category_id and category_id != 'all':
+        add_tags(f'category:{category_id}')
+    else:
+        add_tags('category:all')
+
+    # 排序列均为 products 上的索引列，排序后分页与不排序一样只读一页
+    query = product_stats.apply_sort(query, sort)
+
+    # JSON 接口可用 ?after=<游标> 按 (排序列, id) 游标翻页，不随页数增大而变慢
+    if request.args.get('format') == 'json' and after:
+        try:
+            items = product_stats.apply_cursor(query, sort, after).limit(per_page + 1).all()
+        except ValueError:
+            return jsonify({'error': '无效的分页游标'}), 400
+        return jsonify({
+            'products': [p.to_dict() for p in items[:per_page]],
+            'facets': result.counts,
+            'next_cursor': product_stats.encode_cursor(items[per_page - 1], sort) if len(items) > per_page else None
+        })
 
     # 分页查询
-    products = query.paginate(page=page, per_page=per_page, error_out=False)
+    products = query.paginate(page=page, per_page=per_page, error_out=False, count=total is None)
+    if total is not None:
+        products.total = total
     categories = Category.query.all()
 
     # 根据请求格式返回 JSON 或渲染模板
@@ -29,44 +84,59 @@ def get_products():
         return jsonify({
             'products': [p.to_dict() for p in products.items],
             'categories': [c.to_dict() for c in categories],
+            'facets': result.counts,
             'total': products.total,
             'pages': products.pages,
-            'current_page': page
+            'current_page': page,
+            'next_cursor': product_stats.encode_cursor(products.items[-1], sort)
+            if products.has_next and products.items else None
         })
     else:
         return render_template(
             'products.html',
             products=products.items,
             categories=categories,
+            category_counts=result.counts['category'],
+            selection=selection,
+            sorts=SORT_LABELS,
+            facet_options=facets.facet_options(result, selection),
             pagination=products
         )
 
 # ===============================
-# 获取单个商品详情及其已验证评论
+# 搜索框输入联想（内存前缀树，不访问数据库）
+# ===============================
+@products_bp.route('/suggest', methods=['GET'])
+def get_suggestions():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', type=int)
+    suggestions = [{'text': s.text, 'type': s.kind, 'id': s.ref[1] if s.kind != 'query' else None}
+                   for s in suggest(query[:50], limit)]
+    response = jsonify({'query': query, 'suggestions': suggestions})
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
+# ===============================
+# 获取单个商品详情及最新的已验证评论
 # ===============================
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@cached_page(tags=lambda product_id: [f'product:{product_id}'])
 def get_product(product_id):
     # 查询商品
     product = Product.query.get_or_404(product_id)
 
-    # 查询该商品已验证评论，按创建时间倒序
-    reviews = Review.query.filter_by(product_id=product.id, is_verified=True).order_by(Review.created_at.desc()).all()
-    reviews_data = [{
-        'user_name': r.user.full_name or r.user.username,
-        'rating': r.rating,
-        'title': r.title,
-        'content': r.content,
-        'created_at': r.created_at.strftime('%Y-%m-%d %H:%M')
-    } for r in reviews]
-
-    # 根据请求格式返回 JSON 或渲染模板
+    # 根据请求格式返回 JSON 或渲染模板；两者都只带前 N 条评论，其余走评论分页接口
     if request.args.get('format') == 'json':
+        reviews, next_cursor = review_page(product.id, limit=current_app.config['PRODUCT_DETAIL_REVIEWS'])
         return jsonify({
             'product': product.to_dict(),
-            'reviews': reviews_data
+            'reviews': [format_review(r) for r in reviews],
+            'next_cursor': next_cursor,
+            'bought_together': [recommendations.summary(p) for p in recommendations.bought_together(product.id)]
         })
     else:
-        return render_template('product_detail.html', product=product, reviews=reviews_data)
+        return render_template('product_detail.html', product=product, review_block=review_block(product.id),
+                               bought_together=recommendations.bought_together(product.id))
 
 # ===============================
 # 获取商品分类列表
@@ -81,9 +151,23 @@ def get_categories():
 # ===============================
 @products_bp.route('/<int:product_id>/reviews', methods=['GET'])
 def get_product_reviews(product_id):
+    """
+    已验证评论，按时间倒序
+    ?before=<游标> 按游标取下一页（详情页滚动加载使用）；未传时兼容旧的 ?page= 页码分页
+    """
+    per_page = min(request.args.get('per_page', current_app.config['REVIEW_PAGE_SIZE'], type=int), 50)
+    before = request.args.get('before')
     page = request.args.get('page', 1, type=int)
-    per_page = 5  # 每页显示5条评论
-    reviews_query = Review.query.filter_by(product_id=product_id).order_by(Review.created_at.desc())
+
+    if before or page == 1:
+        try:
+            reviews, next_cursor = review_page(product_id, before=before, limit=per_page)
+        except ValueError:
+            return jsonify({'error': '无效的分页游标'}), 400
+        return jsonify({'reviews': [r.to_dict() for r in reviews], 'next_cursor': next_cursor})
+
+    # 与详情页一致只展示已验证评论，走 (product_id, is_verified, created_at) 索引免排序
+    reviews_query = Review.query.options(joinedload(Review.user)) \
+        .filter_by(product_id=product_id, is_verified=True).order_by(Review.created_at.desc(), Review.id.desc())
     pagination = reviews_query.paginate(page=page, per_page=per_page, error_out=False)
-    reviews = [r.to_dict() for r in pagination.items]
-    return jsonify({'reviews': reviews})
+    return jsonify({'reviews': [r.to_dict() for r in pagination.items], 'next_cursor': None})
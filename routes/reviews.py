@@ -4,6 +4,7 @@ from flask_login import login_required, current_user
 from models.database import db
 from models.models import Review, Order, OrderItem
 from datetime import datetime
+from utils.rate_limit import rate_limit
 
 # 定义全局时间字段（模型中一般不直接定义在路由里，此处仅作说明）
 created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -52,6 +53,7 @@ def get_product_reviews(product_id):
 # 创建新评价
 # ============================
 @reviews_bp.route('/', methods=['POST'])
+@rate_limit('review_write', by='user')
 @login_required
 def create_review():
     data = request.get_json()
@@ -97,6 +99,7 @@ def create_review():
 # 更新评价
 # ============================
 @reviews_bp.route('/<int:review_id>', methods=['PUT'])
+@rate_limit('review_write', by='user')
 @login_required
 def update_review(review_id):
     review = Review.query.get_or_404(review_id)
@@ -120,6 +123,7 @@ def update_review(review_id):
 # 删除评价
 # ============================
 @reviews_bp.route('/<int:review_id>', methods=['DELETE'])
+@rate_limit('review_write', by='user')
 @login_required
 def delete_review(review_id):
     review = Review.query.get_or_404(review_id)
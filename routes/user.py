@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, current_app
 from flask_login import login_required, current_user
 from models.database import db
 from models.models import Order
+from utils.user_recommendations import for_user
 
 user_bp = Blueprint('user', __name__)
 
@@ -61,3 +62,12 @@ def user_orders():
 
     # 渲染模板并传入订单数据
     return render_template('user/orders.html', orders=orders, status=status)
+
+# ============================
+# 个性化推荐（批处理任务预先计算，接口只读结果）
+# ============================
+@user_bp.route('/recommendations')
+@login_required
+def user_recommendations():
+    limit = min(request.args.get('limit', current_app.config['CF_TOP_N'], type=int), current_app.config['CF_TOP_N'])
+    return jsonify({'products': for_user(current_user.id, max(limit, 1))})
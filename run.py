@@ -1,7 +1,16 @@
 # run.py
-from app import create_app
+# 本地开发入口；生产环境使用 wsgi.py + gunicorn.conf.py
+from app import create_app, init_db, create_sample_data
+from models.database import db
+from utils import background
 
 app = create_app()
 
 if __name__ == '__main__':
+    # 本地开发直接运行时顺带建表与写入示例数据；生产环境使用 flask init-db / flask seed
+    with app.app_context():
+        init_db()
+        create_sample_data()
+        db.session.commit()
+    background.start_jobs(app)
     app.run(debug=True)
\ No newline at end of file
@@ -9,6 +9,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 搜索功能
     initSearch();
+
+    // 订单状态实时推送
+    initLiveEvents();
 });
 
 function initCartFunctions() {
@@ -28,7 +31,7 @@ function initCartFunctions() {
         input.addEventListener('change', function() {
             const itemId = this.dataset.itemId;
             const quantity = this.value;
-            updateCartItem(itemId, quantity);
+            updateCartItem(itemId, quantity, this);
         });
     });
 }
@@ -59,7 +62,7 @@ function addToCart(productId, quantity = 1) {
     });
 }
 
-function updateCartItem(itemId, quantity) {
+function updateCartItem(itemId, quantity, input) {
     fetch(`/api/cart/update/${itemId}`, {
         method: 'PUT',
         headers: {
@@ -73,11 +76,23 @@ function updateCartItem(itemId, quantity) {
             showAlert(data.error, 'error');
         } else {
             showAlert('购物车已更新', 'success');
-            setTimeout(() => location.reload(), 1000);
+            // 原地更新小计与总金额，不再整页刷新
+            const row = input && input.closest('tr');
+            const price = row && parseFloat(row.dataset.price);
+            if (price) row.querySelector('.subtotal').textContent = (price * quantity).toFixed(2);
+            refreshCartTotal();
         }
     });
 }
 
+function refreshCartTotal() {
+    const totalEl = document.getElementById('total-amount');
+    if (!totalEl) return;
+    let total = 0;
+    document.querySelectorAll('.subtotal').forEach(el => { total += parseFloat(el.textContent) || 0; });
+    totalEl.textContent = total.toFixed(2);
+}
+
 function showAlert(message, type) {
     const alertClass = type === 'error' ? 'alert-danger' : 'alert-success';
     const alertHtml = `
@@ -117,27 +132,98 @@ function initSearch() {
                 e.preventDefault();
             }
         });
+        initSuggest(searchForm);
     }
 }
 
-// AJAX 订单状态更新（管理员功能）
+// 输入联想：输入停顿后请求 /products/suggest，结果填入 datalist
+function initSuggest(searchForm) {
+    const searchInput = searchForm.querySelector('input[name="search"]');
+    const list = document.getElementById(searchInput.getAttribute('list'));
+    if (!list) return;
+
+    let timer = null;
+    let latest = '';
+    searchInput.addEventListener('input', function() {
+        clearTimeout(timer);
+        const q = this.value.trim();
+        if (!q) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(() => {
+            latest = q;
+            fetch(`/products/suggest?q=${encodeURIComponent(q)}`)
+                .then(res => res.json())
+                .then(data => {
+                    if (data.query.trim() !== latest) return;  // 丢弃过期的响应
+                    list.innerHTML = '';
+                    data.suggestions.forEach(s => {
+                        const option = document.createElement('option');
+                        option.value = s.text;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(() => {});
+        }, 150);
+    });
+}
+
+// AJAX 订单状态更新（管理员功能），页面上的状态由实时推送更新
 function updateOrderStatus(orderId, status) {
     if (!confirm('确定要更新订单状态吗？')) return;
 
-    fetch(`/api/admin/orders/${orderId}/status`, {
-        method: 'PUT',
-        headers: {
-            'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ status: status })
+    const body = new FormData();
+    body.append('status', status);
+    fetch(`/admin/orders/${orderId}/update_status`, { method: 'POST', body: body })
+    .then(response => {
+        if (!response.ok) throw new Error(response.status);
     })
-    .then(response => response.json())
-    .then(data => {
-        if (data.error) {
-            alert(data.error);
-        } else {
-            alert('订单状态已更新');
-            location.reload();
-        }
+    .catch(() => alert('订单状态更新失败'));
+}
+
+// 把页面上某订单的状态文字与可用操作切换到新状态；页面上没有该订单时返回 false
+function applyOrderStatus(orderId, status) {
+    const labels = document.querySelectorAll(`[data-order-status="${orderId}"]`);
+    labels.forEach(el => { el.textContent = status; });
+    document.querySelectorAll(`[data-order-actions="${orderId}"] [data-show-for]`).forEach(el => {
+        el.hidden = !el.dataset.showFor.split(' ').includes(status);
+    });
+    return labels.length > 0;
+}
+
+// 后台仪表盘计数：按推送的最新值替换页面上的数字
+function applyDashboardCounters(counters) {
+    Object.entries(counters).forEach(([name, value]) => {
+        document.querySelectorAll(`[data-counter="${name}"]`).forEach(el => {
+            el.textContent = name === 'revenue_today' ? Number(value).toFixed(2) : value;
+        });
     });
-}
\ No newline at end of file
+}
+
+// 订单状态实时推送（SSE）：断线后按指数退避加随机抖动重连，避免服务重启时所有页面同时重连
+function initLiveEvents() {
+    const url = document.body.dataset.eventsUrl;
+    if (!url || !window.EventSource) return;
+
+    let attempts = 0;
+    function connect() {
+        const source = new EventSource(url);
+        source.addEventListener('open', () => { attempts = 0; });
+        source.addEventListener('order_status', e => {
+            const data = JSON.parse(e.data);
+            if (applyOrderStatus(data.order_id, data.status)) {
+                showAlert(`订单 #${data.order_id} 状态已更新为 ${data.status}`, 'success');
+            }
+        });
+        source.addEventListener('dashboard', e => applyDashboardCounters(JSON.parse(e.data)));
+        source.addEventListener('error', () => {
+            // 服务端到达最长连接时间主动断开、连接数已满（503）或网络中断
+            source.close();
+            const delay = Math.min(30000, 1000 * 2 ** attempts) * (0.5 + Math.random() / 2);
+            attempts++;
+            setTimeout(connect, delay);
+        });
+    }
+    connect();
+}
@@ -0,0 +1,174 @@
+# utils/admission.py
+# =============================================
+# 秒杀下单准入控制
+# - 只对购物车中的秒杀商品（开启了库存分片的商品）生效，普通商品直接放行
+# - 每个秒杀商品一个令牌桶：每秒补充 ADMISSION_RATE 个，容量取 ADMISSION_BURST 与剩余库存的较小值，
+#   拿到令牌的请求才进入下单流程（查购物车、扣库存、写订单）
+# - 拿不到令牌时进入该商品的有界等待队列，返回排队凭证（ticket）与当前位置；
+#   客户端轮询 /orders/admission/<ticket>，排到且补充出令牌后凭证变为 admitted，再带着凭证重新提交
+# - 剩余库存为 0 时立即拒绝；队列已满时返回 503 + Retry-After
+# 状态保存在共享存储中（进程内字典或 SQLite 文件），多个 worker 共用同一组令牌桶与队列
+# =============================================
+
+import json
+import time
+import uuid
+from functools import wraps
+from flask import current_app, request, jsonify, flash, redirect, url_for, render_template
+from flask_login import current_user
+from models.database import db
+from models.models import CartItem, Product
+from utils import metrics
+from utils.inventory import stock_total
+from utils.shared_store import get_store
+
+_BUCKET_PREFIX = 'admission:'
+_TICKET_PREFIX = 'admission_ticket:'
+_STATE_TTL = 3600  # 秒杀结束后令牌桶状态自动过期
+
+
+class Decision:
+    """准入结果：status 为 admitted / queued / sold_out / busy"""
+
+    def __init__(self, status, ticket=None, position=None, product=None):
+        self.status = status
+        self.ticket = ticket
+        self.position = position
+        self.product = product
+
+
+# ---------------------- 令牌桶 + 队列 ----------------------
+def _take_token(product_id, ticket, remaining):
+    """
+    为排队凭证向某商品的令牌桶申请一个令牌
+    返回 ('admitted' | 'queued' | 'full', 队列位置)；队列中靠前的凭证优先拿令牌
+    """
+    config = current_app.config
+    now = time.time()
+    capacity = min(config['ADMISSION_BURST'], remaining)
+    result = {}
+
+    def apply(raw):
+        state = json.loads(raw) if raw else {'tokens': capacity, 'ts': now, 'queue': []}
+        tokens = min(capacity, state['tokens'] + (now - state['ts']) * config['ADMISSION_RATE'])
+        # 超过 ADMISSION_POLL_TIMEOUT 未轮询的凭证视为已离开
+        queue = [entry for entry in state['queue'] if now - entry[1] < config['ADMISSION_POLL_TIMEOUT']]
+        position = next((i for i, entry in enumerate(queue) if entry[0] == ticket), None)
+        ahead = len(queue) if position is None else position
+
+        if ahead < int(tokens):
+            tokens -= 1
+            if position is not None:
+                queue.pop(position)
+            result.update(status='admitted', position=0)
+        elif position is not None:
+            queue[position][1] = now
+            result.update(status='queued', position=position + 1)
+        elif len(queue) >= config['ADMISSION_QUEUE_SIZE']:
+            result.update(status='full', position=None)
+        else:
+            queue.append([ticket, now])
+            result.update(status='queued', position=len(queue))
+        result['length'] = len(queue)
+        return json.dumps({'tokens': tokens, 'ts': now, 'queue': queue})
+
+    get_store().update(_BUCKET_PREFIX + str(product_id), apply, ttl=_STATE_TTL)
+    metrics.set_gauge('admission_queue_length', result['length'], product=str(product_id))
+    return result['status'], result['position']
+
+
+def _flash_sale_items(user_id):
+    """购物车中的秒杀商品 [(商品ID, 名称)]"""
+    return db.session.query(Product.id, Product.name).join(CartItem, CartItem.product_id == Product.id) \
+        .filter(CartItem.user_id == user_id, Product.is_sharded == True).order_by(Product.id).all()
+
+
+def admit(user_id, ticket=None, consume=True):
+    """
+    判断该用户此刻能否进入下单流程
+    consume=True 用于下单请求本身：已放行的凭证被消耗；consume=False 用于轮询，放行后凭证保留到下单时使用
+    """
+    items = _flash_sale_items(user_id)
+    if not items:
+        return Decision('admitted')
+
+    for product_id, name in items:
+        if stock_total(product_id) <= 0:
+            metrics.inc('admission_requests_total', result='sold_out')
+            return Decision('sold_out', product=name)
+
+    store = get_store()
+    record = json.loads(store.get(_TICKET_PREFIX + ticket) or 'null') if ticket else None
+    if record is None or record['user'] != user_id:
+        ticket, record = uuid.uuid4().hex, {'user': user_id, 'granted': [], 'admitted': False}
+
+    if record['admitted']:
+        if consume:
+            store.delete(_TICKET_PREFIX + ticket)
+        metrics.inc('admission_requests_total', result='admitted')
+        return Decision('admitted', ticket=ticket)
+
+    position = 0
+    for product_id, name in items:
+        if product_id in record['granted']:
+            continue
+        status, product_position = _take_token(product_id, ticket, stock_total(product_id))
+        if status == 'full':
+            metrics.inc('admission_requests_total', result='busy')
+            return Decision('busy', product=name)
+        if status == 'admitted':
+            record['granted'].append(product_id)
+        else:
+            position = max(position, product_position)
+
+    admitted = len(record['granted']) == len(items)
+    if admitted and consume:
+        store.delete(_TICKET_PREFIX + ticket)
+    else:
+        record['admitted'] = admitted
+        store.set(_TICKET_PREFIX + ticket, json.dumps(record), ttl=current_app.config['ADMISSION_TICKET_TTL'])
+    metrics.inc('admission_requests_total', result='admitted' if admitted else 'queued')
+    return Decision('admitted' if admitted else 'queued', ticket=ticket, position=position)
+
+
+# ---------------------- 视图装饰器 ----------------------
+def _request_ticket():
+    data = request.get_json(silent=True) or {}
+    return request.headers.get('X-Admission-Ticket') or request.form.get('admission_ticket') \
+        or data.get('admission_ticket')
+
+
+def admission_control(view):
+    """放在 login_required 之后：秒杀商品下单前先经过令牌桶与排队"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['ADMISSION_ENABLED']:
+            return view(*args, **kwargs)
+
+        decision = admit(current_user.id, _request_ticket())
+        if decision.status == 'admitted':
+            return view(*args, **kwargs)
+
+        retry_after = current_app.config['ADMISSION_POLL_INTERVAL']
+        if decision.status == 'sold_out':
+            msg, code = f'{decision.product} 已售罄', 409
+        elif decision.status == 'busy':
+            msg, code = '下单人数过多，请稍后再试', 503
+        else:
+            poll_url = url_for('orders.admission_status', ticket=decision.ticket)
+            if request.is_json:
+                response = jsonify({'message': '排队中', 'ticket': decision.ticket, 'position': decision.position,
+                                    'poll_url': poll_url})
+            else:
+                # 排队页面轮询到放行后带着凭证和原表单重新提交
+                fields = {k: v for k, v in request.form.items() if k != 'admission_ticket'}
+                response = render_template('admission_wait.html', ticket=decision.ticket, position=decision.position,
+                                           poll_url=poll_url, action=request.path, fields=fields,
+                                           interval=retry_after)
+            return response, 202, {'Retry-After': str(retry_after)}
+
+        if request.is_json:
+            return jsonify({'error': msg}), code, {'Retry-After': str(retry_after)} if code == 503 else {}
+        flash(msg, 'error')
+        return redirect(url_for('cart.get_cart'))
+    return wrapper
@@ -0,0 +1,53 @@
+# utils/background.py
+# =============================================
+# 后台周期任务工具
+# 每个任务一个守护线程，按固定间隔在应用上下文中执行
+# 各模块在 init_app 中用 register_job 登记任务，由启动入口调用 start_jobs 统一启动：
+# 预派生（preload + fork）部署时线程不能在主进程里创建，必须在每个 worker 中启动
+# =============================================
+
+import os
+import time
+from threading import Thread
+from models.database import db
+from utils import metrics
+
+
+def start_periodic(app, name, interval, func):
+    """
+    启动一个周期任务线程
+    interval 为 0 或 None 时不启动；异常只记录日志，不会中断后续执行
+    """
+    if not interval:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    func()
+                except Exception as e:
+                    db.session.rollback()
+                    metrics.inc('background_job_errors_total', job=name)
+                    app.logger.error(f'后台任务 {name} 执行失败: {str(e)}')
+                finally:
+                    db.session.remove()
+
+    thread = Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def register_job(app, name, interval, func):
+    """登记周期任务，暂不启动"""
+    app.extensions.setdefault('background_jobs', []).append((name, interval, func))
+
+
+def start_jobs(app):
+    """启动已登记的周期任务；同一进程内重复调用只启动一次"""
+    if app.extensions.get('background_jobs_pid') == os.getpid():
+        return
+    app.extensions['background_jobs_pid'] = os.getpid()
+    for name, interval, func in app.extensions.get('background_jobs', []):
+        start_periodic(app, name, interval, func)
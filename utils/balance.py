@@ -0,0 +1,213 @@
+# utils/balance.py
+# =============================================
+# 用户余额流水模块
+# - 充值、支付、退款都只追加 balance_entries，不再原地修改 users 行
+# - 当前余额 = 快照 + 快照之后的流水，读取结果做短时缓存
+# - 扣款时锁定该用户的快照行校验余额；入账不锁快照行，但扣款/合并读取流水尾部时持有该用户流水区间的共享锁，
+#   期间同一用户的入账插入会等到扣款/合并的事务结束（不同用户之间互不影响）
+# - 后台对账任务定期把流水并入快照，并回写 users.balance 供展示；
+#   已处理到的流水ID保存在共享存储中，只推进到 BALANCE_RECONCILE_LAG_SECONDS 之前写入的流水，
+#   更晚的流水每次都重新扫描，ID 较小但提交较晚的流水不会被跳过
+# =============================================
+
+import time
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import func, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.database import db
+from models.models import User, BalanceEntry, BalanceSnapshot
+from utils.background import register_job
+from utils import metrics
+from utils.shared_store import get_store
+
+
+class InsufficientBalance(Exception):
+    """余额不足"""
+
+
+_cache = {}                 # user_id -> (余额, 过期时间)
+_cache_lock = threading.Lock()
+_WATERMARK_KEY = 'balance:reconciled_entry_id'  # 对账任务已处理到的流水ID
+
+
+# ---------------------- 缓存 ----------------------
+def _cache_get(user_id):
+    with _cache_lock:
+        cached = _cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        metrics.inc('cache_requests_total', cache='balance', result='hit')
+        return cached[0]
+    metrics.inc('cache_requests_total', cache='balance', result='miss')
+    return None
+
+
+def _cache_set(user_id, balance):
+    ttl = current_app.config['BALANCE_CACHE_TTL']
+    with _cache_lock:
+        _cache[user_id] = (balance, time.monotonic() + ttl)
+
+
+def invalidate(user_id):
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    """事务提交后再清理缓存，避免提交前的读取把旧值缓存下来"""
+    for user_id in session.info.pop('balance_dirty_users', ()):
+        invalidate(user_id)
+
+
+def _mark_dirty(user_id):
+    db.session.info.setdefault('balance_dirty_users', set()).add(user_id)
+
+
+# ---------------------- 快照 ----------------------
+def _get_snapshot(user_id, for_update=False):
+    """读取用户快照，不存在时以 users.balance 为初始余额创建"""
+    query = BalanceSnapshot.query.filter_by(user_id=user_id)
+    if for_update:
+        query = query.with_for_update()
+    snapshot = query.first()
+    if snapshot:
+        return snapshot
+
+    opening = db.session.query(User.balance).filter_by(id=user_id).scalar()
+    savepoint = db.session.begin_nested()
+    try:
+        db.session.add(BalanceSnapshot(user_id=user_id, balance=opening or 0, last_entry_id=0))
+        savepoint.commit()
+    except IntegrityError:
+        # 并发请求已创建快照
+        savepoint.rollback()
+    return query.one()
+
+
+def _tail(user_id, after_entry_id, locking=False):
+    """
+    快照之后的流水：返回 (金额合计, 最大流水ID)
+    locking=True 时使用共享锁读，读到最新已提交的流水，并等待未提交的写入完成；
+    MySQL 上同时对该用户的流水区间加间隙锁，事务结束前同一用户的新流水（包括入账）需等待
+    """
+    query = db.session.query(
+        func.coalesce(func.sum(BalanceEntry.amount), 0),
+        func.max(BalanceEntry.id)
+    ).filter(
+        BalanceEntry.user_id == user_id,
+        BalanceEntry.id > after_entry_id
+    )
+    if locking:
+        query = query.with_for_update(read=True)
+    total, last_id = query.one()
+    return Decimal(total), last_id
+
+
+# ---------------------- 对外接口 ----------------------
+def get_balance(user_id, use_cache=True):
+    """读取当前余额（快照 + 流水尾部），默认走缓存"""
+    if use_cache:
+        cached = _cache_get(user_id)
+        if cached is not None:
+            return cached
+
+    snapshot = _get_snapshot(user_id)
+    tail_total, _ = _tail(user_id, snapshot.last_entry_id)
+    balance = Decimal(snapshot.balance) + tail_total
+    _cache_set(user_id, balance)
+    return balance
+
+
+def credit(user_id, amount, entry_type, reference=None):
+    """入账（充值、退款）：只追加一条流水，不锁快照行（同一用户正在扣款/合并时插入需等其事务结束）"""
+    entry = BalanceEntry(user_id=user_id, amount=Decimal(amount),
+                         entry_type=entry_type, reference=reference)
+    db.session.add(entry)
+    _mark_dirty(user_id)
+    metrics.inc('balance_entries_total', entry_type=entry_type)
+    return entry
+
+
+def debit(user_id, amount, entry_type, reference=None):
+    """
+    扣款：锁定该用户快照行后校验余额，再追加一条负数流水
+    同一用户的扣款串行，不同用户之间互不影响；余额不足抛出 InsufficientBalance
+    """
+    amount = Decimal(amount)
+    snapshot = _get_snapshot(user_id, for_update=True)
+    tail_total, _ = _tail(user_id, snapshot.last_entry_id, locking=True)
+    if Decimal(snapshot.balance) + tail_total < amount:
+        raise InsufficientBalance('余额不足')
+
+    entry = BalanceEntry(user_id=user_id, amount=-amount,
+                         entry_type=entry_type, reference=reference)
+    db.session.add(entry)
+    db.session.flush()
+    _mark_dirty(user_id)
+    metrics.inc('balance_entries_total', entry_type=entry_type)
+    return entry
+
+
+def compact(user_id):
+    """把快照之后的流水并入快照，并回写 users.balance；返回新余额"""
+    snapshot = _get_snapshot(user_id, for_update=True)
+    tail_total, last_id = _tail(user_id, snapshot.last_entry_id, locking=True)
+    if last_id is not None:
+        snapshot.balance = Decimal(snapshot.balance) + tail_total
+        snapshot.last_entry_id = last_id
+
+    user_balance = db.session.query(User.balance).filter_by(id=user_id).scalar()
+    if user_balance is not None and Decimal(user_balance) != Decimal(snapshot.balance):
+        User.query.filter_by(id=user_id).update(
+            {User.balance: snapshot.balance}, synchronize_session=False)
+        metrics.inc('balance_reconciled_users_total')
+    _mark_dirty(user_id)
+    return Decimal(snapshot.balance)
+
+
+def reconcile_balances():
+    """
+    对账任务：找出上次执行后有新流水的用户，逐个生成快照并回写 users.balance
+    每个用户单独提交，锁持有时间很短；返回处理的用户数
+    """
+    store = get_store()
+    watermark = store.get(_WATERMARK_KEY) or 0
+    upper = db.session.query(func.max(BalanceEntry.id)).scalar()
+    if upper is None or upper <= watermark:
+        return 0
+
+    # 按主键范围找出有新流水的用户
+    user_ids = [user_id for (user_id,) in db.session.query(BalanceEntry.user_id)
+                .filter(BalanceEntry.id > watermark, BalanceEntry.id <= upper)
+                .distinct()
+                .all()]
+    # 只推进到写入时间早于安全间隔的流水：更晚的流水之前可能还有未提交的较小ID，下次重新扫描
+    cutoff = datetime.now() - timedelta(seconds=current_app.config['BALANCE_RECONCILE_LAG_SECONDS'])
+    settled = db.session.query(func.max(BalanceEntry.id)) \
+        .filter(BalanceEntry.id > watermark, BalanceEntry.id <= upper, BalanceEntry.created_at < cutoff).scalar()
+    db.session.commit()  # 结束只读事务，每个用户在新事务中加锁合并
+
+    for user_id in user_ids:
+        compact(user_id)
+        db.session.commit()
+
+    if settled is not None:
+        store.update(_WATERMARK_KEY, lambda old: max(old or 0, settled))
+    metrics.set_gauge('balance_reconcile_last_users', len(user_ids))
+    return len(user_ids)
+
+
+def init_app(app):
+    """注册命令行入口并登记后台对账任务"""
+
+    @app.cli.command('reconcile-balances')
+    def reconcile_balances_command():
+        """立即执行一次余额对账"""
+        count = reconcile_balances()
+        print(f'已对账 {count} 个用户')
+
+    register_job(app, 'balance-reconciler', app.config.get('BALANCE_RECONCILE_INTERVAL_SECONDS', 0), reconcile_balances)
@@ -0,0 +1,60 @@
+# utils/cache.py
+# =============================================
+# 进程内 LRU 缓存
+# - 容量有上限，超出时淘汰最久未使用的条目
+# - 可选 TTL（秒），过期条目在读取时丢弃
+# - 线程安全；命中/未命中计入 cache_requests_total 指标
+# =============================================
+
+import time
+import threading
+from collections import OrderedDict
+from utils import metrics
+
+_MISSING = object()
+
+
+class LRUCache:
+    """有容量上限的线程安全 LRU 缓存"""
+
+    def __init__(self, name, maxsize=128, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间或 None, 值)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] is not None and entry[0] <= now:
+                del self._data[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._data.move_to_end(key)
+        metrics.inc('cache_requests_total', cache=self.name, result='miss' if entry is _MISSING else 'hit')
+        return default if entry is _MISSING else entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                metrics.inc('cache_evictions_total', cache=self.name)
+            size = len(self._data)
+        metrics.set_gauge('cache_entries', size, cache=self.name)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
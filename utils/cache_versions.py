@@ -0,0 +1,85 @@
+# utils/cache_versions.py
+# =============================================
+# 按表维护的缓存版本号
+# - ORM flush 涉及的表、以及 query.update()/delete() 批量语句的目标表，
+#   在事务提交后各自版本号 +1（回滚则不变）
+# - 版本号保存在共享存储中，所有 worker 看到的一致
+# - 缓存键带上相关表的版本号，表数据变化后旧缓存自然失效，无需逐个删除
+# =============================================
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models.database import db
+from utils.shared_store import get_store
+
+_PREFIX = 'table_version:'
+
+
+def _mark(session, table):
+    session.info.setdefault('dirty_tables', set()).add(table)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            _mark(session, table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _mark(orm_execute_state.session, table.name)
+
+
+def mark_changed(*tables):
+    """登记当前事务修改了这些表（或自定义的版本键），提交后版本号 +1"""
+    for table in tables:
+        _mark(db.session, table)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    tables = session.info.pop('dirty_tables', None)
+    if tables:
+        bump(*tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('dirty_tables', None)
+
+
+def bump(*tables):
+    """手动让若干表的版本号 +1（如直接执行 SQL 修改数据后）"""
+    store = get_store()
+    for table in tables:
+        store.incr(_PREFIX + table)
+    if has_request_context():
+        g.pop('_table_versions', None)
+
+
+def get_versions(*tables):
+    """返回 {表名: 版本号}，同一请求内只读取一次共享存储"""
+    cached = g.setdefault('_table_versions', {}) if has_request_context() else {}
+    missing = [t for t in tables if t not in cached]
+    if missing:
+        found = get_store().get_many(_PREFIX + t for t in missing)
+        for table in missing:
+            cached[table] = found.get(_PREFIX + table, 0)
+    return {table: cached[table] for table in tables}
+
+
+def read_version(table):
+    """不经请求内缓存直接读取一个版本号（需要与本进程的计数比对时用）"""
+    return get_store().get(_PREFIX + table, 0)
+
+
+def version_stamp(*tables):
+    """把若干表的版本号拼成一个字符串，用作缓存键的一部分"""
+    versions = get_versions(*tables)
+    return '.'.join(f'{table}{versions[table]}' for table in tables)
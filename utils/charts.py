@@ -0,0 +1,141 @@
+# utils/charts.py
+# =============================================
+# 后台统计图表渲染服务
+# - 图表在独立的进程池中渲染（spawn 启动 + Agg 后端），不占用请求线程，
+#   也不在 Web 进程里修改全局 rcParams（pyplot 不是线程安全的）
+# - 渲染结果按 "图表类型 + 数据序列的 SHA-256 + 输出格式" 缓存，数据不变则不重复渲染
+# - 同一张图并发请求时只提交一次渲染任务
+# - 支持 PNG / SVG 输出；也可以只返回数据序列，由前端自行绘制
+# =============================================
+
+import json
+import time
+import base64
+import hashlib
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from utils import metrics
+from utils.cache import LRUCache
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# 渲染进程内使用的绘图参数（通过 rc_context 局部生效）
+_RC = {
+    'font.sans-serif': ['SimHei', 'DejaVu Sans'],  # 中文字体，缺失时回退
+    'axes.unicode_minus': False                    # 负号正常显示
+}
+
+_lock = threading.Lock()
+_executor = None
+_inflight = {}  # 缓存键 -> 正在渲染的 Future
+_cache = LRUCache('charts', maxsize=64)
+
+
+# ---------------------- 渲染进程内执行 ----------------------
+def _init_worker():
+    """渲染进程启动时预先加载 matplotlib 并固定使用 Agg 后端"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.figure  # noqa: F401
+
+
+def _draw_daily_sales(fig, series):
+    """每日订单数量（柱状）与销售额（折线），双轴"""
+    days = series['days']
+    ax1 = fig.add_subplot()
+    ax1.bar(days, series['quantities'], color='skyblue', label='订单数量')
+    ax1.set_xlabel('日期')
+    ax1.set_ylabel('订单数量', color='blue')
+    ax1.tick_params(axis='y', labelcolor='blue')
+    ax1.set_xticks(range(len(days)))
+    ax1.set_xticklabels(days, rotation=45, ha='right')
+
+    ax2 = ax1.twinx()
+    ax2.plot(days, series['sales'], color='orange', marker='o', label='销售额')
+    ax2.set_ylabel('销售额（元）', color='orange')
+    ax2.tick_params(axis='y', labelcolor='orange')
+    ax2.set_title('每日订单数量与销售额统计')
+
+
+def _draw_category_sales(fig, series):
+    """按品类销售额饼图"""
+    ax = fig.add_subplot()
+    ax.pie(series['values'], labels=series['labels'], autopct='%1.1f%%', startangle=140)
+    ax.axis('equal')  # 保持饼图为正圆
+    ax.set_title('按品类销量分布')
+
+
+_CHARTS = {
+    'daily_sales': (_draw_daily_sales, (12, 6)),
+    'category_sales': (_draw_category_sales, (8, 8))
+}
+
+
+def _render(kind, series, fmt):
+    """在渲染进程中绘制图表，返回图片字节"""
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    draw, figsize = _CHARTS[kind]
+    with matplotlib.rc_context(_RC):
+        fig = Figure(figsize=figsize)
+        draw(fig, series)
+        fig.tight_layout()
+        buf = BytesIO()
+        fig.savefig(buf, format=fmt, bbox_inches='tight')
+    return buf.getvalue()
+
+
+# ---------------------- Web 进程调用 ----------------------
+def series_version(kind, series):
+    """数据序列的版本号（内容哈希），同时用作缓存键与 ETag"""
+    payload = json.dumps({'kind': kind, 'series': series}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _get_executor():
+    """惰性创建渲染进程池（调用方需持有 _lock）"""
+    global _executor
+    if _executor is None:
+        # 使用 spawn 而不是 fork：Web 进程里有后台线程和数据库连接，fork 后状态不可靠
+        _executor = ProcessPoolExecutor(max_workers=current_app.config['CHART_WORKERS'],
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+    return _executor
+
+
+def render(kind, series, fmt='png'):
+    """
+    返回图表的 Base64 字符串（PNG 或 SVG）
+    结果按数据内容缓存；同一张图正在渲染时等待同一个任务，不重复提交
+    """
+    key = (series_version(kind, series), fmt)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    with _lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = _get_executor().submit(_render, kind, series, fmt)
+
+    try:
+        image = base64.b64encode(future.result(timeout=current_app.config['CHART_RENDER_TIMEOUT'])).decode()
+        if owner:
+            _cache.set(key, image)
+            metrics.histogram('chart_render_seconds', time.perf_counter() - started, chart=kind, format=fmt)
+    finally:
+        if owner:
+            with _lock:
+                _inflight.pop(key, None)
+    return image
+
+
+def init_app(app):
+    """按配置调整缓存容量"""
+    _cache.maxsize = app.config['CHART_CACHE_SIZE']
@@ -0,0 +1,190 @@
+# utils/compression.py
+# =============================================
+# 响应压缩（WSGI 中间件）
+# - 按 Accept-Encoding 协商 br（需要安装 brotli）或 gzip，同等权重时优先 br
+# - 只压缩 COMPRESSION_MIMETYPES 中列出的类型，每种类型单独设置最小长度；图片、字体包等已压缩格式不在列表中，
+#   text/event-stream 也不压缩（逐条推送的事件很小，压缩后还可能被代理缓冲）
+# - 已有 Content-Encoding、Cache-Control: no-transform、HEAD 请求、部分内容（206）、无响应体的状态码不处理
+# - 带 Content-Length 的响应整体压缩后重写 Content-Length；流式响应（无 Content-Length）先缓冲到最小长度，
+#   之后每收到一块就压缩并 flush 发出，首字节时间不因压缩而推迟到整页生成完
+# - 可压缩类型的响应一律加 Vary: Accept-Encoding；压缩后强 ETag 改为弱 ETag（内容字节已不同）
+# =============================================
+
+import zlib
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+from utils import metrics
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+_SKIP_STATUSES = (204, 206, 304)  # 无响应体或只是部分内容
+
+
+# ---------------------- 压缩器 ----------------------
+class _Gzip:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31：gzip 文件头
+
+    def compress(self, data):
+        return self._z.compress(data)
+
+    def flush(self):
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class CompressionMiddleware:
+    """包装 app.wsgi_app；各项规则见模块说明"""
+
+    def __init__(self, app, config):
+        self.app = app
+        self.mimetypes = dict(config['COMPRESSION_MIMETYPES'])
+        self.compressors = {'gzip': lambda: _Gzip(config['COMPRESSION_GZIP_LEVEL'])}
+        if brotli is not None:
+            self.compressors['br'] = lambda: _Brotli(config['COMPRESSION_BROTLI_QUALITY'])
+
+    def _negotiate(self, environ):
+        """客户端接受的编码中权重最高的一个（同等权重按 br、gzip 的顺序），都不接受时返回 None"""
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        best, best_quality = None, 0
+        for encoding in ('br', 'gzip'):
+            if encoding in self.compressors and accept.quality(encoding) > best_quality:
+                best, best_quality = encoding, accept.quality(encoding)
+        return best
+
+    def _min_size(self, status, headers):
+        """可压缩时返回该类型的最小长度，否则返回 None"""
+        if int(status.split(' ', 1)[0]) in _SKIP_STATUSES or 'Content-Encoding' in headers:
+            return None
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return None
+        return self.mimetypes.get(headers.get('Content-Type', '').split(';')[0].strip().lower())
+
+    def __call__(self, environ, start_response):
+        encoding = self._negotiate(environ) if environ.get('REQUEST_METHOD') != 'HEAD' else None
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=Headers(headers), exc_info=exc_info)
+            return _no_write
+
+        app_iter = self.app(environ, capture)
+        status, headers = captured['status'], captured['headers']
+        min_size = self._min_size(status, headers)
+        if min_size is not None:
+            headers['Vary'] = _add_vary(headers.get('Vary', ''))
+        if min_size is None or encoding is None:
+            start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+            return app_iter
+
+        length = headers.get('Content-Length', type=int)
+        if length is not None:
+            if length < min_size:
+                start_response(status, headers.to_wsgi_list(), captured['exc_info'])
+                return app_iter
+            return self._compress_whole(app_iter, encoding, status, headers, start_response, captured['exc_info'])
+        return ClosingIterator(self._compress_stream(app_iter, encoding, min_size, status, headers, start_response,
+                                                     captured['exc_info']),
+                               getattr(app_iter, 'close', None))
+
+    def _start(self, encoding, status, headers, start_response, exc_info, length=None):
+        headers['Content-Encoding'] = encoding
+        if length is None:
+            headers.pop('Content-Length', None)
+        else:
+            headers['Content-Length'] = str(length)
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        start_response(status, headers.to_wsgi_list(), exc_info)
+
+    def _compress_whole(self, app_iter, encoding, status, headers, start_response, exc_info):
+        """已知长度：读完整个响应体后一次压缩"""
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        compressor = self.compressors[encoding]()
+        data = compressor.compress(body) + compressor.finish()
+        self._start(encoding, status, headers, start_response, exc_info, len(data))
+        _record(encoding, len(body), len(data))
+        return [data]
+
+    def _compress_stream(self, app_iter, encoding, min_size, status, headers, start_response, exc_info):
+        """流式响应：缓冲到最小长度后开始压缩，之后每块压缩后立即 flush"""
+        buffered, size = [], 0
+        chunks = iter(app_iter)
+        for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                break
+        else:
+            # 整个响应不足最小长度：原样发送
+            body = b''.join(buffered)
+            headers['Content-Length'] = str(len(body))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            yield body
+            return
+
+        self._start(encoding, status, headers, start_response, exc_info)
+        compressor = self.compressors[encoding]()
+        raw = out = 0
+        for chunk in _chain(buffered, chunks):
+            if not chunk:
+                continue
+            data = compressor.compress(chunk) + compressor.flush()
+            raw, out = raw + len(chunk), out + len(data)
+            yield data
+        data = compressor.finish()
+        _record(encoding, raw, out + len(data))
+        yield data
+
+
+def _no_write(data):
+    raise NotImplementedError('压缩中间件不支持 start_response 返回的 write() 输出')
+
+
+def _chain(first, rest):
+    yield b''.join(first)
+    yield from rest
+
+
+def _add_vary(value):
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if '*' in fields or 'accept-encoding' in (field.lower() for field in fields):
+        return value
+    return ', '.join(fields + ['Accept-Encoding'])
+
+
+def _record(encoding, raw, compressed):
+    metrics.inc('compressed_responses_total', encoding=encoding)
+    metrics.inc('compression_bytes_in_total', raw)
+    metrics.inc('compression_bytes_out_total', compressed)
+
+
+def init_app(app):
+    """包装 WSGI 入口（COMPRESSION_ENABLED 为假时不启用，如已由 Nginx 压缩）"""
+    if app.config.get('COMPRESSION_ENABLED'):
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, app.config)
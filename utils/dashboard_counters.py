@@ -0,0 +1,175 @@
+# utils/dashboard_counters.py
+# =============================================
+# 后台仪表盘计数
+# - 用户数、商品数、订单数、今日营业额、待处理退款数保存在共享存储（dashboard:*），
+#   仪表盘只读取这几个键，耗时与表大小无关，不再每次打开页面都 COUNT(*) 三张表
+# - 计数随业务提交增量更新：flush 时按新增/删除的实例与订单状态变化累计增量，事务提交后再写入共享存储，回滚则丢弃；
+#   支付使用批量 UPDATE 改状态，不经过 flush，由 payments 调用 status_changed 登记
+# - 今日营业额 = 今天创建、状态为已支付及之后（COUNTED_STATUSES）的订单金额之和，按日期分键、以分为单位的整数保存
+# - 计数变化后最多每 DASHBOARD_PUSH_INTERVAL 秒向 admins 频道推送一次最新值，打开的仪表盘原地更新
+# - 定时任务按 DASHBOARD_RECONCILE_SECONDS 全量校正（数据库级联删除、批量语句、并发写入的误差在此修正）；
+#   键缺失时（首次启动、跨天）读取前同步校正一次
+# =============================================
+
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from models.database import db
+from models.models import User, Product, Order
+from utils import metrics, live_events
+from utils.background import register_job
+from utils.product_stats import COUNTED_STATUSES
+from utils.shared_store import get_store
+
+REFUND_STATUS = 'refund_requested'
+COUNTERS = ('users', 'products', 'orders', 'revenue_today', 'pending_refunds')
+_PREFIX = 'dashboard:'
+_REVENUE_TTL = 2 * 86400  # 按日期分键的营业额保留两天
+
+
+def _key(name, day=None):
+    if name == 'revenue_today':
+        return f'{_PREFIX}revenue:{(day or date.today()).isoformat()}'
+    return f'{_PREFIX}{name}'
+
+
+def _cents(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+# ---------------------- 增量 ----------------------
+def _order_deltas(deltas, order, status, sign):
+    """一个订单以 status 计入（sign=1）或移出（sign=-1）各计数"""
+    if status in COUNTED_STATUSES and order.created_at is not None:
+        deltas[_key('revenue_today', order.created_at.date())] += sign * _cents(order.total_amount)
+    if status == REFUND_STATUS:
+        deltas[_key('pending_refunds')] += sign
+
+
+def status_changed(order, previous, status, session=None):
+    """登记不经过 flush 的订单状态变化（批量 UPDATE），随当前事务提交后生效"""
+    session = session if session is not None else db.session
+    deltas = session.info.setdefault('dashboard_deltas', Counter())
+    _order_deltas(deltas, order, previous, -1)
+    _order_deltas(deltas, order, status, 1)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    deltas = session.info.setdefault('dashboard_deltas', Counter())
+    for sign, objs in ((1, session.new), (-1, session.deleted)):
+        for obj in objs:
+            if isinstance(obj, User):
+                deltas[_key('users')] += sign
+            elif isinstance(obj, Product):
+                deltas[_key('products')] += sign
+            elif isinstance(obj, Order):
+                deltas[_key('orders')] += sign
+                _order_deltas(deltas, obj, obj.status, sign)
+    for order in session.dirty:
+        if not isinstance(order, Order) or order in session.deleted:
+            continue
+        # Order.status 的 active_history 监听在 utils/product_stats 中注册，提交后再修改也能拿到旧值
+        history = inspect(order).attrs.status.history
+        if history.deleted and history.deleted[0] != order.status:
+            _order_deltas(deltas, order, history.deleted[0], -1)
+            _order_deltas(deltas, order, order.status, 1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply(session):
+    deltas = {key: delta for key, delta in session.info.pop('dashboard_deltas', {}).items() if delta}
+    if not deltas:
+        return
+    store = get_store()
+    for key, delta in deltas.items():
+        # 键不存在时保持缺失，由下一次校正写入完整值，避免从 0 开始累加出错误的总数
+        store.update(key, lambda value, delta=delta: None if value is None else value + delta,
+                     ttl=_REVENUE_TTL if key.startswith(f'{_PREFIX}revenue:') else None)
+    metrics.inc('dashboard_counter_updates_total', len(deltas))
+    _schedule_push()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('dashboard_deltas', None)
+
+
+# ---------------------- 读取与校正 ----------------------
+def reconcile():
+    """按数据库全量重算并写入共享存储，返回计数 {名称: 值}"""
+    today = datetime.combine(date.today(), datetime.min.time())
+    values = {
+        'users': db.session.query(func.count(User.id)).scalar(),
+        'products': db.session.query(func.count(Product.id)).scalar(),
+        'orders': db.session.query(func.count(Order.id)).scalar(),
+        # 按 (status, created_at) 索引只扫描今天的订单
+        'revenue_today': _cents(db.session.query(func.sum(Order.total_amount))
+                                .filter(Order.created_at >= today, Order.status.in_(COUNTED_STATUSES)).scalar()),
+        'pending_refunds': db.session.query(func.count(Order.id)).filter(Order.status == REFUND_STATUS).scalar()
+    }
+    store = get_store()
+    for name, value in values.items():
+        store.set(_key(name), value, ttl=_REVENUE_TTL if name == 'revenue_today' else None)
+    metrics.inc('dashboard_counter_reconciles_total')
+    return _present(values)
+
+
+def _present(values):
+    values = dict(values)
+    values['revenue_today'] = values['revenue_today'] / 100
+    return values
+
+
+def get_counters():
+    """当前计数 {名称: 值}，营业额单位为元；有键缺失时同步校正一次"""
+    found = get_store().get_many([_key(name) for name in COUNTERS])
+    if len(found) < len(COUNTERS):
+        return reconcile()
+    return _present({name: found[_key(name)] for name in COUNTERS})
+
+
+# ---------------------- 推送 ----------------------
+_push_lock = threading.Lock()
+_push_timer = None
+
+
+def _schedule_push():
+    """合并短时间内的多次变化：首次变化后等待 DASHBOARD_PUSH_INTERVAL 秒推送一次最新值"""
+    global _push_timer
+    app = current_app._get_current_object()
+    with _push_lock:
+        if _push_timer is not None:
+            return
+        _push_timer = threading.Timer(app.config['DASHBOARD_PUSH_INTERVAL'], _push, args=(app,))
+        _push_timer.daemon = True
+        _push_timer.start()
+
+
+def _push(app):
+    global _push_timer
+    with _push_lock:
+        _push_timer = None
+    with app.app_context():
+        try:
+            live_events.publish([live_events.ADMIN_CHANNEL], 'dashboard', get_counters())
+        except Exception as e:
+            app.logger.error(f'仪表盘计数推送失败: {str(e)}')
+        finally:
+            db.session.remove()
+
+
+def init_app(app):
+    """注册命令行入口并登记定时校正任务"""
+
+    @app.cli.command('reconcile-dashboard')
+    def reconcile_dashboard_command():
+        """按数据库全量重算后台仪表盘计数"""
+        for name, value in reconcile().items():
+            print(f'{name}: {value}')
+
+    register_job(app, 'dashboard-reconcile', app.config.get('DASHBOARD_RECONCILE_SECONDS', 0), reconcile)
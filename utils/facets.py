@@ -0,0 +1,344 @@
+# utils/facets.py
+# =============================================
+# 商品分面筛选（位图索引）
+# - 每个上架商品占位图中的一位（按商品ID顺序分配槽位），每个分面取值一个位图（Python 大整数）：
+#   分类、价格区间、是否有货、评分档位（N 星及以上）、营养素类型
+# - 同一分面内多选取并集（OR），不同分面之间取交集（AND）；
+#   某分面各取值的计数 = 其余分面的选择结果 & 该取值的位图 再数 1 的个数，不改变自身选择时的可选数量
+# - 一次筛选 + 全部分面计数只是几十次大整数与运算，不再为每个分面执行一次 GROUP BY
+# - 本进程提交的商品/评价修改记入待刷新集合，下次查询时只重新读取这些商品；
+#   其他 worker 的修改通过版本号发现，间隔 FACET_REBUILD_SECONDS 在后台全量重建；
+#   版本号用单独的键 product_facets（不用 products 表版本号）：商品或评价经 ORM 提交修改时 +1，
+#   下单扣库存、归还库存等批量 UPDATE 只有让商品在有货/缺货之间切换时才 +1（mark_stale），销量变化不影响
+# - 本进程记录自己 +1 的次数：版本号恰好等于 构建时版本 + 本进程次数 时才直接采用，
+#   否则说明还有其他 worker（或 mark_stale）的修改，照常后台重建
+# =============================================
+
+import time
+import bisect
+import threading
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import func, or_, and_, false
+from models.database import db
+from models.models import Product, Review
+from utils import metrics
+from utils.cache import LRUCache
+from utils.cache_versions import read_version, bump, mark_changed
+from utils.model_events import on_commit
+
+FACETS = ('category', 'price', 'stock', 'rating', 'nutrient')
+_VERSION_KEY = 'product_facets'
+
+# 筛选结果：bitmap 为匹配商品的位图，counts 为 {分面: {取值: 数量}}
+FacetResult = namedtuple('FacetResult', 'bitmap total counts')
+
+_search_cache = LRUCache('facet_search', maxsize=256)
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]  # 每个字节值中为 1 的位
+
+
+# ---------------------- 取值划分 ----------------------
+def price_buckets():
+    """价格区间取值，如 ['0-100', '100-200', '200-500', '500-']"""
+    bounds = [0] + list(current_app.config['FACET_PRICE_BUCKETS'])
+    return [f'{low}-{high}' for low, high in zip(bounds, bounds[1:])] + [f'{bounds[-1]}-']
+
+
+def facet_values(price, stock_quantity, category_id, nutrient_type, rating):
+    """一个商品在各分面上的取值 {分面: [取值]}"""
+    config = current_app.config
+    bounds = config['FACET_PRICE_BUCKETS']
+    values = {
+        'price': [price_buckets()[sum(1 for bound in bounds if price >= bound)]],
+        'stock': ['in' if stock_quantity > 0 else 'out'],
+        'rating': [str(band) for band in config['FACET_RATING_BANDS'] if rating is not None and rating >= band]
+    }
+    if category_id is not None:
+        values['category'] = [str(category_id)]
+    if nutrient_type:
+        values['nutrient'] = [nutrient_type]
+    return values
+
+
+# ---------------------- 位图索引 ----------------------
+class FacetIndex:
+    """
+    商品槽位 + 每个 (分面, 取值) 一个位图
+    写操作加锁；位图是不可变的大整数，读操作不加锁，最多读到单个商品更新到一半的状态
+    """
+
+    def __init__(self):
+        self.slots = {}         # 商品ID -> 槽位
+        self.ids = []           # 槽位 -> 商品ID（下架商品的槽位不复用，全量重建时回收）
+        self.names = []         # 槽位 -> 小写商品名（名称搜索）
+        self.values = []        # 槽位 -> 该商品的取值，更新时用于清除旧位
+        self.bits = {}          # (分面, 取值) -> 位图
+        self.live = 0           # 所有上架商品
+        self.revision = 0       # 每次修改加一，名称搜索结果按此缓存
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.live.bit_count()
+
+    def set(self, product_id, name, values):
+        """新增或替换一个商品的取值"""
+        with self._lock:
+            slot = self.slots.get(product_id)
+            if slot is None:
+                slot = self.slots[product_id] = len(self.ids)
+                self.ids.append(product_id)
+                self.names.append('')
+                self.values.append({})
+            else:
+                self._clear(slot)
+            bit = 1 << slot
+            for facet, choices in values.items():
+                for value in choices:
+                    self.bits[(facet, value)] = self.bits.get((facet, value), 0) | bit
+            self.names[slot] = name.lower()
+            self.values[slot] = values
+            self.live |= bit
+            self.revision += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            slot = self.slots.get(product_id)
+            if slot is not None:
+                self._clear(slot)
+                self.revision += 1
+
+    def _clear(self, slot):
+        mask = ~(1 << slot)
+        for facet, choices in self.values[slot].items():
+            for value in choices:
+                self.bits[(facet, value)] &= mask
+        self.values[slot] = {}
+        self.live &= mask
+
+    # ---------------------- 查询 ----------------------
+    def matching_names(self, search):
+        """名称包含 search 的商品位图"""
+        search = search.lower()
+        key = (id(self), self.revision, search)
+        bitmap = _search_cache.get(key)
+        if bitmap is None:
+            bitmap = 0
+            for slot, name in enumerate(self.names):
+                if search in name:
+                    bitmap |= 1 << slot
+            bitmap &= self.live
+            _search_cache.set(key, bitmap)
+        return bitmap
+
+    def _union(self, facet, values):
+        bitmap = 0
+        for value in values:
+            bitmap |= self.bits.get((facet, value), 0)
+        return bitmap
+
+    def filter(self, selection, search=None):
+        """
+        selection 为 {分面: [取值]}，返回 FacetResult
+        计数时每个分面去掉自身的选择，其余分面与搜索条件照常生效
+        """
+        base = self.live
+        if search:
+            base &= self.matching_names(search)
+        selected = {facet: self._union(facet, values) for facet, values in selection.items() if values}
+
+        bitmap = base
+        for facet_bitmap in selected.values():
+            bitmap &= facet_bitmap
+
+        counts = {}
+        for facet in FACETS:
+            others = base
+            for other, facet_bitmap in selected.items():
+                if other != facet:
+                    others &= facet_bitmap
+            counts[facet] = {value: (others & bits).bit_count()
+                             for (name, value), bits in self.bits.items() if name == facet and bits}
+        return FacetResult(bitmap, bitmap.bit_count(), counts)
+
+    def product_ids(self, bitmap, limit=None, after=None):
+        """
+        位图中的商品ID（按槽位即商品ID顺序），最多 limit 个；after 为商品ID时只取其后的商品
+        逐字节遍历，取够 limit 个即停止
+        """
+        if after is not None:
+            # 槽位按商品ID递增分配，二分找到第一个更大的ID所在槽位，清掉之前的位
+            bitmap &= ~((1 << bisect.bisect_right(self.ids, after)) - 1)
+        ids, found = self.ids, []
+        for offset, byte in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')):
+            if byte:
+                found.extend(ids[offset * 8 + bit] for bit in _BYTE_BITS[byte])
+                if limit is not None and len(found) >= limit:
+                    return found[:limit]
+        return found
+
+
+# ---------------------- 构建与维护 ----------------------
+_state = {'index': None, 'version': None, 'own_bumps': 0, 'built_at': 0, 'rebuilding': False}
+_state_lock = threading.Lock()
+_dirty = set()  # 本进程已提交修改、尚未刷新到索引的商品ID
+
+
+def _version():
+    return read_version(_VERSION_KEY)
+
+
+def _load(index, product_ids=None):
+    """读取商品（product_ids 为 None 时读取全部）写入索引，返回处理的商品数"""
+    products = db.session.query(Product.id, Product.name, Product.price, Product.stock_quantity,
+                                Product.category_id, Product.nutrient_type, Product.average_rating,
+                                Product.review_count, Product.is_active)
+    if product_ids is not None:
+        products = products.filter(Product.id.in_(product_ids))
+
+    found = set()
+    for product_id, name, price, stock, category_id, nutrient_type, rating, reviews, active \
+            in products.order_by(Product.id):
+        found.add(product_id)
+        if active:
+            index.set(product_id, name, facet_values(float(price), stock, category_id, nutrient_type,
+                                                     float(rating) if reviews else None))
+        else:
+            index.remove(product_id)
+    for product_id in set(product_ids or ()) - found:  # 已删除
+        index.remove(product_id)
+    return len(found)
+
+
+def rebuild():
+    """全量重建并整体替换索引，返回上架商品数"""
+    with _state_lock:
+        version = _version()
+        _state['own_bumps'] = 0  # 此后本进程的 +1 从该版本起算
+    index = FacetIndex()
+    _load(index)
+    with _state_lock:
+        _state.update(index=index, version=version + _state['own_bumps'], own_bumps=0,
+                      built_at=time.monotonic())
+    metrics.inc('facet_index_rebuilds_total')
+    return len(index)
+
+
+def _rebuild_in_background():
+    """其他 worker 修改了商品/评价：后台重建，重建期间继续使用旧索引"""
+    with _state_lock:
+        if _state['rebuilding'] or time.monotonic() - _state['built_at'] < current_app.config['FACET_REBUILD_SECONDS']:
+            return
+        _state['rebuilding'] = True
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                rebuild()
+        except Exception as e:
+            app.logger.error(f'分面索引重建失败: {str(e)}')
+        finally:
+            _state['rebuilding'] = False
+
+    threading.Thread(target=run, name='facet-rebuild', daemon=True).start()
+
+
+def mark_stale():
+    """批量语句改变了分面取值（如商品变为缺货）时调用：当前事务提交后各 worker 的索引失效"""
+    mark_changed(_VERSION_KEY)
+
+
+@on_commit(Product, key=lambda p: p.id)
+@on_commit(Review, key=lambda r: r.product_id)
+def _mark_products(product_ids):
+    # 提交后回调中不能再查询，先记下，下次查询时刷新；其他 worker 通过版本号发现
+    bump(_VERSION_KEY)
+    with _state_lock:
+        _dirty.update(product_ids)
+        _state['own_bumps'] += 1
+
+
+def get_index():
+    """返回当前索引：首次调用时同步构建，之后先刷新本进程修改过的商品"""
+    if _state['index'] is None:
+        with _state_lock:
+            if _state['index'] is None:
+                _state.update(index=FacetIndex(), version=_version(), own_bumps=0, built_at=time.monotonic())
+                _load(_state['index'])
+                _dirty.clear()
+
+    index = _state['index']
+    if _dirty:
+        with _state_lock:
+            product_ids = set(_dirty)
+            _dirty.difference_update(product_ids)
+        _load(index, product_ids)
+        metrics.inc('facet_index_updates_total', len(product_ids))
+
+    with _state_lock:
+        # 持锁读取：计数在 +1 之后才累加，版本号等于 构建时版本 + 计数 即说明没有其他来源的修改
+        version = _version()
+        stale = version != _state['version'] + _state['own_bumps']
+        if not stale:  # 全是本进程的修改，已刷新（或仍在 _dirty 中等待下次刷新）
+            _state.update(version=version, own_bumps=0)
+    if stale:
+        _rebuild_in_background()
+    return index
+
+
+# ---------------------- 请求参数 ----------------------
+def parse_selection(args):
+    """从查询参数读取各分面的选择：category_id / price / stock / rating / nutrient，均可多选"""
+    selection = {facet: [v for v in args.getlist(facet) if v] for facet in FACETS if facet != 'category'}
+    selection['category'] = [v for v in args.getlist('category_id') if v and v != 'all']
+    return {facet: values for facet, values in selection.items() if values}
+
+
+def sql_conditions(selection, search=None):
+    """
+    与位图筛选等价的 SQL 条件：匹配商品太多、不宜展开成 IN 列表时，
+    由数据库按排序列索引边过滤边分页；无法识别的取值与位图一样匹配不到商品
+    """
+    config = current_app.config
+    conditions = []
+    if search:
+        conditions.append(func.lower(Product.name).contains(search.lower(), autoescape=True))
+    if 'category' in selection:
+        conditions.append(Product.category_id.in_([int(v) for v in selection['category'] if v.isdigit()]))
+    if 'price' in selection:
+        ranges = []
+        for value in set(selection['price']) & set(price_buckets()):
+            low, high = value.split('-')
+            ranges.append(and_(Product.price >= int(low), Product.price < int(high)) if high
+                          else Product.price >= int(low))
+        conditions.append(or_(*ranges) if ranges else false())
+    if 'stock' in selection:
+        stock = {'in': Product.stock_quantity > 0, 'out': Product.stock_quantity <= 0}
+        chosen = [stock[v] for v in set(selection['stock']) & set(stock)]
+        conditions.append(or_(*chosen) if chosen else false())
+    if 'rating' in selection:
+        # 多选档位取并集，即不低于其中最小的档位
+        bands = [band for band in config['FACET_RATING_BANDS'] if str(band) in selection['rating']]
+        conditions.append(and_(Product.review_count > 0, Product.average_rating >= min(bands)) if bands else false())
+    if 'nutrient' in selection:
+        conditions.append(Product.nutrient_type.in_(selection['nutrient']))
+    return conditions
+
+
+def facet_options(result, selection):
+    """页面展示用的分面选项（分类在左侧分类列表中展示，不在此列出）"""
+    config = current_app.config
+    labels = {
+        'price': {value: (f'¥{value[:-1]} 以上' if value.endswith('-') else f'¥{value}') for value in price_buckets()},
+        'stock': {'in': '有货', 'out': '缺货'},
+        'rating': {str(band): f'{band} 星及以上' for band in config['FACET_RATING_BANDS']},
+        'nutrient': config['NUTRIENT_TYPES']
+    }
+    titles = {'price': '价格', 'stock': '库存', 'rating': '评分', 'nutrient': '营养素'}
+    return [{
+        'name': facet,
+        'title': titles[facet],
+        'options': [{'value': value, 'label': label, 'count': result.counts[facet].get(value, 0),
+                     'selected': value in selection.get(facet, ())}
+                    for value, label in labels[facet].items()]
+    } for facet in titles]
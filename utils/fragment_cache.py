@@ -0,0 +1,60 @@
+# utils/fragment_cache.py
+# =============================================
+# Jinja 模板片段缓存
+# 用法：
+#   {% cache 'category_sidebar', cache_version('categories') %} ... {% endcache %}
+#   {% cache ['product_cards', page, category_id], cache_version('products') %} ... {% endcache %}
+# - 第一个参数为片段键：字符串，或以片段名开头的列表（其余元素区分同一片段的不同变体）
+# - 第二个参数为版本：一般用 cache_version(表名...)，相关表提交修改后版本变化，旧片段不再命中
+# - 片段保存在有容量上限的 LRU 中；按片段名统计命中/未命中
+# 片段内容不能依赖当前用户等未写进键里的变量
+# =============================================
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from utils import metrics
+from utils.cache import LRUCache
+from utils.cache_versions import version_stamp
+
+_fragments = LRUCache('template_fragments', maxsize=500)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, version %} ... {% endcache %}"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args), [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, key, version, caller):
+        parts = tuple(key) if isinstance(key, (list, tuple)) else (key,)
+        name = str(parts[0])
+        cache_key = (parts, version)
+
+        html = _fragments.get(cache_key)
+        metrics.inc('fragment_cache_requests_total', fragment=name, result='miss' if html is None else 'hit')
+        if html is None:
+            html = caller()
+            _fragments.set(cache_key, html)
+        return Markup(html)
+
+
+def clear():
+    """清空全部片段"""
+    _fragments.clear()
+
+
+def init_app(app):
+    """注册模板扩展与 cache_version() 模板函数"""
+    _fragments.maxsize = app.config['FRAGMENT_CACHE_SIZE']
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['cache_version'] = version_stamp
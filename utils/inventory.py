@@ -0,0 +1,250 @@
+# utils/inventory.py
+# =============================================
+# 库存操作模块
+# - 以集合方式（一条 UPDATE）批量调整库存，避免逐条查询商品
+# - 下单扣减使用带条件的 UPDATE（stock >= 数量），不先读后写，并发下不会超卖
+# - 秒杀热卖商品可开启库存分片（products.is_sharded）：库存分散在 product_stock_shards 的 N 行中，
+#   扣减时随机挑一个余量足够的分片，并发订单落在不同行上，不再争抢 products 的同一行锁
+# - 后台任务定期把各分片重新均分，并把总数回写 products.stock_quantity 供列表与低库存提醒使用；
+#   商品详情与 to_dict 读取各分片之和（短时缓存）
+# - 扣减与归还库存只有让商品在有货/缺货之间切换时才使分面索引失效，其余库存变化不触发各 worker 全量重建
+# =============================================
+
+import random
+import click
+from flask import current_app
+from sqlalchemy import func, case, update
+from models.database import db
+from models.models import Product, ProductStockShard, OrderItem
+from utils import metrics, facets
+from utils.background import register_job
+from utils.cache import LRUCache
+
+
+class OutOfStock(Exception):
+    """库存不足"""
+
+    def __init__(self, product):
+        super().__init__(f'产品 {product.name} 库存不足')
+        self.product = product
+
+
+_totals = LRUCache('stock_totals', maxsize=1024, ttl=2)
+
+
+# ---------------------- 分片读取 ----------------------
+def stock_total(product_id):
+    """分片商品的可售总量（各分片之和，短时缓存）"""
+    total = _totals.get(product_id)
+    if total is None:
+        total = int(db.session.query(func.coalesce(func.sum(ProductStockShard.quantity), 0))
+                    .filter(ProductStockShard.product_id == product_id).scalar())
+        _totals.set(product_id, total)
+    return total
+
+
+def _distribute(total, shards):
+    """把 total 尽量均分成 shards 份"""
+    base, extra = divmod(max(total, 0), shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+# ---------------------- 扣减与归还 ----------------------
+def _decrement_shard(product_id, shard, quantity):
+    result = db.session.execute(
+        update(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id, ProductStockShard.shard == shard,
+               ProductStockShard.quantity >= quantity)
+        .values(quantity=ProductStockShard.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _take_from_shards(product_id, quantity):
+    """
+    从分片中扣减库存，成功返回 True
+    先随机尝试余量足够的单个分片；都不够时（库存已碎片化）按分片编号顺序逐个凑齐，
+    固定顺序避免与其他凑单事务互相死锁。部分扣减由调用方回滚
+    """
+    shards = db.session.query(ProductStockShard.shard, ProductStockShard.quantity) \
+        .filter(ProductStockShard.product_id == product_id, ProductStockShard.quantity > 0).all()
+    candidates = [shard for shard, available in shards if available >= quantity]
+    random.shuffle(candidates)
+    for shard in candidates:
+        if _decrement_shard(product_id, shard, quantity):
+            return True
+        metrics.inc('stock_shard_conflicts_total')
+
+    need = quantity
+    for shard, available in sorted(shards):
+        take = min(need, available)
+        if take and _decrement_shard(product_id, shard, take):
+            need -= take
+            if need == 0:
+                metrics.inc('stock_shard_split_takes_total')
+                return True
+    return False
+
+
+def reserve_stock(items):
+    """
+    下单扣减库存，items 为 [(商品, 数量)]
+    按商品ID顺序扣减（固定加锁顺序），任一商品不足时抛出 OutOfStock，调用方负责回滚
+    """
+    decremented = []
+    for product, quantity in sorted(items, key=lambda item: item[0].id):
+        if product.is_sharded:
+            ok = _take_from_shards(product.id, quantity)
+            _totals.delete(product.id)
+        else:
+            ok = db.session.execute(
+                update(Product)
+                .where(Product.id == product.id, Product.stock_quantity >= quantity)
+                .values(stock_quantity=Product.stock_quantity - quantity)
+                .execution_options(synchronize_session=False)
+            ).rowcount == 1
+            decremented.append(product.id)
+        if not ok:
+            raise OutOfStock(product)
+    # 这些行已被本事务锁定，读到的就是扣减后的值；扣到 0 即由有货变为缺货
+    if decremented and db.session.query(Product.id) \
+            .filter(Product.id.in_(decremented), Product.stock_quantity <= 0).first():
+        facets.mark_stale()
+
+
+def _return_to_shards(product_id, quantity):
+    """归还到随机一个分片，由后台任务重新均分"""
+    shards = [shard for (shard,) in db.session.query(ProductStockShard.shard)
+              .filter(ProductStockShard.product_id == product_id)]
+    if not shards:
+        return False
+    db.session.execute(
+        update(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id, ProductStockShard.shard == random.choice(shards))
+        .values(quantity=ProductStockShard.quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    _totals.delete(product_id)
+    return True
+
+
+def restore_stock_for_orders(order_ids):
+    """
+    归还一批订单占用的库存
+    先按商品汇总订单项数量，再用一条 CASE UPDATE 回补；分片商品归还到其分片中
+    返回归还的商品件数
+    """
+    if not order_ids:
+        return 0
+
+    rows = db.session.query(
+        OrderItem.product_id,
+        func.sum(OrderItem.quantity)
+    ).filter(OrderItem.order_id.in_(order_ids)) \
+     .group_by(OrderItem.product_id) \
+     .all()
+    quantities = {product_id: int(quantity) for product_id, quantity in rows}
+    if not quantities:
+        return 0
+
+    sharded = {product_id for (product_id,) in db.session.query(Product.id)
+               .filter(Product.id.in_(quantities.keys()), Product.is_sharded == True)}
+    # 分片行已被删除（刚关闭分片）时退回到 products 行
+    sharded = {product_id for product_id in sharded if _return_to_shards(product_id, quantities[product_id])}
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+    if plain:
+        Product.query.filter(Product.id.in_(plain.keys())).update(
+            {Product.stock_quantity: Product.stock_quantity + case(plain, value=Product.id, else_=0)},
+            synchronize_session=False
+        )
+        # 归还前不大于 0、归还后大于 0 即由缺货变为有货
+        returned = case(plain, value=Product.id, else_=0)
+        if db.session.query(Product.id).filter(Product.id.in_(plain.keys()), Product.stock_quantity > 0,
+                                               Product.stock_quantity - returned <= 0).first():
+            facets.mark_stale()
+    return sum(quantities.values())
+
+
+# ---------------------- 开启 / 关闭 / 调整分片 ----------------------
+def _locked_shards(product_id):
+    return ProductStockShard.query.filter_by(product_id=product_id) \
+        .order_by(ProductStockShard.shard).with_for_update().all()
+
+
+def enable_sharding(product, shards=None):
+    """把商品当前库存均分到 shards 个分片（默认 STOCK_SHARDS），之后下单只扣分片"""
+    shards = shards or current_app.config['STOCK_SHARDS']
+    product = Product.query.filter_by(id=product.id).with_for_update().one()
+    if product.is_sharded:
+        return product
+    for shard, quantity in enumerate(_distribute(product.stock_quantity, shards)):
+        db.session.add(ProductStockShard(product_id=product.id, shard=shard, quantity=quantity))
+    product.is_sharded = True
+    _totals.delete(product.id)
+    return product
+
+
+def disable_sharding(product):
+    """把各分片库存合并回 products.stock_quantity 并删除分片"""
+    product = Product.query.filter_by(id=product.id).with_for_update().one()
+    if not product.is_sharded:
+        return product
+    shards = _locked_shards(product.id)
+    product.stock_quantity = sum(s.quantity for s in shards)
+    for shard in shards:
+        db.session.delete(shard)
+    product.is_sharded = False
+    _totals.delete(product.id)
+    return product
+
+
+def set_sharded_stock(product, total):
+    """后台直接设置分片商品的总库存（重新均分到现有分片）"""
+    shards = _locked_shards(product.id)
+    for shard, quantity in zip(shards, _distribute(total, len(shards))):
+        shard.quantity = quantity
+    product.stock_quantity = total
+    _totals.delete(product.id)
+
+
+def rebalance_shards():
+    """
+    把每个分片商品的库存重新均分，并把总数回写 products.stock_quantity
+    每个商品一个短事务；返回处理的商品数
+    """
+    product_ids = [product_id for (product_id,) in db.session.query(Product.id).filter(Product.is_sharded == True)]
+    db.session.commit()
+    for product_id in product_ids:
+        shards = _locked_shards(product_id)
+        if shards:
+            total = sum(s.quantity for s in shards)
+            for shard, quantity in zip(shards, _distribute(total, len(shards))):
+                shard.quantity = quantity
+            product = db.session.get(Product, product_id)
+            if product.stock_quantity != total:
+                product.stock_quantity = total
+        db.session.commit()
+        _totals.delete(product_id)
+    metrics.inc('stock_shard_rebalances_total', len(product_ids))
+    return len(product_ids)
+
+
+def init_app(app):
+    """注册命令行入口并登记分片均衡任务"""
+
+    @app.cli.command('stock-shards')
+    @click.argument('product_id', type=int)
+    @click.option('--shards', type=int, default=None, help='分片数，默认 STOCK_SHARDS')
+    @click.option('--off', is_flag=True, help='合并分片，恢复为单行库存')
+    def stock_shards_command(product_id, shards, off):
+        """为秒杀商品开启（或关闭）库存分片"""
+        product = db.session.get(Product, product_id)
+        if product is None:
+            raise SystemExit(f'商品 {product_id} 不存在')
+        product = disable_sharding(product) if off else enable_sharding(product, shards)
+        db.session.commit()
+        state = f'已开启，{len(product.stock_shards)} 个分片' if product.is_sharded else '已关闭'
+        print(f'{product.name} 库存分片{state}，当前库存 {product.available_stock}')
+
+    register_job(app, 'stock-shard-rebalance', app.config.get('STOCK_REBALANCE_INTERVAL_SECONDS', 0), rebalance_shards)
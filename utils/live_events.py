@@ -0,0 +1,245 @@
+# utils/live_events.py
+# =============================================
+# 订单状态实时推送（Server-Sent Events）
+# - 频道：user:<用户ID>（本人订单）与 admins（全部订单、仪表盘计数）；浏览器用 EventSource 订阅，页面原地更新状态，不再整页刷新
+# - 进程内扇出：每个 SSE 连接一个有界队列，事件按频道分发到各队列；队列满时丢弃最旧的事件，慢客户端不拖累发布方
+# - 跨 worker 由可替换的后端负责（EVENTS_BACKEND）：
+#     memory       只在本进程内分发（单进程开发环境）
+#     shared_store 事件按递增序号写入共享存储，各进程有订阅者时由一个线程按 EVENTS_POLL_INTERVAL 拉取后本地分发
+#     也可填写 '模块:类名' 使用自定义后端（如 Redis pub/sub），需实现 start(dispatch, has_subscribers)、
+#     publish(message)，可选 on_subscribe()（有新连接时调用）
+# - 连接每 EVENTS_HEARTBEAT_SECONDS 发送一次注释行作为心跳，满 EVENTS_STREAM_SECONDS 后主动断开让客户端重连；
+#   单进程连接数超过 EVENTS_MAX_SUBSCRIBERS 时返回 503 + Retry-After，客户端按指数退避重连
+# - 只有订单相关页面订阅；EVENTS_ENABLED 为假时不输出订阅地址，连接请求返回 204（EventSource 收到后不再重连）
+# 注意：每个 SSE 连接占用一个线程，需以多线程方式运行（gunicorn gthread / gevent worker），sync worker 下应关闭
+# =============================================
+
+import json
+import time
+import queue
+import itertools
+import threading
+from datetime import datetime
+from flask import current_app, Response
+from werkzeug.utils import import_string
+from utils import metrics
+from utils.shared_store import get_store
+
+ADMIN_CHANNEL = 'admins'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+# ---------------------- 进程内扇出 ----------------------
+class Subscriber:
+    """一个 SSE 连接：订阅的频道与待发送事件队列"""
+
+    def __init__(self, channels, size):
+        self.channels = set(channels)
+        self.queue = queue.Queue(maxsize=size)
+
+    def put(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()  # 丢弃最旧的事件
+                    metrics.inc('live_events_dropped_total')
+                except queue.Empty:
+                    pass
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self, channels, size, limit):
+        """新增订阅，连接数已达 limit 时返回 None"""
+        with self._lock:
+            if len(self._subscribers) >= limit:
+                return None
+            subscriber = Subscriber(channels, size)
+            self._subscribers.add(subscriber)
+        metrics.set_gauge('live_event_subscribers', len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        metrics.set_gauge('live_event_subscribers', len(self._subscribers))
+
+    def dispatch(self, message):
+        """把一条消息 {'id', 'channel', 'event', 'data'} 放入订阅了该频道的各连接队列"""
+        with self._lock:
+            targets = [s for s in self._subscribers if message['channel'] in s.channels]
+        for subscriber in targets:
+            subscriber.put(message)
+
+
+# ---------------------- 跨进程后端 ----------------------
+class MemoryBackend:
+    """只在本进程内分发"""
+
+    def __init__(self, app):
+        self._ids = itertools.count(1)
+        self._dispatch = None
+
+    def start(self, dispatch, has_subscribers):
+        self._dispatch = dispatch
+
+    def publish(self, message):
+        message['id'] = next(self._ids)
+        self._dispatch(message)
+
+
+class SharedStoreBackend:
+    """
+    事件写入共享存储：live_events:seq 为最新序号，live_events:<序号> 为事件内容（保留 EVENTS_RETENTION_SECONDS）
+    发布方自身也经由拉取线程分发，各进程看到的顺序一致
+    发布时先取序号再写内容，拉取时序号已有而内容未写入的事件在之后的每次拉取中重试，超过保留时间才放弃
+    """
+
+    _SEQ_KEY = 'live_events:seq'
+    _PREFIX = 'live_events:'
+
+    def __init__(self, app):
+        self.interval = app.config['EVENTS_POLL_INTERVAL']
+        self.retention = app.config['EVENTS_RETENTION_SECONDS']
+        self._dispatch = None
+        self._has_subscribers = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, dispatch, has_subscribers):
+        self._dispatch = dispatch
+        self._has_subscribers = has_subscribers
+
+    def publish(self, message):
+        store = get_store()
+        message['id'] = store.incr(self._SEQ_KEY)
+        store.set(f"{self._PREFIX}{message['id']}", json.dumps(message), ttl=self.retention)
+
+    def on_subscribe(self):
+        """有订阅者时确保拉取线程在运行；没有订阅者后线程自行退出"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._poll, name='live-events-poll', daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        store = get_store()
+        last = store.get(self._SEQ_KEY, 0)  # 只分发订阅之后发布的事件
+        missing = {}  # 序号 -> 首次发现内容缺失的时间
+        while True:
+            with self._lock:
+                if not self._has_subscribers():
+                    self._thread = None
+                    return
+            time.sleep(self.interval)
+            latest = store.get(self._SEQ_KEY, 0)
+            seqs = sorted(missing) + list(range(last + 1, latest + 1))
+            if not seqs:
+                continue
+            found = store.get_many(f'{self._PREFIX}{seq}' for seq in seqs)
+            now = time.monotonic()
+            for seq in seqs:
+                data = found.get(f'{self._PREFIX}{seq}')
+                if data is not None:
+                    missing.pop(seq, None)
+                    self._dispatch(json.loads(data))
+                elif now - missing.setdefault(seq, now) > self.retention:
+                    # 发布方在取序号后异常退出，或事件已过期
+                    del missing[seq]
+                    metrics.inc('live_events_dropped_total')
+            last = max(last, latest)
+
+
+BACKENDS = {'memory': MemoryBackend, 'shared_store': SharedStoreBackend}
+
+_broker = Broker()
+_backend = None
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        app = current_app._get_current_object()
+        name = app.config['EVENTS_BACKEND'] or ('shared_store' if app.config.get('SHARED_STORE_PATH') else 'memory')
+        backend = (BACKENDS.get(name) or import_string(name.replace(':', '.')))(app)
+        backend.start(_broker.dispatch, lambda: len(_broker) > 0)
+        _backend = backend
+    return _backend
+
+
+# ---------------------- 发布 ----------------------
+def publish(channels, event, data):
+    """向若干频道发布一个事件；应在事务提交之后调用"""
+    backend = _get_backend()
+    for channel in channels:
+        backend.publish({'channel': channel, 'event': event, 'data': data})
+    metrics.inc('live_events_published_total', len(channels), event=event)
+
+
+def order_status_changed(order, previous=None):
+    """订单状态变化：推送给下单用户与管理员"""
+    try:
+        publish([user_channel(order.user_id), ADMIN_CHANNEL], 'order_status', {
+            'order_id': order.id,
+            'user_id': order.user_id,
+            'status': order.status,
+            'previous': previous,
+            'at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except Exception as e:
+        # 推送失败不影响已提交的业务操作
+        current_app.logger.error(f'订单状态推送失败: {str(e)}')
+
+
+# ---------------------- 订阅（SSE 响应） ----------------------
+def _format(message):
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {json.dumps(message['data'], ensure_ascii=False)}\n\n"
+
+
+def stream(channels):
+    """返回订阅 channels 的 text/event-stream 响应"""
+    config = current_app.config
+    if not config['EVENTS_ENABLED']:
+        return Response(status=204)
+    backend = _get_backend()
+    subscriber = _broker.subscribe(channels, config['EVENTS_QUEUE_SIZE'], config['EVENTS_MAX_SUBSCRIBERS'])
+    if subscriber is None:
+        retry_after = config['EVENTS_RETRY_SECONDS']
+        return Response('连接数已满，请稍后重试', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(retry_after)})
+    if hasattr(backend, 'on_subscribe'):
+        backend.on_subscribe()
+
+    heartbeat, lifetime = config['EVENTS_HEARTBEAT_SECONDS'], config['EVENTS_STREAM_SECONDS']
+    retry_ms = config['EVENTS_RETRY_SECONDS'] * 1000
+
+    def generate():
+        deadline = time.monotonic() + lifetime
+        try:
+            yield f'retry: {retry_ms}\n\n'
+            while time.monotonic() < deadline:
+                try:
+                    message = subscriber.queue.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.1)))
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield _format(message)
+        finally:
+            # 客户端断开时 WSGI 服务器关闭生成器，在此注销
+            _broker.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
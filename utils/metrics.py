@@ -0,0 +1,341 @@
+# utils/metrics.py
+# =============================================
+# 指标收集与 Prometheus 导出模块
+# - 计数器、仪表值、汇总（次数+总和）、直方图，进程内线程安全
+# - 请求耗时直方图（按蓝图端点、方法、状态码），每个端点的 SQL 次数与耗时
+# - 连接池借出等待时间与使用率、缓存命中率、后台队列深度
+# - 多进程：每个进程把自己的指标写入 METRICS_MULTIPROC_DIR，
+#   /metrics 抓取时汇总所有进程文件（计数类求和，仪表值按 pid 区分）
+# =============================================
+
+import os
+import json
+import time
+import threading
+from flask import g, request, current_app, has_request_context, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LOOPBACK = ('127.0.0.1', '::1')  # 未配置 METRICS_TOKEN 时允许访问 /metrics 的地址
+
+# 请求耗时默认分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+_counters = {}    # (name, labels) -> 累计值
+_gauges = {}      # (name, labels) -> 当前值
+_summaries = {}   # (name, labels) -> [次数, 总和]
+_histograms = {}  # (name, labels) -> [各桶计数..., 次数, 总和]
+_buckets = {}     # name -> 分桶上界
+
+_last_flush = 0.0
+_engine = None    # 当前应用的数据库引擎，用于读取连接池状态
+
+
+def _key(name, labels):
+    """指标名 + 排序后的标签元组，作为字典键"""
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """计数器累加"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """设置仪表值（如队列深度、批次大小）"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def add_gauge(name, delta, **labels):
+    """仪表值增减（如进行中的任务数）"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name, value, **labels):
+    """记录一次观测值（如耗时秒数），累计次数与总和"""
+    key = _key(name, labels)
+    with _lock:
+        summary = _summaries.setdefault(key, [0, 0.0])
+        summary[0] += 1
+        summary[1] += value
+
+
+def histogram(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """记录一次观测值到直方图"""
+    key = _key(name, labels)
+    with _lock:
+        bounds = _buckets.setdefault(name, tuple(buckets))
+        data = _histograms.get(key)
+        if data is None:
+            data = _histograms[key] = [0] * len(bounds) + [0, 0.0]
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                data[i] += 1
+        data[-2] += 1
+        data[-1] += value
+
+
+def snapshot():
+    """返回当前进程所有指标的拷贝"""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'summaries': {k: tuple(v) for k, v in _summaries.items()},
+            'histograms': {k: tuple(v) for k, v in _histograms.items()},
+            'buckets': dict(_buckets)
+        }
+
+
+# ---------------------- 多进程汇总 ----------------------
+def _serialize(snap):
+    return {
+        'counters': [[n, list(l), v] for (n, l), v in snap['counters'].items()],
+        'gauges': [[n, list(l), v] for (n, l), v in snap['gauges'].items()],
+        'summaries': [[n, list(l), list(v)] for (n, l), v in snap['summaries'].items()],
+        'histograms': [[n, list(l), list(v)] for (n, l), v in snap['histograms'].items()],
+        'buckets': {n: list(b) for n, b in snap['buckets'].items()}
+    }
+
+
+def flush(directory):
+    """把本进程指标写入共享目录（原子替换）"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(_serialize(snapshot()), f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(directory=None):
+    """
+    汇总指标：未配置目录时只返回本进程；
+    配置目录时合并所有进程文件，计数/汇总/直方图求和（退出进程的累计值保留），
+    仪表值只保留存活进程并加 pid 标签
+    """
+    if not directory:
+        return snapshot()
+
+    flush(directory)
+    merged = {'counters': {}, 'gauges': {}, 'summaries': {}, 'histograms': {}, 'buckets': {}}
+    for filename in os.listdir(directory):
+        if not (filename.startswith('metrics-') and filename.endswith('.json')):
+            continue
+        pid = int(filename[len('metrics-'):-len('.json')])
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        for name, labels, value in data['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for kind in ('summaries', 'histograms'):
+            for name, labels, values in data[kind]:
+                key = (name, tuple(map(tuple, labels)))
+                previous = merged[kind].get(key)
+                merged[kind][key] = tuple(values) if previous is None else tuple(a + b for a, b in zip(previous, values))
+        if _pid_alive(pid):
+            for name, labels, value in data['gauges']:
+                key = (name, tuple(sorted(map(tuple, labels + [['pid', str(pid)]]))))
+                merged['gauges'][key] = value
+        merged['buckets'].update({n: tuple(b) for n, b in data['buckets'].items()})
+    return merged
+
+
+# ---------------------- Prometheus 文本格式 ----------------------
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _cache_ratios(counters):
+    """由 cache_requests_total 计算各缓存命中率"""
+    totals = {}
+    for (name, labels), value in counters.items():
+        if name != 'cache_requests_total':
+            continue
+        label_map = dict(labels)
+        hit, total = totals.get(label_map.get('cache'), (0, 0))
+        totals[label_map.get('cache')] = (hit + (value if label_map.get('result') == 'hit' else 0), total + value)
+    return {(('cache', cache),): hit / total for cache, (hit, total) in totals.items() if total}
+
+
+def render_prometheus(data):
+    """把汇总结果渲染为 Prometheus 文本格式"""
+    lines = []
+
+    def group(items):
+        by_name = {}
+        for (name, labels), value in sorted(items.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        return by_name.items()
+
+    for name, series in group(data['counters']):
+        lines.append(f'# TYPE {name} counter')
+        lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in series)
+
+    gauges = dict(data['gauges'])
+    gauges.update({('cache_hit_ratio', labels): ratio for labels, ratio in _cache_ratios(data['counters']).items()})
+    for name, series in group(gauges):
+        lines.append(f'# TYPE {name} gauge')
+        lines.extend(f'{name}{_format_labels(labels)} {value}' for labels, value in series)
+
+    for name, series in group(data['summaries']):
+        lines.append(f'# TYPE {name} summary')
+        for labels, (count, total) in series:
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+
+    for name, series in group(data['histograms']):
+        bounds = data['buckets'].get(name, ())
+        lines.append(f'# TYPE {name} histogram')
+        for labels, values in series:
+            for bound, count in zip(bounds, values):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_bound(bound))])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {values[-2]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# ---------------------- SQL 与连接池埋点 ----------------------
+def _sql_endpoint():
+    return (request.endpoint or 'unmatched') if has_request_context() else 'background'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    endpoint = _sql_endpoint()
+    inc('sql_queries_total', endpoint=endpoint)
+    inc('sql_query_seconds_total', elapsed, endpoint=endpoint)
+
+
+def _wrap_pool(pool):
+    """包装连接池的 connect()，统计借出连接的等待时间"""
+    if getattr(pool, '_metrics_wrapped', False):
+        return
+    original_connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return original_connect()
+        finally:
+            histogram('db_pool_checkout_wait_seconds', time.perf_counter() - started,
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+    pool.connect = timed_connect
+    pool._metrics_wrapped = True
+
+
+def _instrument_pool(engine):
+    _wrap_pool(engine.pool)
+    # dispose() 会重建连接池，重建后重新包装（监听器每个引擎只注册一次）
+    if not getattr(engine, '_metrics_dispose_hooked', False):
+        engine._metrics_dispose_hooked = True
+        event.listen(engine, 'engine_disposed', lambda disposed_engine: _wrap_pool(disposed_engine.pool))
+
+
+def _record_pool_gauges(engine):
+    pool = engine.pool if engine is not None else None
+    if not hasattr(pool, 'checkedout'):
+        return
+    size = pool.size()
+    checked_out = pool.checkedout()
+    set_gauge('db_pool_size', size)
+    set_gauge('db_pool_checked_out', checked_out)
+    set_gauge('db_pool_overflow', max(pool.overflow(), 0))
+    set_gauge('db_pool_utilization', checked_out / size if size else 0)
+
+
+# ---------------------- 请求钩子 ----------------------
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+    blueprint = endpoint.rsplit('.', 1)[0] if '.' in endpoint else 'app'
+    histogram('http_request_duration_seconds', time.perf_counter() - started,
+              blueprint=blueprint, endpoint=endpoint, method=request.method, status=response.status_code)
+
+    # 多进程模式下每秒最多写一次本进程文件
+    global _last_flush
+    directory = current_app.config.get('METRICS_MULTIPROC_DIR')
+    now = time.monotonic()
+    if directory and now - _last_flush > 1:
+        _last_flush = now
+        _record_pool_gauges(_engine)
+        try:
+            flush(directory)
+        except OSError as e:
+            current_app.logger.error(f'写入指标文件失败: {str(e)}')
+    return response
+
+
+def init_app(app):
+    """注册请求埋点、连接池埋点与 /metrics 接口（应在其他 after_request 之前注册，以便最后执行）"""
+    global _engine
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+    with app.app_context():
+        from models.database import db
+        _engine = db.engine
+        _instrument_pool(_engine)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """
+        Prometheus 抓取接口；配置 METRICS_TOKEN 时需携带 Bearer 令牌，
+        未配置时只允许本机直接访问（经反向代理转发、带 X-Forwarded-For 的请求一律拒绝）
+        """
+        token = app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(401)
+        elif request.remote_addr not in _LOOPBACK or 'X-Forwarded-For' in request.headers:
+            abort(403)
+        _record_pool_gauges(_engine)
+        data = collect(app.config.get('METRICS_MULTIPROC_DIR'))
+        return Response(render_prometheus(data), mimetype='text/plain; version=0.0.4')
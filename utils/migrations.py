@@ -0,0 +1,124 @@
+# utils/migrations.py
+# =============================================
+# 数据库迁移模块
+# migrations/ 目录下按编号命名的脚本依次执行，每个脚本提供 upgrade(conn)；
+# 已执行的版本记录在 schema_migrations 表中
+# 辅助函数都先检查结构是否已存在，create_all 建出的新库也可以安全执行；
+# 早期 create_all 建出的库缺少的表（如 payments）由对应的迁移补建，可直接升级到最新结构
+# =============================================
+
+import os
+import importlib.util
+from datetime import datetime
+from sqlalchemy import inspect, text, Table, Column, MetaData, String, DateTime
+from models.database import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), '..', 'migrations')
+
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(64), primary_key=True),  # 迁移编号，如 0001_order_expiry_index
+    Column('applied_at', DateTime, nullable=False)    # 执行时间
+)
+
+
+# ---------------------- 结构辅助函数 ----------------------
+def has_table(conn, table):
+    return inspect(conn).has_table(table)
+
+
+def has_column(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+
+def has_index(conn, table, name, columns=None):
+    """按名称查找索引/唯一约束；给出 columns 时列完全相同的未命名索引也算存在"""
+    insp = inspect(conn)
+    existing = [(i['name'], i['column_names']) for i in insp.get_indexes(table)]
+    existing += [(u['name'], u['column_names']) for u in insp.get_unique_constraints(table)]
+    return any(n == name or (columns and list(cols) == list(columns)) for n, cols in existing)
+
+
+def add_column(conn, table, column, ddl):
+    """ddl 为列定义，如 'VARCHAR(64) NULL'"""
+    if has_table(conn, table) and not has_column(conn, table, column):
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def create_index(conn, table, name, columns, unique=False):
+    if has_table(conn, table) and not has_index(conn, table, name, columns):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        conn.execute(text(f'CREATE {kind} {name} ON {table} ({", ".join(columns)})'))
+
+
+def drop_index(conn, table, name):
+    if has_table(conn, table) and has_index(conn, table, name):
+        if conn.dialect.name == 'mysql':
+            conn.execute(text(f'DROP INDEX {name} ON {table}'))
+        else:
+            conn.execute(text(f'DROP INDEX {name}'))
+
+
+# ---------------------- 执行器 ----------------------
+def _load_migrations():
+    """按文件名顺序加载迁移脚本，返回 [(版本号, 模块)]"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not filename.endswith('.py') or not filename[:4].isdigit():
+            continue
+        version = filename[:-3]
+        spec = importlib.util.spec_from_file_location(f'migrations_{version}', os.path.join(MIGRATIONS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((version, module))
+    return migrations
+
+
+def applied_versions(conn):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def upgrade():
+    """执行所有未执行的迁移，返回本次执行的版本号列表"""
+    executed = []
+    with db.engine.begin() as conn:
+        done = applied_versions(conn)
+
+    for version, module in _load_migrations():
+        if version in done:
+            continue
+        # 每个迁移单独一个事务（MySQL 的 DDL 会隐式提交，执行前后都检查结构保证可重入）
+        with db.engine.begin() as conn:
+            module.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+        executed.append(version)
+    return executed
+
+
+def status():
+    """返回 [(版本号, 说明, 是否已执行)]"""
+    with db.engine.begin() as conn:
+        done = applied_versions(conn)
+    return [(version, (module.__doc__ or '').strip(), version in done)
+            for version, module in _load_migrations()]
+
+
+def init_app(app):
+    """注册迁移相关命令"""
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """执行未完成的数据库迁移"""
+        executed = upgrade()
+        for version in executed:
+            print(f'已执行迁移 {version}')
+        if not executed:
+            print('数据库已是最新版本')
+
+    @app.cli.command('db-status')
+    def db_status_command():
+        """查看迁移执行情况"""
+        for version, description, applied in status():
+            print(f"[{'x' if applied else ' '}] {version}  {description}")
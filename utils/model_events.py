@@ -0,0 +1,43 @@
+# utils/model_events.py
+# =============================================
+# 模型变更的提交后回调
+# 在 flush 时记录指定模型被新增/修改/删除的实例对应的键（如 product_id），
+# 事务提交成功后再按模型分发给回调，用于缓存失效；回滚则丢弃
+# 注意：query.update() / query.delete() 批量语句不经过 flush，不会触发
+# =============================================
+
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_handlers = {}  # 模型类 -> [(取键函数, 回调)]
+
+
+def on_commit(model, key):
+    """
+    装饰器：model 的实例变更并提交后，以本次涉及的键集合调用被装饰函数
+    key 为从实例取键的函数，在 flush 时调用（此时属性仍可访问）
+    """
+    def decorator(func):
+        _handlers.setdefault(model, []).append((key, func))
+        return func
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for index, (key, _) in enumerate(_handlers.get(type(obj), ())):
+            pending = session.info.setdefault('model_events', {})
+            pending.setdefault((type(obj), index), set()).add(key(obj))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    for (model, index), keys in session.info.pop('model_events', {}).items():
+        _handlers[model][index][1](keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('model_events', None)
@@ -4,21 +4,23 @@ from email.mime.text import MIMEText
 from email.header import Header
 from threading import Thread
 from flask import current_app
+from sqlalchemy import or_
 from models.models import Product
+from utils import metrics
 
 
 def check_low_stock():
-    """检查低库存商品"""
-    low_stock_products = Product.query.filter(
-        Product.stock_quantity <= 10,
+    """检查低库存商品（分片商品按各分片之和判断）"""
+    low_stock_products = [product for product in Product.query.filter(
+        or_(Product.stock_quantity <= 10, Product.is_sharded == True),
         Product.is_active == True
-    ).all()
+    ).all() if product.available_stock <= 10]
 
     if low_stock_products:
         # 发送邮件通知管理员
         message = "以下商品库存不足：\n\n"
         for product in low_stock_products:
-            message += f"{product.name} - 当前库存: {product.stock_quantity}\n"
+            message += f"{product.name} - 当前库存: {product.available_stock}\n"
 
         send_email_async(
             to=current_app.config['ADMIN_EMAIL'],
@@ -67,9 +69,15 @@ def send_email_async(to,subject,content):
             server.login(current_app.config['MAIL_USERNAME'],current_app.config['MAIL_PASSWORD'])
             server.send_message(msg)
             server.quit()
+            metrics.inc('emails_sent_total', result='success')
         except Exception as e:
+            metrics.inc('emails_sent_total', result='failed')
             current_app.logger.error(f'发送邮件失败: {str(e)}')
+        finally:
+            metrics.add_gauge('background_queue_depth', -1, queue='email')
 
+    # 进行中的邮件线程数即邮件队列深度
+    metrics.add_gauge('background_queue_depth', 1, queue='email')
     thread = Thread(target=send_email)
     thread.start()
 
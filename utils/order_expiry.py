@@ -0,0 +1,80 @@
+# utils/order_expiry.py
+# =============================================
+# 超时未支付订单清理模块
+# 按 (status, created_at) 索引分批查找过期的 pending 订单，
+# 批量取消并归还库存，同时记录指标
+# =============================================
+
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from models.database import db
+from models.models import Order
+from utils.inventory import restore_stock_for_orders
+from utils.background import register_job
+from utils import metrics
+
+
+def sweep_expired_orders(expire_minutes=None, batch_size=None, max_batches=None):
+    """
+    取消超时未支付的订单并归还库存
+    每批最多 batch_size 条，单独提交事务；返回本次取消的订单数
+    """
+    config = current_app.config
+    expire_minutes = expire_minutes or config['ORDER_EXPIRE_MINUTES']
+    batch_size = batch_size or config['ORDER_SWEEP_BATCH_SIZE']
+    max_batches = max_batches or config['ORDER_SWEEP_MAX_BATCHES']
+    cutoff = datetime.now() - timedelta(minutes=expire_minutes)
+
+    started = time.perf_counter()
+    expired_total = 0
+
+    for _ in range(max_batches):
+        # 走 (status, created_at) 索引；已被其他进程锁定的行直接跳过
+        order_ids = [row.id for row in db.session.query(Order.id)
+                     .filter(Order.status == 'pending', Order.created_at < cutoff)
+                     .order_by(Order.created_at)
+                     .limit(batch_size)
+                     .with_for_update(skip_locked=True)
+                     .all()]
+        if not order_ids:
+            break
+
+        # 带状态条件更新，防止与支付并发时误取消
+        updated = Order.query.filter(
+            Order.id.in_(order_ids),
+            Order.status == 'pending'
+        ).update({Order.status: 'cancelled'}, synchronize_session=False)
+
+        if updated != len(order_ids):
+            # 批次内有订单状态已变化，整批回滚后重新查找
+            db.session.rollback()
+            metrics.inc('order_sweep_conflicts_total')
+            continue
+
+        restored_units = restore_stock_for_orders(order_ids)
+        db.session.commit()
+
+        expired_total += updated
+        metrics.inc('orders_expired_total', updated)
+        metrics.inc('order_sweep_stock_restored_total', restored_units)
+        metrics.inc('order_sweep_batches_total')
+
+        if len(order_ids) < batch_size:
+            break
+
+    metrics.observe('order_sweep_seconds', time.perf_counter() - started)
+    metrics.set_gauge('order_sweep_last_expired', expired_total)
+    return expired_total
+
+
+def init_app(app):
+    """注册命令行入口并登记后台清理任务"""
+
+    @app.cli.command('expire-orders')
+    def expire_orders_command():
+        """立即清理一次超时未支付订单"""
+        count = sweep_expired_orders()
+        print(f'已取消 {count} 个超时订单')
+
+    register_job(app, 'order-expiry-sweeper', app.config.get('ORDER_SWEEP_INTERVAL_SECONDS', 0), sweep_expired_orders)
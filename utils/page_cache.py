@@ -0,0 +1,185 @@
+# utils/page_cache.py
+# =============================================
+# 匿名访问的整页缓存
+# - 只缓存未登录用户的 GET 请求，键为 路径 + 规范化后的查询参数（排序、去掉空值与 utm_* 等追踪参数）
+# - 每个页面带若干代理键（surrogate key），如 product:3、category:2、announcement；
+#   后台修改提交后对应代理键的版本号 +1，带有该键的页面立即失效（版本号在共享存储中，所有 worker 一致）
+# - 过期后在 PAGE_CACHE_STALE_TTL 内先返回旧页面，同时在后台线程重新渲染（stale-while-revalidate）
+# - 响应头 X-Page-Cache: HIT / STALE / MISS
+# 注意：query.update() 批量语句（如库存归还）不经过 flush，不会触发失效，最多延迟 PAGE_CACHE_TTL 秒
+# =============================================
+
+import time
+import secrets
+import threading
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, session, current_app, g, make_response, Response
+from flask_login import current_user
+from sqlalchemy import inspect
+from models.models import Product, Category, Review, Announcement
+from utils import metrics
+from utils.cache import LRUCache
+from utils.model_events import on_commit
+from utils.shared_store import get_store
+
+_TAG_PREFIX = 'page_tag:'
+_REVALIDATE_HEADER = 'X-Page-Cache-Revalidate'
+_revalidate_token = secrets.token_hex(16)  # 只接受本进程发起的后台重新渲染请求
+
+_pages = LRUCache('pages', maxsize=2000)
+_revalidating = set()
+_lock = threading.Lock()
+
+
+# ---------------------- 代理键 ----------------------
+def add_tags(*tags):
+    """
+    在视图中为当前页面追加代理键，应在读取对应数据之前调用：
+    追加时即记下各键的版本号，渲染期间提交的修改会让这次存入的页面立即失效
+    """
+    versions = g.get('_page_tags')
+    if versions is None:  # 当前请求不写入缓存
+        return
+    new = [tag for tag in tags if tag not in versions]
+    if new:
+        versions.update(_tag_versions(new))
+
+
+def purge(*tags):
+    """让带有这些代理键的页面全部失效"""
+    store = get_store()
+    for tag in tags:
+        store.incr(_TAG_PREFIX + tag)
+    metrics.inc('page_cache_purges_total', len(tags))
+
+
+def _tag_versions(tags):
+    found = get_store().get_many(_TAG_PREFIX + tag for tag in tags)
+    return {tag: found.get(_TAG_PREFIX + tag, 0) for tag in tags}
+
+
+# ---------------------- 请求判断 ----------------------
+def _cache_key():
+    """路径 + 规范化的查询参数"""
+    ignored = current_app.config['PAGE_CACHE_IGNORED_PARAMS']
+    params = sorted((k, v) for k, v in request.args.items(multi=True)
+                    if v != '' and k not in ignored and not k.startswith('utm_'))
+    return f'{request.path}?{urlencode(params)}'
+
+
+def _cacheable_request():
+    # 有待显示的闪现消息时页面内容与会话相关，不走缓存
+    return (current_app.config['PAGE_CACHE_ENABLED'] and request.method == 'GET'
+            and not current_user.is_authenticated and '_flashes' not in session)
+
+
+def _respond(entry, state):
+    response = Response(entry['body'], status=entry['status'], headers=entry['headers'])
+    response.headers['X-Page-Cache'] = state
+    response.headers['Age'] = str(int(time.time() - entry['stored_at']))
+    metrics.inc('page_cache_requests_total', result=state.lower())
+    return response
+
+
+def revalidating():
+    """当前请求是否为本进程发起的后台重新渲染（不是访客的请求）"""
+    return request.headers.get(_REVALIDATE_HEADER) == _revalidate_token
+
+
+def _revalidate(key):
+    """在后台线程中以匿名身份重新请求该页面，刷新缓存"""
+    with _lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.test_client() as client:
+                client.get(key, headers={_REVALIDATE_HEADER: _revalidate_token})
+        except Exception as e:
+            app.logger.error(f'页面后台刷新失败 {key}: {str(e)}')
+        finally:
+            with _lock:
+                _revalidating.discard(key)
+
+    threading.Thread(target=run, name='page-cache-revalidate', daemon=True).start()
+
+
+# ---------------------- 装饰器 ----------------------
+def cached_page(tags=None, ttl=None):
+    """
+    缓存匿名用户看到的页面
+    tags 为代理键列表，或接收视图参数、返回代理键列表的函数；视图内还可调用 add_tags() 追加
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _cacheable_request():
+                return view(*args, **kwargs)
+
+            key = _cache_key()
+            entry = None if revalidating() else _pages.get(key)
+            if entry is not None and _tag_versions(entry['tags']) == entry['tags']:
+                age = time.time() - entry['stored_at']
+                if age < entry['ttl']:
+                    return _respond(entry, 'HIT')
+                _revalidate(key)
+                return _respond(entry, 'STALE')
+
+            # 代理键的版本号在调用视图之前读取：渲染期间的修改会使版本号变化，存入的页面下次读取即失效
+            g._page_tags = {}
+            add_tags(*(tags(**kwargs) if callable(tags) else tags or ()))
+            response = make_response(view(*args, **kwargs))
+            response.vary.add('Cookie')
+            # 视图修改了会话（如写入闪现消息）时不缓存，避免把个人状态发给其他访客
+            if response.status_code == 200 and not response.direct_passthrough and not session.modified:
+                page_ttl = ttl or current_app.config['PAGE_CACHE_TTL']
+                _pages.set(key, {
+                    'body': response.get_data(),
+                    'status': response.status_code,
+                    'headers': [(k, v) for k, v in response.headers.items() if k.lower() != 'set-cookie'],
+                    'stored_at': time.time(),
+                    'ttl': page_ttl,
+                    'tags': g.pop('_page_tags')
+                }, ttl=page_ttl + current_app.config['PAGE_CACHE_STALE_TTL'])
+            response.headers['X-Page-Cache'] = 'MISS'
+            metrics.inc('page_cache_requests_total', result='miss')
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------------- 后台修改后失效 ----------------------
+def _previous(obj, attr):
+    """flush 时取属性修改前的值（未修改则为当前值）"""
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+@on_commit(Product, key=lambda p: (f'product:{p.id}', f'category:{p.category_id}',
+                                   f'category:{_previous(p, "category_id")}'))
+def _purge_products(tag_groups):
+    purge('category:all', 'ranking', 'facets', *{tag for group in tag_groups for tag in group})
+
+
+@on_commit(Category, key=lambda c: f'category:{c.id}')
+def _purge_categories(tags):
+    purge('categories', *tags)
+
+
+@on_commit(Review, key=lambda r: f'product:{r.product_id}')
+def _purge_reviews(tags):
+    purge('ranking', 'facets', *tags)
+
+
+@on_commit(Announcement, key=lambda a: 'announcement')
+def _purge_announcement(tags):
+    purge(*tags)
+
+
+def init_app(app):
+    """按配置调整缓存容量"""
+    _pages.maxsize = app.config['PAGE_CACHE_SIZE']
@@ -0,0 +1,159 @@
+# utils/passwords.py
+# =============================================
+# 密码哈希（bcrypt）
+# - 使用 models/database.py 中初始化的 Flask-Bcrypt，成本因子由 BCRYPT_LOG_ROUNDS 配置（每加一耗时翻倍），
+#   可用 flask bench-bcrypt 在目标机器上测量各成本因子的耗时后选择
+# - 哈希与验证在每个进程一个有界线程池中执行（bcrypt 计算期间释放 GIL）：
+#   同时计算的数量不超过 PASSWORD_HASH_WORKERS，不会因登录高峰占满所有请求线程的 CPU；
+#   排队数超过 PASSWORD_HASH_QUEUE_SIZE 或等待超过 PASSWORD_HASH_TIMEOUT 时抛出 HashingBusy，返回 503 + Retry-After
+# - 旧数据中的明文密码在登录验证通过后改存为 bcrypt 哈希；成本因子调整后，旧哈希同样在登录时按新成本因子重新哈希
+# 注意：bcrypt 只使用密码的前 72 字节，超出部分在哈希前截断（与 bcrypt 4.1 之前的行为一致）
+# =============================================
+
+import os
+import hmac
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import click
+from flask import current_app, request, jsonify, Response
+from models.database import bcrypt
+from utils import metrics
+
+_MAX_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """哈希线程池排队已满或等待超时"""
+
+
+# ---------------------- 有界线程池 ----------------------
+_pool = {'executor': None, 'slots': None, 'pid': None}
+_pool_lock = threading.Lock()
+_depth = 0  # 已提交、尚未完成的任务数（计算中 + 排队中）
+
+
+def _get_pool():
+    """按进程创建线程池（预派生部署时主进程中创建的线程不会带到 worker 中）"""
+    if _pool['pid'] != os.getpid():
+        with _pool_lock:
+            if _pool['pid'] != os.getpid():
+                config = current_app.config
+                workers = config['PASSWORD_HASH_WORKERS']
+                _pool.update(executor=ThreadPoolExecutor(workers, thread_name_prefix='password-hash'),
+                             slots=threading.BoundedSemaphore(workers + config['PASSWORD_HASH_QUEUE_SIZE']),
+                             pid=os.getpid())
+    return _pool['executor'], _pool['slots']
+
+
+def _release(slots):
+    global _depth
+    with _pool_lock:
+        _depth -= 1
+        metrics.set_gauge('password_hash_queue_depth', _depth)
+    slots.release()
+
+
+def _run(operation, func, *args):
+    """在线程池中执行 func 并等待结果；排队已满或超时抛出 HashingBusy"""
+    global _depth
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        metrics.inc('password_hash_rejected_total', reason='queue_full')
+        raise HashingBusy()
+    with _pool_lock:
+        _depth += 1
+        metrics.set_gauge('password_hash_queue_depth', _depth)
+
+    start = time.perf_counter()
+    try:
+        future = executor.submit(func, *args)
+    except Exception:
+        _release(slots)
+        raise
+    # 超时返回后任务仍会执行完，完成时才释放名额
+    future.add_done_callback(lambda _: _release(slots))
+    try:
+        result = future.result(timeout=current_app.config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        metrics.inc('password_hash_rejected_total', reason='timeout')
+        raise HashingBusy()
+    metrics.observe('password_hash_seconds', time.perf_counter() - start, operation=operation)
+    return result
+
+
+# ---------------------- 哈希与验证 ----------------------
+def _encode(password):
+    return (password or '').encode('utf-8')[:_MAX_BYTES]
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(('$2a$', '$2b$', '$2y$'))
+
+
+def _rounds(stored):
+    return int(stored.split('$')[2])
+
+
+def hash_password(password):
+    """返回 bcrypt 哈希字符串"""
+    return _run('hash', lambda: bcrypt.generate_password_hash(_encode(password)).decode('utf-8'))
+
+
+def verify_password(stored, password):
+    """
+    验证密码，返回 (是否正确, 是否需要重新哈希)
+    stored 不是 bcrypt 哈希时视为旧的明文密码，按常数时间比较
+    """
+    if not stored or password is None:
+        return False, False
+    if not is_hashed(stored):
+        matched = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+        return matched, matched
+    matched = _run('verify', bcrypt.check_password_hash, stored, _encode(password))
+    return matched, matched and _rounds(stored) != current_app.config['BCRYPT_LOG_ROUNDS']
+
+
+# ---------------------- 成本因子测量 ----------------------
+def benchmark(rounds_range, samples=3):
+    """在当前线程中测量各成本因子单次哈希的耗时（取中位数），返回 [(成本因子, 毫秒)]"""
+    import bcrypt as _bcrypt
+    results = []
+    for rounds in rounds_range:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            _bcrypt.hashpw(b'benchmark-password', _bcrypt.gensalt(rounds=rounds))
+            timings.append((time.perf_counter() - start) * 1000)
+        results.append((rounds, sorted(timings)[samples // 2]))
+    return results
+
+
+def init_app(app):
+    """注册 HashingBusy 的错误处理与命令行入口"""
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        retry_after = {'Retry-After': str(app.config['PASSWORD_HASH_RETRY_SECONDS'])}
+        if request.is_json:
+            return jsonify({'error': '登录人数过多，请稍后再试'}), 503, retry_after
+        return Response('登录人数过多，请稍后再试', status=503, mimetype='text/plain', headers=retry_after)
+
+    @app.cli.command('bench-bcrypt')
+    @click.option('--min-rounds', type=int, default=10, help='最小成本因子')
+    @click.option('--max-rounds', type=int, default=14, help='最大成本因子')
+    @click.option('--target-ms', type=float, default=250, help='单次哈希可接受的最长耗时（毫秒）')
+    def bench_bcrypt_command(min_rounds, max_rounds, target_ms):
+        """测量各 bcrypt 成本因子的单次哈希耗时，给出不超过目标耗时的最大成本因子"""
+        results = benchmark(range(min_rounds, max_rounds + 1))
+        for rounds, ms in results:
+            print(f'rounds={rounds:<3} {ms:8.1f} ms')
+        fitting = [rounds for rounds, ms in results if ms <= target_ms]
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        if fitting:
+            best = max(fitting)
+            ms = dict(results)[best]
+            print(f'建议 BCRYPT_LOG_ROUNDS={best}（当前 {app.config["BCRYPT_LOG_ROUNDS"]}），'
+                  f'每个进程约可处理 {workers * 1000 / ms:.1f} 次登录/秒')
+        else:
+            print(f'所有成本因子均超过 {target_ms} ms，请调低 --min-rounds 或提高 --target-ms')
@@ -0,0 +1,102 @@
+# utils/payments.py
+# =============================================
+# 支付处理模块
+# - 幂等键：按 (用户, 键) 唯一，同一个键只会生成一条支付记录，重试/重复提交直接返回该记录；
+#   键已用于该用户的其他订单时抛出 IdempotencyConflict，不会把其他订单的结果当作本次支付结果
+# - 条件更新：订单 pending→paid 在 UPDATE 的 WHERE 中校验；
+#   余额扣减走余额流水（utils/balance.py），只锁该用户的快照行，不使用全局锁
+# - 金额统一使用 Decimal
+# =============================================
+
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy.exc import IntegrityError
+from models.database import db
+from models.models import Order, Payment
+from utils import balance, metrics, product_stats, dashboard_counters
+
+BALANCE_METHOD = '余额支付'
+
+
+class IdempotencyConflict(Exception):
+    """幂等键已用于其他订单"""
+
+
+def new_idempotency_key():
+    """客户端未提供幂等键时生成一个随机键"""
+    return uuid.uuid4().hex
+
+
+def _replay(existing, order):
+    """重复提交：返回之前的支付记录；键属于其他订单时抛出 IdempotencyConflict"""
+    if existing.order_id != order.id:
+        metrics.inc('payment_attempts_total', result='conflict')
+        raise IdempotencyConflict()
+    metrics.inc('payment_attempts_total', result='replayed')
+    return existing, True
+
+
+def pay_order_with_balance(order, user_id, idempotency_key):
+    """
+    使用账户余额支付订单，返回 (支付记录, 是否为重复提交)
+    成功：payment.status == 'success'；失败：'failed' 并带 failure_reason
+    重复提交时订单状态未被本次调用修改，调用方不应再次发布状态变化
+    """
+    # 幂等键命中 (用户, 键) 唯一索引，直接返回之前的结果
+    existing = Payment.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
+    if existing:
+        return _replay(existing, order)
+
+    amount = Decimal(order.total_amount)
+    payment = Payment(
+        order_id=order.id,
+        user_id=user_id,
+        payment_method=BALANCE_METHOD,
+        amount=amount,
+        status='pending',
+        idempotency_key=idempotency_key
+    )
+    db.session.add(payment)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # 并发的相同幂等键请求已写入，返回那一条
+        db.session.rollback()
+        return _replay(Payment.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).one(), order)
+
+    savepoint = db.session.begin_nested()
+    failure_reason = None
+
+    # 订单状态条件更新：并发支付同一订单时只有一个能成功
+    updated = Order.query.filter(
+        Order.id == order.id,
+        Order.status == 'pending'
+    ).update({Order.status: 'paid'}, synchronize_session=False)
+
+    if not updated:
+        current_status = db.session.query(Order.status).filter(Order.id == order.id).scalar()
+        failure_reason = '订单已支付' if current_status == 'paid' else '订单当前状态无法支付'
+    else:
+        # 余额扣减：追加一条支付流水，余额不足时整体回滚到保存点
+        try:
+            balance.debit(user_id, amount, 'payment', reference=f'payment:{payment.id}')
+        except balance.InsufficientBalance:
+            failure_reason = '余额不足'
+
+    if failure_reason:
+        savepoint.rollback()
+        payment.status = 'failed'
+        payment.failure_reason = failure_reason
+    else:
+        savepoint.commit()
+        # 状态由批量 UPDATE 修改，不经过 flush，这里直接计入销量
+        product_stats.add_sales([order.id])
+        dashboard_counters.status_changed(order, 'pending', 'paid')
+        payment.status = 'success'
+        payment.transaction_id = uuid.uuid4().hex
+        payment.paid_at = datetime.now()
+
+    db.session.commit()
+    metrics.inc('payment_attempts_total', result=payment.status)
+    return payment, False
@@ -0,0 +1,176 @@
+# utils/product_stats.py
+# =============================================
+# 商品统计列（反范式）与列表排序
+# - products.sales_count：已支付及之后状态（COUNTED_STATUSES）订单中的购买件数
+# - products.average_rating / review_count：全部评价的平均分与条数
+# - 订单状态进出 COUNTED_STATUSES、评价新增/修改/删除时，在同一次 flush 内用一条 UPDATE 修正，
+#   与业务数据同事务提交；支付使用批量 UPDATE 改状态，不经过 flush，由 payments 直接调用 add_sales
+# - 列表按 价格 / 销量 / 评分 / 上架时间 排序时直接走 (is_active, 排序列) 索引，
+#   不再像排行榜那样每次聚合 order_items 与 reviews；JSON 接口支持 (排序列, id) 游标分页
+# 注意：直接删除已支付订单（如删除用户）不会回减销量，可用 flask rebuild-product-stats 全量校正
+# =============================================
+
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import event, select, update, func, case, or_, and_, inspect
+from sqlalchemy.orm import Session
+from models.database import db
+from models.models import Product, Order, OrderItem, Review
+from utils import facets
+
+COUNTED_STATUSES = ('paid', 'confirmed', 'shipped', 'delivered')
+
+_products = Product.__table__
+_order_items = OrderItem.__table__
+_reviews = Review.__table__
+
+
+# ---------------------- 销量 ----------------------
+def add_sales(order_ids, sign=1, connection=None):
+    """把订单中各商品的件数计入销量（sign=-1 时扣除），返回涉及的商品数"""
+    conn = connection if connection is not None else db.session
+    rows = conn.execute(select(_order_items.c.product_id, func.sum(_order_items.c.quantity))
+                        .where(_order_items.c.order_id.in_(order_ids))
+                        .group_by(_order_items.c.product_id))
+    deltas = {product_id: int(quantity) * sign for product_id, quantity in rows}
+    if deltas:
+        conn.execute(update(_products).where(_products.c.id.in_(deltas.keys()))
+                     .values(sales_count=_products.c.sales_count + case(deltas, value=_products.c.id, else_=0)))
+    return len(deltas)
+
+
+@event.listens_for(Order.status, 'set', active_history=True)
+def _load_previous_status(target, value, oldvalue, initiator):
+    # active_history：赋值前先加载旧值（提交后属性已过期），flush 时 history 中才有修改前的状态
+    return value
+
+
+def _status_deltas(session):
+    """本次 flush 中状态进出 COUNTED_STATUSES 的订单 {订单ID: +1 / -1}"""
+    deltas = {}
+    for order in session.new:
+        if isinstance(order, Order) and order.status in COUNTED_STATUSES:
+            deltas[order.id] = 1
+    for order in session.dirty:
+        if not isinstance(order, Order):
+            continue
+        history = inspect(order).attrs.status.history
+        if history.deleted:
+            delta = (order.status in COUNTED_STATUSES) - (history.deleted[0] in COUNTED_STATUSES)
+            if delta:
+                deltas[order.id] = delta
+    return deltas
+
+
+# ---------------------- 评分 ----------------------
+def refresh_ratings(product_ids, connection=None):
+    """按 reviews 重新计算若干商品的平均分与评价数"""
+    conn = connection if connection is not None else db.session
+    product_ids = [product_id for product_id in product_ids if product_id is not None]
+    if not product_ids:
+        return
+    matching = _reviews.c.product_id == _products.c.id
+    conn.execute(update(_products).where(_products.c.id.in_(product_ids)).values(
+        review_count=select(func.count()).where(matching).scalar_subquery(),
+        average_rating=select(func.coalesce(func.avg(_reviews.c.rating), 0)).where(matching).scalar_subquery()
+    ))
+
+
+@event.listens_for(Review.product_id, 'set', active_history=True)
+def _load_previous_product(target, value, oldvalue, initiator):
+    return value
+
+
+def _rated_products(session):
+    """本次 flush 中评价有变化的商品ID（含改到其他商品前的原商品）"""
+    product_ids = set()
+    for review in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(review, Review):
+            product_ids.add(review.product_id)
+            product_ids.update(inspect(review).attrs.product_id.history.deleted)
+    return product_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _maintain(session, flush_context):
+    # 此时各语句已执行、尚未提交，修正语句与业务数据在同一事务内
+    deltas = _status_deltas(session)
+    rated = _rated_products(session)
+    if not deltas and not rated:
+        return
+    conn = session.connection()
+    for sign in (1, -1):
+        order_ids = [order_id for order_id, delta in deltas.items() if delta == sign]
+        if order_ids:
+            add_sales(order_ids, sign, connection=conn)
+    refresh_ratings(rated, connection=conn)
+
+
+def rebuild_stats():
+    """按订单与评价全量重算所有商品的统计列，返回商品数"""
+    sold = select(func.coalesce(func.sum(_order_items.c.quantity), 0)) \
+        .select_from(_order_items.join(Order.__table__, Order.__table__.c.id == _order_items.c.order_id)) \
+        .where(_order_items.c.product_id == _products.c.id, Order.__table__.c.status.in_(COUNTED_STATUSES)) \
+        .scalar_subquery()
+    db.session.execute(update(_products).values(sales_count=sold))
+    product_ids = [product_id for (product_id,) in db.session.execute(select(_products.c.id))]
+    refresh_ratings(product_ids)
+    facets.mark_stale()  # 评分档位可能变化
+    db.session.commit()
+    return len(product_ids)
+
+
+# ---------------------- 排序与游标 ----------------------
+def _decimal(raw):
+    try:
+        return Decimal(raw)
+    except ArithmeticError:
+        raise ValueError(raw)
+
+
+# 排序名 -> (排序列, 是否倒序, 游标值解析)；同值再按 id 同方向排序，保证顺序稳定
+SORTS = {
+    'price_asc': (Product.price, False, _decimal),
+    'price_desc': (Product.price, True, _decimal),
+    'sales': (Product.sales_count, True, int),
+    'rating': (Product.average_rating, True, _decimal),
+    'newest': (Product.created_at, True, datetime.fromisoformat),
+}
+
+
+def apply_sort(query, sort):
+    """按排序名加 ORDER BY；未知排序名按商品ID（上架顺序）"""
+    if sort not in SORTS:
+        return query.order_by(Product.id)
+    column, descending, _ = SORTS[sort]
+    if descending:
+        return query.order_by(column.desc(), Product.id.desc())
+    return query.order_by(column, Product.id)
+
+
+def encode_cursor(product, sort):
+    if sort not in SORTS:
+        return str(product.id)
+    value = getattr(product, SORTS[sort][0].key)
+    return f"{value.isoformat() if isinstance(value, datetime) else value}_{product.id}"
+
+
+def apply_cursor(query, sort, cursor):
+    """取游标之后的商品，游标格式不正确时抛出 ValueError"""
+    if sort not in SORTS:
+        return query.filter(Product.id > int(cursor))
+    column, descending, parse = SORTS[sort]
+    raw, product_id = cursor.rsplit('_', 1)
+    value, product_id = parse(raw), int(product_id)
+    if descending:
+        return query.filter(or_(column < value, and_(column == value, Product.id < product_id)))
+    return query.filter(or_(column > value, and_(column == value, Product.id > product_id)))
+
+
+def init_app(app):
+    """注册命令行入口"""
+
+    @app.cli.command('rebuild-product-stats')
+    def rebuild_product_stats_command():
+        """按订单与评价全量重算商品的销量、平均分与评价数"""
+        print(f'已重算 {rebuild_stats()} 个商品的统计列')
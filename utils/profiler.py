@@ -0,0 +1,238 @@
+# utils/profiler.py
+# =============================================
+# 按请求采样的性能剖析模块
+# - 管理员通过请求头 X-Profile: 1 或查询参数 _profile=1 主动触发
+# - 另可按 PROFILER_SAMPLE_RATE 随机抽样普通请求
+# - 采样线程定期抓取请求线程的调用栈，输出折叠栈（collapsed stacks）
+# - 同时记录本次请求的 SQL 时间线
+# - 结果写入磁盘环形缓冲（最多 PROFILER_MAX_FILES 个文件），在后台页面以火焰图查看
+# =============================================
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import g, request, current_app, has_app_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StackSampler:
+    """在独立线程中按固定间隔抓取目标线程的调用栈"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    """把栈帧转换为 "外层;...;内层" 形式的折叠栈"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# ---------------------- SQL 时间线 ----------------------
+def _active_profile():
+    return g.get('_profile') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profile() is not None:
+        conn.info.setdefault('_profile_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active_profile()
+    starts = conn.info.get('_profile_query_start')
+    if profile is None or not starts:
+        return
+    started = starts.pop()
+    profile['sql'].append({
+        'offset_ms': round((started - profile['started']) * 1000, 2),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        'statement': statement[:1000]
+    })
+
+
+# ---------------------- 请求钩子 ----------------------
+def _trigger():
+    """判断本次请求是否需要剖析，返回触发方式或 None"""
+    if request.endpoint in (None, 'static') or (request.endpoint or '').startswith('admin.profile'):
+        return None
+    if request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1':
+        if current_user.is_authenticated and current_user.is_admin:
+            return 'admin'
+    rate = current_app.config.get('PROFILER_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+def _start_profile():
+    trigger = _trigger()
+    if not trigger:
+        return
+    sampler = StackSampler(threading.get_ident(), current_app.config['PROFILER_INTERVAL'])
+    g._profile = {'trigger': trigger, 'started': time.perf_counter(), 'sql': [], 'sampler': sampler}
+    sampler.start()
+
+
+def _finish_profile(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    profile['sampler'].stop()
+
+    record = {
+        'id': uuid.uuid4().hex,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'trigger': profile['trigger'],
+        'duration_ms': round((time.perf_counter() - profile['started']) * 1000, 2),
+        'interval_ms': current_app.config['PROFILER_INTERVAL'] * 1000,
+        'stacks': dict(profile['sampler'].stacks),
+        'sql': profile['sql']
+    }
+    try:
+        _store(record)
+    except OSError as e:
+        current_app.logger.error(f'保存剖析结果失败: {str(e)}')
+    response.headers['X-Profile-Id'] = record['id']
+    return response
+
+
+def _discard_profile(exc):
+    """请求异常结束时停止采样线程"""
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        profile['sampler'].stop()
+
+
+# ---------------------- 磁盘环形缓冲 ----------------------
+def _directory():
+    directory = current_app.config['PROFILER_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _store(record):
+    """写入新结果，并删除超出上限的最旧文件"""
+    directory = _directory()
+    filename = f"{int(time.time() * 1000):015d}-{record['id']}.json"
+    tmp_path = os.path.join(directory, f'.{filename}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, filename))
+
+    files = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in files[:-current_app.config['PROFILER_MAX_FILES']]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles():
+    """按时间倒序返回已保存结果的摘要"""
+    directory = _directory()
+    profiles = []
+    for name in sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True):
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        record['samples'] = sum(record.pop('stacks').values())
+        record['sql_count'] = len(record.pop('sql'))
+        profiles.append(record)
+    return profiles
+
+
+def load_profile(profile_id):
+    """读取单个结果，不存在时返回 None"""
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    directory = _directory()
+    for name in os.listdir(directory):
+        if name.endswith(f'-{profile_id}.json'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                return json.load(f)
+    return None
+
+
+def collapsed_text(record):
+    """折叠栈文本，可直接交给 flamegraph.pl / speedscope"""
+    return '\n'.join(f'{stack} {count}' for stack, count in sorted(record['stacks'].items()))
+
+
+def flame_graph(stacks, min_width=0.1):
+    """
+    把折叠栈转换为火焰图矩形列表
+    每项包含 depth、x、width（百分比）、samples，宽度小于 min_width% 的节点省略
+    """
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['value'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+
+    total = root['value'] or 1
+    rects = []
+    pending = [(root, 0, 0)]
+    while pending:
+        node, depth, offset = pending.pop()
+        width = node['value'] * 100 / total
+        if width < min_width:
+            continue
+        rects.append({'name': node['name'], 'depth': depth, 'x': offset * 100 / total,
+                      'width': width, 'samples': node['value']})
+        child_offset = offset
+        for child in sorted(node['children'].values(), key=lambda c: c['name']):
+            pending.append((child, depth + 1, child_offset))
+            child_offset += child['value']
+
+    max_depth = max((r['depth'] for r in rects), default=0)
+    return rects, max_depth
+
+
+def init_app(app):
+    """注册请求钩子"""
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
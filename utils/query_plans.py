@@ -0,0 +1,144 @@
+# utils/query_plans.py
+# =============================================
+# 热点查询执行计划检查
+# 对每条热点路由使用的查询执行 EXPLAIN（SQLite 为 EXPLAIN QUERY PLAN），
+# 出现全表扫描或额外排序（filesort / 临时 B 树）即判定失败
+# 新增热点查询时在 _hot_queries() 中登记一条
+# =============================================
+
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
+from models.database import db
+from models.models import (Order, Review, CartItem, Product, Payment, BalanceEntry, ProductRecommendation,
+                           UserRecommendation, ProductStockShard)
+
+
+def _hot_queries():
+    """返回 [(名称, 查询)]，参数取任意合法值即可，计划与具体值无关"""
+    return [
+        ('orders.get_orders',
+         Order.query.filter_by(user_id=1).order_by(Order.created_at.desc())),
+        ('user.user_orders',
+         Order.query.filter_by(user_id=1, status='paid').order_by(Order.created_at.desc()).limit(10)),
+        ('reviews.review_page first page',
+         Review.query.options(joinedload(Review.user)).filter_by(product_id=1, is_verified=True)
+         .order_by(Review.created_at.desc(), Review.id.desc()).limit(6)),
+        ('reviews.review_page cursor',
+         Review.query.options(joinedload(Review.user)).filter_by(product_id=1, is_verified=True)
+         .filter(or_(Review.created_at < datetime.now(), and_(Review.created_at == datetime.now(), Review.id < 100)))
+         .order_by(Review.created_at.desc(), Review.id.desc()).limit(6)),
+        ('products.get_products',
+         Product.query.filter_by(is_active=True).limit(12)),
+        ('products.get_products category',
+         Product.query.filter_by(is_active=True, category_id=1).limit(12)),
+        ('products.get_products sort by sales',
+         Product.query.filter_by(is_active=True).order_by(Product.sales_count.desc(), Product.id.desc()).limit(12)),
+        ('products.get_products sort by price',
+         Product.query.filter_by(is_active=True).order_by(Product.price, Product.id).limit(12)),
+        ('products.get_products sort by rating',
+         Product.query.filter_by(is_active=True).order_by(Product.average_rating.desc(), Product.id.desc()).limit(12)),
+        ('products.get_products sort by newness',
+         Product.query.filter_by(is_active=True).order_by(Product.created_at.desc(), Product.id.desc()).limit(12)),
+        ('products.get_products facets',
+         Product.query.filter_by(is_active=True).filter(Product.id.in_([1, 2, 3])).limit(12)),
+        ('admin.dashboard recent orders',
+         Order.query.order_by(Order.created_at.desc()).limit(10)),
+        ('dashboard_counters.reconcile revenue today',
+         db.session.query(db.func.sum(Order.total_amount))
+         .filter(Order.created_at >= datetime.now(), Order.status.in_(['paid', 'confirmed']))),
+        ('cart.get_cart',
+         CartItem.query.filter_by(user_id=1)),
+        ('cart.add_to_cart',
+         CartItem.query.filter_by(user_id=1, product_id=1)),
+        ('payment.pay_order idempotency',
+         Payment.query.filter_by(user_id=1, idempotency_key='key')),
+        ('order_expiry.sweep_expired_orders',
+         db.session.query(Order.id).filter(Order.status == 'pending', Order.created_at < datetime.now() - timedelta(minutes=30))
+         .order_by(Order.created_at).limit(200)),
+        ('recommendations.bought_together',
+         Product.query.join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id)
+         .filter(ProductRecommendation.product_id == 1, Product.is_active == True)
+         .order_by(ProductRecommendation.rank).limit(6)),
+        ('user_recommendations.for_user',
+         Product.query.join(UserRecommendation, UserRecommendation.product_id == Product.id)
+         .filter(UserRecommendation.user_id == 1, Product.is_active == True)
+         .order_by(UserRecommendation.rank).limit(10)),
+        ('inventory.reserve_stock shards',
+         db.session.query(ProductStockShard.shard, ProductStockShard.quantity)
+         .filter(ProductStockShard.product_id == 1, ProductStockShard.quantity > 0)),
+        ('balance.get_balance tail',
+         db.session.query(db.func.sum(BalanceEntry.amount)).filter(BalanceEntry.user_id == 1, BalanceEntry.id > 0)),
+    ]
+
+
+def _plain(value):
+    """驱动层直接执行时，日期参数转为字符串"""
+    return value.isoformat(' ') if isinstance(value, datetime) else value
+
+
+def _explain_sqlite(conn, sql, params):
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    details = [row[-1] for row in rows]
+    problems = []
+    for detail in details:
+        # "SCAN orders" 为全表扫描；"SCAN orders USING INDEX ..." 为索引扫描
+        if detail.startswith('SCAN ') and 'USING' not in detail and 'CONSTANT ROW' not in detail:
+            problems.append(f'全表扫描: {detail}')
+        if 'USE TEMP B-TREE' in detail:
+            problems.append(f'额外排序: {detail}')
+    return details, problems
+
+
+def _explain_mysql(conn, sql, params):
+    result = conn.exec_driver_sql(f'EXPLAIN {sql}', params)
+    rows = [dict(zip(result.keys(), row)) for row in result.fetchall()]
+    details = [f"{row.get('table')}: type={row.get('type')} key={row.get('key')} extra={row.get('Extra')}" for row in rows]
+    problems = []
+    for row in rows:
+        if row.get('type') == 'ALL':
+            problems.append(f"全表扫描: {row.get('table')}")
+        if 'filesort' in (row.get('Extra') or ''):
+            problems.append(f"额外排序: {row.get('table')}")
+    return details, problems
+
+
+def check_query_plans():
+    """检查所有热点查询，返回 [(名称, 计划明细, 问题列表)]"""
+    results = []
+    with db.engine.connect() as conn:
+        dialect = conn.dialect
+        for name, query in _hot_queries():
+            statement = query.statement if hasattr(query, 'statement') else query
+            compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})  # 展开 IN 列表
+            if dialect.positional:
+                params = tuple(_plain(compiled.params[key]) for key in compiled.positiontup)
+            else:
+                params = {key: _plain(value) for key, value in compiled.params.items()}
+
+            if dialect.name == 'sqlite':
+                details, problems = _explain_sqlite(conn, str(compiled), params)
+            elif dialect.name == 'mysql':
+                details, problems = _explain_mysql(conn, str(compiled), params)
+            else:
+                details, problems = [], [f'不支持的数据库: {dialect.name}']
+            results.append((name, details, problems))
+    return results
+
+
+def init_app(app):
+    """注册执行计划检查命令，存在问题时以非零状态退出，便于在 CI 中执行"""
+
+    @app.cli.command('check-query-plans')
+    def check_query_plans_command():
+        """对热点查询执行 EXPLAIN，发现全表扫描或额外排序时失败"""
+        failed = 0
+        for name, details, problems in check_query_plans():
+            print(f"[{'FAIL' if problems else ' OK '}] {name}")
+            for detail in details:
+                print(f'        {detail}')
+            for problem in problems:
+                print(f'        !! {problem}')
+            failed += bool(problems)
+        if failed:
+            raise SystemExit(f'{failed} 条热点查询的执行计划不符合要求')
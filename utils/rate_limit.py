@@ -0,0 +1,97 @@
+# utils/rate_limit.py
+# =============================================
+# 接口限流（滑动窗口计数）
+# - 每条规则为 RATE_LIMITS 中的 (次数, 窗口秒数)，以装饰器挂在视图上，可叠加多条（如按 IP + 按 IP 与用户名）
+# - 计数按固定窗口存入共享存储，判断时用 上一窗口计数 × 未过去的比例 + 当前窗口计数 近似滑动窗口，
+#   每次请求只需两次键值操作；被拒绝的请求同样计数，持续刷接口的客户端会一直被挡住
+# - 超限返回 429 + Retry-After，在查询数据库之前完成（按用户限流读取的是会话中的用户ID，不加载用户）
+# - 共享存储为进程内字典时各 worker 单独计数；配置 SHARED_STORE_PATH 后所有 worker 共用计数
+# 注意：部署在反向代理之后时需配置 ProxyFix，否则 remote_addr 为代理地址
+# =============================================
+
+import math
+import time
+from functools import wraps
+from flask import current_app, request, session, jsonify, Response
+from utils import metrics
+from utils.shared_store import get_store
+
+_PREFIX = 'rate:'
+
+_SCOPES = {
+    'ip': lambda: request.remote_addr or 'unknown',
+    # 未登录时退回按 IP
+    'user': lambda: f"user:{session['_user_id']}" if session.get('_user_id') else f'ip:{request.remote_addr}'
+}
+
+
+def hit(name, ident, limit, per):
+    """
+    记录一次请求，返回 (是否放行, 建议等待秒数)
+    估算值 = 上一窗口计数 × (1 - 当前窗口已过去的比例) + 当前窗口计数
+    """
+    now = time.time()
+    window = int(now // per)
+    elapsed = now - window * per
+    key = f'{_PREFIX}{name}:{ident}:'
+    store = get_store()
+    current = store.incr(key + str(window), ttl=2 * per)
+    previous = store.get(key + str(window - 1), 0)
+    if previous * (1 - elapsed / per) + current <= limit:
+        return True, 0
+
+    # 当前窗口已超限时要等到下一窗口；否则等上一窗口的权重衰减到放得下
+    if current >= limit or not previous:
+        wait = per - elapsed
+    else:
+        wait = per * (1 - (limit - current) / previous) - elapsed
+    return False, max(1, math.ceil(wait))
+
+
+def _too_many(retry_after):
+    headers = {'Retry-After': str(retry_after)}
+    msg = f'请求过于频繁，请 {retry_after} 秒后再试'
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'error': msg, 'retry_after': retry_after}), 429, headers
+    return Response(msg, status=429, headers=headers, mimetype='text/plain')
+
+
+def rate_limit(name, by='ip', when=None):
+    """
+    按 RATE_LIMITS[name] 限流
+    by 为 'ip' / 'user'，或返回限流键的函数（返回 None 时不计数）；when 返回 False 时本次请求不计数
+    应放在 login_required 之上，被拒绝的请求不再加载用户
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            rule = config['RATE_LIMITS'].get(name)
+            if not config['RATE_LIMIT_ENABLED'] or rule is None or (when is not None and not when()):
+                return view(*args, **kwargs)
+            ident = by() if callable(by) else _SCOPES[by]()
+            if ident is None:
+                return view(*args, **kwargs)
+
+            allowed, retry_after = hit(name, ident, *rule)
+            metrics.inc('rate_limit_requests_total', rule=name, result='allowed' if allowed else 'rejected')
+            if not allowed:
+                return _too_many(retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------------- 常用判断 ----------------------
+def is_post():
+    return request.method == 'POST'
+
+
+def submitted_username():
+    """
+    来源 IP + 登录/注册提交的用户名（防止对单个账号猜密码）
+    带上 IP：他人用同一用户名刷接口时只挡住自己，不会把账号主人锁在外面
+    """
+    data = request.form if request.form else (request.get_json(silent=True) or {})
+    username = (data.get('username') or '').strip().lower()
+    return f'name:{_SCOPES["ip"]()}:{username}' if username else None
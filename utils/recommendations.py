@@ -0,0 +1,218 @@
+# utils/recommendations.py
+# =============================================
+# “经常一起购买”推荐
+# - 批处理任务按订单ID水位线增量读取新订单的商品，构造 订单×商品 的稀疏矩阵 X，
+#   X.T @ X 即本批次的 商品×商品 共同出现次数（对角线为包含该商品的订单数），累加到 product_pair_counts
+# - 只重新计算本批次涉及商品的得分（lift 或 Jaccard），每个商品保留前 K 个写入 product_recommendations
+# - 商品详情页与购物车页直接按主键读取推荐结果
+# 只统计已支付及之后状态的订单；为等待未支付订单被支付或超时取消，
+# 只处理创建时间早于 ORDER_EXPIRE_MINUTES + RECOMMENDATION_SETTLE_MINUTES 的订单
+# numpy / scipy 只在批处理函数中导入，Web 进程读取推荐结果时不加载
+# =============================================
+
+import time
+import click
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, desc, delete
+from sqlalchemy.exc import IntegrityError
+from models.database import db
+from models.models import Order, OrderItem, Product, ProductPairCount, ProductRecommendation, JobState
+from utils import metrics
+from utils.background import register_job
+from utils.page_cache import purge
+
+JOB_NAME = 'cooccurrence'
+COUNTED_STATUSES = ('paid', 'confirmed', 'shipped', 'delivered')
+_CHUNK = 500
+
+
+# ---------------------- 任务状态 ----------------------
+def lock_job_state(name):
+    """读取并锁定任务状态行（不存在时创建），多个 worker 同时执行时串行化"""
+    state = JobState.query.filter_by(name=name).with_for_update().first()
+    if state is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(JobState(name=name, last_id=0, counter=0))
+        except IntegrityError:
+            pass
+        state = JobState.query.filter_by(name=name).with_for_update().first()
+    return state
+
+
+# ---------------------- 计数累加 ----------------------
+def _upsert_counts(rows):
+    """rows 为 [(product_id, other_id, count)]，已存在的行累加 count"""
+    table = ProductPairCount.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted['count'])
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=['product_id', 'other_id'],
+                                          set_={'count': table.c.count + stmt.excluded['count']})
+    for start in range(0, len(rows), 1000):
+        db.session.execute(stmt, [{'product_id': p, 'other_id': o, 'count': c}
+                                  for p, o, c in rows[start:start + 1000]])
+
+
+def _cooccurrence(pairs):
+    """
+    pairs 为 (order_id, product_id) 列表（已去重）
+    返回 (涉及的商品ID数组, COO 格式的共同出现矩阵, 订单数)
+    """
+    import numpy as np
+    from scipy import sparse
+    pairs = np.array(pairs, dtype=np.int64)
+    _, order_index = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, product_index = np.unique(pairs[:, 1], return_inverse=True)
+    orders = order_index.max() + 1
+    X = sparse.csr_matrix((np.ones(len(pairs), dtype=np.int32), (order_index, product_index)),
+                          shape=(orders, len(product_ids)))
+    return product_ids, (X.T @ X).tocoo(), orders
+
+
+# ---------------------- 打分 ----------------------
+def _order_counts(product_ids):
+    """对角线计数：包含各商品的订单数"""
+    counts = {}
+    for start in range(0, len(product_ids), _CHUNK):
+        chunk = product_ids[start:start + _CHUNK]
+        counts.update(db.session.query(ProductPairCount.product_id, ProductPairCount.count)
+                      .filter(ProductPairCount.product_id.in_(chunk),
+                              ProductPairCount.other_id == ProductPairCount.product_id).all())
+    return counts
+
+
+def _score(product_ids, total_orders):
+    """重新计算这些商品的推荐列表"""
+    import numpy as np
+    config = current_app.config
+    top_k, min_support = config['RECOMMENDATION_TOP_K'], config['RECOMMENDATION_MIN_SUPPORT']
+
+    for start in range(0, len(product_ids), _CHUNK):
+        chunk = product_ids[start:start + _CHUNK]
+        rows = db.session.query(ProductPairCount.product_id, ProductPairCount.other_id, ProductPairCount.count) \
+            .filter(ProductPairCount.product_id.in_(chunk)).all()
+        db.session.execute(delete(ProductRecommendation).where(ProductRecommendation.product_id.in_(chunk)))
+        if not rows:
+            continue
+
+        data = np.array(rows, dtype=np.int64)
+        i, j, c = data[:, 0], data[:, 1], data[:, 2].astype(np.float64)
+        keep = (i != j) & (c >= min_support)
+        i, j, c = i[keep], j[keep], c[keep]
+        if not len(i):
+            continue
+
+        counts = _order_counts(np.unique(np.concatenate([i, j])).tolist())
+        n_i = np.array([counts.get(x, 0) for x in i.tolist()], dtype=np.float64)
+        n_j = np.array([counts.get(x, 0) for x in j.tolist()], dtype=np.float64)
+        if config['RECOMMENDATION_SCORE'] == 'jaccard':
+            score = c / np.maximum(n_i + n_j - c, 1)
+        else:
+            score = c * total_orders / np.maximum(n_i * n_j, 1)
+
+        # 按商品分组、组内得分降序，取每组前 K 个
+        order = np.lexsort((-score, i))
+        i, j, score = i[order], j[order], score[order]
+        _, group_start, group_size = np.unique(i, return_index=True, return_counts=True)
+        rank = np.arange(len(i)) - np.repeat(group_start, group_size)
+        top = rank < top_k
+
+        db.session.bulk_insert_mappings(ProductRecommendation, [
+            {'product_id': p, 'rank': r + 1, 'recommended_id': o, 'score': round(s, 6)}
+            for p, r, o, s in zip(i[top].tolist(), rank[top].tolist(), j[top].tolist(), score[top].tolist())
+        ])
+
+
+# ---------------------- 批处理任务 ----------------------
+def update_recommendations(full=False):
+    """
+    增量处理水位线之后的新订单并更新推荐；full=True 时清空后从头重建
+    返回本次处理的订单数
+    """
+    config = current_app.config
+    started = time.perf_counter()
+    state = lock_job_state(JOB_NAME)
+    if full:
+        db.session.execute(delete(ProductRecommendation))
+        db.session.execute(delete(ProductPairCount))
+        state.last_id, state.counter = 0, 0
+
+    cutoff = datetime.now() - timedelta(minutes=config['ORDER_EXPIRE_MINUTES'] + config['RECOMMENDATION_SETTLE_MINUTES'])
+    upper = db.session.query(func.max(Order.id)).filter(Order.id > state.last_id, Order.created_at < cutoff).scalar()
+    if not upper:
+        db.session.commit()
+        return 0
+
+    touched, processed = set(), 0
+    batch = config['RECOMMENDATION_BATCH_ORDERS']
+    while state.last_id < upper:
+        window_end = min(upper, state.last_id + batch)
+        pairs = db.session.query(OrderItem.order_id, OrderItem.product_id).join(Order) \
+            .filter(Order.id > state.last_id, Order.id <= window_end, Order.status.in_(COUNTED_STATUSES)) \
+            .distinct().all()
+        if pairs:
+            product_ids, matrix, orders = _cooccurrence(pairs)
+            _upsert_counts(list(zip(product_ids[matrix.row].tolist(), product_ids[matrix.col].tolist(),
+                                    matrix.data.tolist())))
+            touched.update(product_ids.tolist())
+            state.counter += int(orders)
+            processed += int(orders)
+        state.last_id = window_end
+
+    all_ids = [pid for (pid,) in db.session.query(ProductPairCount.product_id).distinct()] if full else None
+    _score(sorted(all_ids if full else touched), state.counter)
+    db.session.commit()
+
+    # 详情页带有推荐区，刷新相关页面缓存
+    if touched:
+        purge(*(f'product:{pid}' for pid in touched))
+    metrics.inc('recommendation_orders_processed_total', processed)
+    metrics.observe('recommendation_job_seconds', time.perf_counter() - started)
+    return processed
+
+
+# ---------------------- 读取 ----------------------
+def bought_together(product_id, limit=None):
+    """某商品的“经常一起购买”商品（按名次，排除已下架）"""
+    return Product.query.join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id) \
+        .filter(ProductRecommendation.product_id == product_id, Product.is_active == True) \
+        .order_by(ProductRecommendation.rank) \
+        .limit(limit or current_app.config['RECOMMENDATION_TOP_K']).all()
+
+
+def for_cart(product_ids, limit=None):
+    """购物车推荐：合并购物车内各商品的推荐，排除已在购物车中的商品，按最高得分排序"""
+    if not product_ids:
+        return []
+    return db.session.query(Product) \
+        .join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id) \
+        .filter(ProductRecommendation.product_id.in_(product_ids),
+                ProductRecommendation.recommended_id.notin_(product_ids),
+                Product.is_active == True) \
+        .group_by(Product.id) \
+        .order_by(desc(func.max(ProductRecommendation.score))) \
+        .limit(limit or current_app.config['RECOMMENDATION_TOP_K']).all()
+
+
+def summary(product):
+    """推荐区展示用的精简数据"""
+    return {'id': product.id, 'name': product.name, 'price': float(product.price), 'image_url': product.image_url}
+
+
+def init_app(app):
+    """注册命令行入口并登记定时任务"""
+
+    @app.cli.command('build-recommendations')
+    @click.option('--full', is_flag=True, help='清空后从头重建')
+    def build_recommendations_command(full):
+        """处理新订单并更新“经常一起购买”推荐"""
+        print(f'已处理 {update_recommendations(full=full)} 个订单')
+
+    register_job(app, 'recommendations', app.config.get('RECOMMENDATION_INTERVAL_SECONDS', 0), update_recommendations)
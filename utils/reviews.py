@@ -0,0 +1,78 @@
+# utils/reviews.py
+# =============================================
+# 商品评价读取模块
+# - 详情页只内嵌最新的前 N 条已验证评价，其余由评价接口按游标分页加载
+# - 分页使用 (created_at, id) 游标，走 (product_id, is_verified, created_at) 索引，
+#   不随页码增大而变慢
+# - 详情页评价区渲染后的 HTML 片段按商品缓存，评价写入提交后失效；
+#   多进程部署时其他 worker 的片段最多保留 REVIEW_FRAGMENT_TTL 秒
+# =============================================
+
+from datetime import datetime
+from flask import current_app, render_template
+from markupsafe import Markup
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
+from models.models import Review
+from utils.cache import LRUCache
+from utils.model_events import on_commit
+
+_fragments = LRUCache('review_fragments', maxsize=1000)
+
+
+# ---------------------- 游标 ----------------------
+def encode_cursor(review):
+    return f"{review.created_at.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{review.id}"
+
+
+def decode_cursor(cursor):
+    """解析游标，格式不正确时抛出 ValueError"""
+    created_at, review_id = cursor.rsplit('_', 1)
+    return datetime.strptime(created_at, '%Y-%m-%dT%H:%M:%S.%f'), int(review_id)
+
+
+# ---------------------- 查询 ----------------------
+def review_page(product_id, before=None, limit=5):
+    """
+    按时间倒序取一页已验证评价（同时加载评价用户，避免逐条查询）
+    before 为上一页返回的游标；返回 (评价列表, 下一页游标或 None)
+    """
+    query = Review.query.options(joinedload(Review.user)).filter_by(product_id=product_id, is_verified=True)
+    if before:
+        created_at, review_id = decode_cursor(before)
+        query = query.filter(or_(Review.created_at < created_at,
+                                 and_(Review.created_at == created_at, Review.id < review_id)))
+    reviews = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(reviews[limit - 1]) if len(reviews) > limit else None
+    return reviews[:limit], next_cursor
+
+
+def format_review(review):
+    """详情页展示用的评价数据"""
+    return {
+        'id': review.id,
+        'user_name': review.user.full_name or review.user.username,
+        'rating': review.rating,
+        'title': review.title,
+        'content': review.content,
+        'created_at': review.created_at.strftime('%Y-%m-%d %H:%M')
+    }
+
+
+# ---------------------- 片段缓存 ----------------------
+def review_block(product_id):
+    """详情页评价区的 HTML 片段（含前 N 条评价与下一页游标）"""
+    html = _fragments.get(product_id)
+    if html is None:
+        reviews, next_cursor = review_page(product_id, limit=current_app.config['PRODUCT_DETAIL_REVIEWS'])
+        html = render_template('partials/review_list.html', product_id=product_id,
+                               reviews=[format_review(r) for r in reviews], next_cursor=next_cursor)
+        _fragments.set(product_id, html, ttl=current_app.config['REVIEW_FRAGMENT_TTL'])
+    return Markup(html)
+
+
+@on_commit(Review, key=lambda review: review.product_id)
+def _invalidate_fragments(product_ids):
+    for product_id in product_ids:
+        _fragments.delete(product_id)
@@ -0,0 +1,186 @@
+# utils/shared_store.py
+# =============================================
+# 进程间共享的小型键值存储
+# 用于缓存版本号、限流计数、下单排队状态等需要在多个 worker 之间一致的少量数据
+# - SHARED_STORE_PATH 为空：进程内字典（单进程开发环境）
+# - 配置文件路径：SQLite 文件（WAL 模式），同一台机器上的所有 worker 共享
+# 值只支持整数 / 浮点 / 字符串；可设置过期时间（秒）
+# =============================================
+
+import os
+import time
+import sqlite3
+import threading
+from utils.background import register_job
+
+_store = None
+
+
+class MemoryStore:
+    """进程内实现"""
+
+    def __init__(self):
+        self._data = {}  # key -> (value, 过期时间或 None)
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._alive(key, time.time())
+        return default if entry is None else entry[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            entries = {key: self._alive(key, now) for key in keys}
+        return {key: entry[0] for key, entry in entries.items() if entry is not None}
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def incr(self, key, amount=1, ttl=None):
+        """原子增加并返回新值；键不存在时从 0 开始，ttl 只在新建时生效"""
+        now = time.time()
+        with self._lock:
+            entry = self._alive(key, now)
+            if entry is None:
+                entry = (0, now + ttl if ttl else None)
+            value = entry[0] + amount
+            self._data[key] = (value, entry[1])
+        return value
+
+    def update(self, key, func, ttl=None):
+        """原子地读-改-写：func 接收旧值（不存在为 None）并返回新值，返回 None 表示删除；ttl 每次写入都重新计算"""
+        now = time.time()
+        with self._lock:
+            entry = self._alive(key, now)
+            value = func(None if entry is None else entry[0])
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = (value, now + ttl if ttl else None)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge(self):
+        """删除已过期的键"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+                del self._data[key]
+
+
+class SQLiteStore:
+    """SQLite 文件实现，每个线程（及 fork 后的每个进程）使用独立连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS kv ('
+                         'key TEXT PRIMARY KEY, value, expires_at REAL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connect().execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())).fetchone()
+        return default if row is None else row[0]
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = self._connect().execute(
+            f'SELECT key, value FROM kv WHERE key IN ({",".join("?" * len(keys))}) '
+            'AND (expires_at IS NULL OR expires_at > ?)', (*keys, time.time())).fetchall()
+        return dict(rows)
+
+    def set(self, key, value, ttl=None):
+        self._connect().execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                                (key, value, time.time() + ttl if ttl else None))
+
+    def incr(self, key, amount=1, ttl=None):
+        """原子增加并返回新值；键不存在或已过期时从 0 开始，ttl 只在新建时生效"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                               (key, now)).fetchone()
+            if row is None:
+                value = amount
+                conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                             (key, value, now + ttl if ttl else None))
+            else:
+                value = row[0] + amount
+                conn.execute('UPDATE kv SET value = ? WHERE key = ?', (value, key))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def update(self, key, func, ttl=None):
+        """原子地读-改-写：func 接收旧值（不存在为 None）并返回新值，返回 None 表示删除；ttl 每次写入都重新计算"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                               (key, now)).fetchone()
+            value = func(None if row is None else row[0])
+            if value is None:
+                conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+            else:
+                conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                             (key, value, now + ttl if ttl else None))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def purge(self):
+        """删除已过期的键"""
+        self._connect().execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+
+
+def get_store():
+    """返回当前存储；未初始化时使用进程内实现"""
+    global _store
+    if _store is None:
+        _store = MemoryStore()
+    return _store
+
+
+def init_app(app):
+    """按 SHARED_STORE_PATH 选择实现，并登记过期键清理任务"""
+    global _store
+    path = app.config.get('SHARED_STORE_PATH')
+    _store = SQLiteStore(path) if path else MemoryStore()
+    register_job(app, 'shared-store-purge', 300, lambda: get_store().purge())
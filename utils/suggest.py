@@ -0,0 +1,393 @@
+# utils/suggest.py
+# =============================================
+# 搜索框输入联想
+# - 商品名、分类名与热门搜索词放在进程内的压缩前缀树（radix trie）中，每个节点预先保存子树中得分最高的
+#   SUGGEST_TOP_K 条结果，查询只需沿前缀走一遍，不访问数据库
+# - 中文名同时按全拼与首字母建索引（需要安装 pypinyin，未安装时只按原文匹配）
+# - 得分：商品为销量，分类为其下商品销量之和，搜索词为被搜索次数
+# - 本进程提交的商品/分类修改直接增量更新前缀树；其他 worker 的修改通过版本号发现（每 SUGGEST_VERSION_CHECK_SECONDS
+#   秒检查一次），在后台线程重建后整体替换；
+#   版本号用单独的键 product_suggest（不用 products 表版本号，下单扣库存等批量 UPDATE 不影响联想），
+#   商品/分类经 ORM 提交修改时 +1；本进程记录自己 +1 的次数，版本号恰好等于 构建时版本 + 本进程次数 时直接采用
+#   定时任务按 SUGGEST_REBUILD_SECONDS 重建以刷新销量排序，并把累计的搜索次数写入 search_queries
+#   （每个进程最多暂存 SUGGEST_PENDING_QUERIES_MAX 个不同的搜索词，超出时丢弃次数最少的）
+# =============================================
+
+import time
+import heapq
+import threading
+from datetime import datetime
+from collections import Counter, namedtuple
+from functools import wraps
+from flask import current_app, request, make_response
+from sqlalchemy import inspect
+from models.database import db
+from models.models import Product, Category, SearchQuery
+from utils import metrics
+from utils.background import register_job
+from utils.cache_versions import read_version, bump
+from utils.model_events import on_commit
+from utils.page_cache import revalidating
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 可选依赖
+    lazy_pinyin = None
+
+_VERSION_KEY = 'product_suggest'
+
+# kind: product / category / query；ref 为 (kind, id 或搜索词)，同一条结果的多个索引键共用
+Suggestion = namedtuple('Suggestion', 'score text kind ref')
+
+
+def _rank(suggestion):
+    return -suggestion.score, suggestion.text
+
+
+# ---------------------- 压缩前缀树 ----------------------
+class _Node:
+    __slots__ = ('edges', 'entries', 'top')
+
+    def __init__(self):
+        self.edges = {}    # 边的首字符 -> (边标签, 子节点)
+        self.entries = {}  # 在此结束的索引键对应的结果：ref -> Suggestion
+        self.top = []      # 子树中得分最高的若干条结果（已排序、按 ref 去重）
+
+
+class SuggestIndex:
+    """
+    带子树 Top-K 的压缩前缀树
+    写操作加锁，只修改插入/删除路径上的节点并自底向上重算 Top-K；读操作不加锁
+    """
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.root = _Node()
+        self._keys = {}  # ref -> (Suggestion, 索引键列表)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _path(self, key, create):
+        """返回从根到 key 终点的节点列表；create=False 且不存在时返回 None"""
+        node, path, rest = self.root, [self.root], key
+        while rest:
+            edge = node.edges.get(rest[0])
+            if edge is None:
+                if not create:
+                    return None
+                child = _Node()
+                node.edges[rest[0]] = (rest, child)
+                path.append(child)
+                return path
+            label, child = edge
+            common = 0
+            while common < min(len(label), len(rest)) and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                if not create:
+                    return None
+                # 拆分边：label = 公共部分 + 剩余部分
+                middle = _Node()
+                middle.edges[label[common]] = (label[common:], child)
+                middle.top = child.top
+                node.edges[rest[0]] = (label[:common], middle)
+                child = middle
+            node, rest = child, rest[common:]
+            path.append(node)
+        return path
+
+    def _recompute_node(self, node):
+        # 各子节点的 top 已有序，归并取前 K 条即可，不必整体排序
+        lists = [sorted(node.entries.values(), key=_rank)] + [child.top for _, child in node.edges.values()]
+        top, seen = [], set()
+        for s in heapq.merge(*lists, key=_rank):
+            if s.ref not in seen:
+                seen.add(s.ref)
+                top.append(s)
+                if len(top) == self.top_k:
+                    break
+        node.top = top
+
+    def _recompute(self, path):
+        for node in reversed(path):
+            self._recompute_node(node)
+
+    def _remove_locked(self, ref):
+        old = self._keys.pop(ref, None)
+        if old is None:
+            return
+        for key in old[1]:
+            path = self._path(key, create=False)
+            if path is not None:
+                path[-1].entries.pop(ref, None)
+                self._recompute(path)
+
+    def add(self, suggestion, keys):
+        """加入（或替换）一条结果，keys 为它的全部索引键"""
+        keys = sorted({k for k in keys if k})
+        with self._lock:
+            self._remove_locked(suggestion.ref)
+            for key in keys:
+                path = self._path(key, create=True)
+                path[-1].entries[suggestion.ref] = suggestion
+                self._recompute(path)
+            self._keys[suggestion.ref] = (suggestion, keys)
+
+    def load(self, items):
+        """批量构建：先插入全部 (结果, 索引键)，最后自底向上统一计算 Top-K（新建的树尚未对外可见）"""
+        for suggestion, keys in items:
+            keys = sorted({k for k in keys if k})
+            for key in keys:
+                self._path(key, create=True)[-1].entries[suggestion.ref] = suggestion
+            self._keys[suggestion.ref] = (suggestion, keys)
+        # 后序遍历：子节点先于父节点
+        stack, order = [self.root], []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(child for _, child in node.edges.values())
+        for node in reversed(order):
+            self._recompute_node(node)
+        return self
+
+    def remove(self, ref):
+        with self._lock:
+            self._remove_locked(ref)
+
+    def get(self, ref):
+        entry = self._keys.get(ref)
+        return entry[0] if entry else None
+
+    def search(self, prefix, limit):
+        """以 prefix 开头的索引键对应的前 limit 条结果"""
+        node, rest = self.root, prefix
+        while rest:
+            edge = node.edges.get(rest[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if rest.startswith(label):
+                node, rest = child, rest[len(label):]
+            elif label.startswith(rest):
+                node, rest = child, ''
+            else:
+                return []
+        return node.top[:limit]
+
+
+# ---------------------- 索引键 ----------------------
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def index_keys(text):
+    """原文；含中文时再加全拼与首字母（如 维生素 -> weishengsu / wss）"""
+    text = normalize(text)
+    keys = [text]
+    if lazy_pinyin is not None and any('一' <= ch <= '鿿' for ch in text):
+        keys.append(''.join(lazy_pinyin(text)).replace(' ', ''))
+        keys.append(''.join(lazy_pinyin(text, style=Style.FIRST_LETTER)).replace(' ', ''))
+    return keys
+
+
+# ---------------------- 构建与维护 ----------------------
+_state = {'index': None, 'version': None, 'own_bumps': 0, 'checked_at': 0.0, 'rebuilding': False}
+_state_lock = threading.Lock()
+_pending_queries = Counter()  # 本进程尚未写入数据库的搜索次数
+
+
+def build_index():
+    """从数据库构建完整的前缀树"""
+    config = current_app.config
+    category_sales = Counter()
+    items = []
+
+    # 销量读取商品表上的 sales_count（utils/product_stats 维护）
+    for product_id, name, category_id, sales in db.session.query(Product.id, Product.name, Product.category_id,
+                                                                 Product.sales_count) \
+            .filter(Product.is_active == True):
+        items.append((Suggestion(sales, name, 'product', ('product', product_id)), index_keys(name)))
+        category_sales[category_id] += sales
+    for category_id, name in db.session.query(Category.id, Category.name):
+        items.append((Suggestion(category_sales[category_id], name, 'category', ('category', category_id)),
+                      index_keys(name)))
+    for text, count in db.session.query(SearchQuery.text, SearchQuery.count) \
+            .filter(SearchQuery.count >= config['SUGGEST_MIN_QUERY_COUNT']) \
+            .order_by(SearchQuery.count.desc()).limit(config['SUGGEST_POPULAR_QUERIES']):
+        items.append((Suggestion(count, text, 'query', ('query', text)), index_keys(text)))
+    return SuggestIndex(config['SUGGEST_TOP_K']).load(items)
+
+
+def rebuild():
+    """重建并整体替换前缀树，返回条目数"""
+    with _state_lock:
+        version = read_version(_VERSION_KEY)
+        _state['own_bumps'] = 0  # 此后本进程的 +1 从该版本起算
+    index = build_index()
+    with _state_lock:
+        _state.update(index=index, version=version + _state['own_bumps'], own_bumps=0)
+    metrics.inc('suggest_rebuilds_total')
+    return len(index)
+
+
+def _rebuild_in_background():
+    """其他 worker 修改了商品/分类：后台重建，重建期间继续使用旧树"""
+    with _state_lock:
+        if _state['rebuilding']:
+            return
+        _state['rebuilding'] = True
+    app = current_app._get_current_object()
+
+    def run():
+        try:
+            with app.app_context():
+                rebuild()
+        except Exception as e:
+            app.logger.error(f'联想索引重建失败: {str(e)}')
+        finally:
+            _state['rebuilding'] = False
+
+    threading.Thread(target=run, name='suggest-rebuild', daemon=True).start()
+
+
+def _deleted(obj):
+    """after_flush 时被删除的实例仍处于 persistent 状态，需查看所在会话的 deleted 集合"""
+    session = inspect(obj).session
+    return session is not None and obj in session.deleted
+
+
+def _bump():
+    # 先 +1 再计数：持锁比对时计数不会超过已生效的 +1 次数
+    bump(_VERSION_KEY)
+    with _state_lock:
+        _state['own_bumps'] += 1
+
+
+@on_commit(Product, key=lambda p: (p.id, p.name, bool(p.is_active) and not _deleted(p)))
+def _update_products(changes):
+    _bump()
+    index = _state['index']
+    if index is None:
+        return
+    for product_id, name, active in changes:
+        ref = ('product', product_id)
+        if not active:
+            index.remove(ref)
+        else:
+            old = index.get(ref)
+            index.add(Suggestion(old.score if old else 0, name, 'product', ref), index_keys(name))
+
+
+@on_commit(Category, key=lambda c: (c.id, c.name, not _deleted(c)))
+def _update_categories(changes):
+    _bump()
+    index = _state['index']
+    if index is None:
+        return
+    for category_id, name, exists in changes:
+        ref = ('category', category_id)
+        if not exists:
+            index.remove(ref)
+        else:
+            old = index.get(ref)
+            index.add(Suggestion(old.score if old else 0, name, 'category', ref), index_keys(name))
+
+
+# ---------------------- 查询 ----------------------
+def suggest(prefix, limit=None):
+    """返回 [Suggestion]；首次调用时同步构建前缀树"""
+    config = current_app.config
+    limit = min(limit or config['SUGGEST_TOP_K'], config['SUGGEST_TOP_K'])
+    prefix = normalize(prefix)
+    if _state['index'] is None:
+        with _state_lock:
+            if _state['index'] is None:
+                _state.update(version=read_version(_VERSION_KEY), own_bumps=0)
+                _state.update(index=build_index(), checked_at=time.monotonic())
+    elif time.monotonic() - _state['checked_at'] >= config['SUGGEST_VERSION_CHECK_SECONDS']:
+        # 每次按键都会请求联想，版本号只按间隔检查；只有本进程的修改时已增量更新，直接采用
+        with _state_lock:
+            _state['checked_at'] = time.monotonic()
+            version = read_version(_VERSION_KEY)
+            stale = version != _state['version'] + _state['own_bumps']
+            if not stale:
+                _state.update(version=version, own_bumps=0)
+        if stale:
+            _rebuild_in_background()
+    return _state['index'].search(prefix, limit) if prefix else []
+
+
+# ---------------------- 热门搜索词 ----------------------
+def record_search(view):
+    """
+    装饰器：统计带 search 参数的请求
+    放在 cached_page 之外，命中页面缓存的搜索同样计数；被限流拒绝（429）与页面缓存的后台重新渲染不计数
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        text = normalize(request.args.get('search', ''))[:100]
+        if text and response.status_code != 429 and not revalidating():
+            _count_query(text)
+        return response
+    return wrapper
+
+
+def _count_query(text):
+    limit = current_app.config['SUGGEST_PENDING_QUERIES_MAX']
+    with _state_lock:
+        _pending_queries[text] += 1
+        if len(_pending_queries) <= limit:
+            return
+        # 超出上限：只保留次数最多的九成，丢弃其余（多为只出现一次的长尾搜索词）
+        kept = _pending_queries.most_common(limit * 9 // 10)
+        dropped = len(_pending_queries) - len(kept)
+        _pending_queries.clear()
+        _pending_queries.update(dict(kept))
+    metrics.inc('suggest_queries_dropped_total', dropped)
+
+
+def _flush_queries():
+    """把本进程累计的搜索次数累加到 search_queries"""
+    with _state_lock:
+        pending = dict(_pending_queries)
+        _pending_queries.clear()
+    if not pending:
+        return 0
+
+    # ORM 批量 upsert：参数按属性名（text）传入，冲突列为主键 query
+    table = SearchQuery.__table__
+    if db.session.get_bind().dialect.name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(SearchQuery)
+        stmt = stmt.on_duplicate_key_update(count=table.c.count + stmt.inserted['count'],
+                                            updated_at=stmt.inserted['updated_at'])
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(SearchQuery)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.query],
+                                          set_={'count': table.c.count + stmt.excluded['count'],
+                                                'updated_at': stmt.excluded['updated_at']})
+    now = datetime.now()
+    db.session.execute(stmt, [{'text': q, 'count': c, 'updated_at': now} for q, c in pending.items()])
+    db.session.commit()
+    return len(pending)
+
+
+def refresh():
+    """定时任务：写入搜索次数后重建前缀树（刷新销量与热门搜索词排序）"""
+    _flush_queries()
+    return rebuild()
+
+
+def init_app(app):
+    """注册命令行入口并登记定时重建任务"""
+
+    @app.cli.command('rebuild-suggest')
+    def rebuild_suggest_command():
+        """写入累计的搜索次数并重建联想索引"""
+        print(f'联想索引共 {refresh()} 条')
+
+    register_job(app, 'suggest-refresh', app.config.get('SUGGEST_REBUILD_SECONDS', 0), refresh)
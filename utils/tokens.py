@@ -0,0 +1,144 @@
+# utils/tokens.py
+# =============================================
+# 无状态 JWT 认证（移动端 / API 客户端）
+# - 登录签发访问令牌与刷新令牌：sub 为用户ID（字符串），附带 adm（是否管理员）与 ver（令牌版本）
+# - 请求带 Authorization: Bearer <访问令牌> 时，Flask-Login 的 request_loader 按令牌声明构造 TokenUser，
+#   login_required、current_user.id、current_user.is_admin 均直接使用令牌中的值，不查询 users 表；
+#   只有访问地址、用户名等其他属性时才加载对应的 User 行
+# - 吊销列表保存在共享存储中，体积与活跃令牌数无关：
+#     jwt_revoked:<jti>      单个令牌注销，保留到该令牌过期
+#     jwt_version:<用户ID>   最低有效令牌版本（修改密码、权限变化、注销全部设备时 users.token_version 加一，
+#                            删除用户时写入极大值），保留一个刷新令牌有效期，之后更早签发的令牌都已自然过期
+#   每个请求只读共享存储两个键；存储为空时（如共享存储文件被删除）先从 users 表载入 token_version > 0 的用户
+# - 进程内存储中的吊销只对当前 worker 生效：JWT_REQUIRE_SHARED_STORE 为真（wsgi.py 默认）而未配置共享存储时启动失败
+# =============================================
+
+import time
+from flask import current_app, abort
+from flask_jwt_extended import create_access_token, create_refresh_token, verify_jwt_in_request, get_jwt
+from flask_login import UserMixin
+from sqlalchemy import inspect
+from models.database import db, jwt
+from models.models import User
+from utils import metrics
+from utils.model_events import on_commit
+from utils.shared_store import get_store, MemoryStore
+
+_REVOKED = 'jwt_revoked:'
+_VERSION = 'jwt_version:'
+_LOADED = 'jwt_versions_loaded'
+_DELETED_VERSION = 2 ** 31 - 1  # 已删除用户：任何令牌版本都低于它
+
+_state = {'loaded': False}  # 本进程已确认共享存储中有令牌版本
+
+
+def _version_ttl():
+    return int(current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds())
+
+
+# ---------------------- 签发 ----------------------
+def _claims(user):
+    return {'adm': bool(user.is_admin), 'ver': user.token_version or 0}
+
+
+def issue_access_token(user):
+    return create_access_token(identity=str(user.id), additional_claims=_claims(user))
+
+
+def issue_tokens(user):
+    """登录时签发的访问令牌与刷新令牌"""
+    return {
+        'access_token': issue_access_token(user),
+        'refresh_token': create_refresh_token(identity=str(user.id), additional_claims=_claims(user))
+    }
+
+
+# ---------------------- 当前用户 ----------------------
+class TokenUser(UserMixin):
+    """
+    由访问令牌声明构造的当前用户
+    id / is_admin 取自令牌；其他属性的读取、赋值与方法调用在首次访问时加载 User 行后转交
+    """
+
+    def __init__(self, claims):
+        self.__dict__.update(id=int(claims['sub']), is_admin=bool(claims.get('adm')), claims=claims, _user=None)
+
+    def _load(self):
+        user = self.__dict__['_user']
+        if user is None:
+            user = self.__dict__['_user'] = db.session.get(User, self.id)
+            metrics.inc('token_user_loads_total')
+            if user is None:
+                abort(401)
+        return user
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+
+def user_from_request(request):
+    """Flask-Login request_loader：带 Bearer 令牌的请求返回 TokenUser，否则返回 None"""
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return None
+    # 令牌无效、过期或已吊销时由 flask_jwt_extended 的错误处理返回 401 / 422
+    verify_jwt_in_request()
+    metrics.inc('token_auth_total')
+    return TokenUser(get_jwt())
+
+
+# ---------------------- 吊销 ----------------------
+def _ensure_loaded(store):
+    """共享存储中还没有令牌版本时，从 users 表载入一次（只含修改过版本的用户）"""
+    if _state['loaded']:
+        return
+    if not store.get(_LOADED):
+        ttl = _version_ttl()
+        for user_id, version in db.session.query(User.id, User.token_version).filter(User.token_version > 0):
+            store.update(f'{_VERSION}{user_id}', lambda old, version=version: max(old or 0, version), ttl=ttl)
+        store.set(_LOADED, 1)
+    _state['loaded'] = True
+
+
+def is_revoked(payload):
+    store = get_store()
+    _ensure_loaded(store)
+    found = store.get_many([f"{_REVOKED}{payload['jti']}", f"{_VERSION}{payload['sub']}"])
+    if f"{_REVOKED}{payload['jti']}" in found:
+        return True
+    return payload.get('ver', 0) < found.get(f"{_VERSION}{payload['sub']}", 0)
+
+
+def revoke(payload):
+    """注销单个令牌（访问令牌或刷新令牌），保留到它过期为止"""
+    ttl = max(int(payload['exp'] - time.time()), 1)
+    get_store().set(f"{_REVOKED}{payload['jti']}", 1, ttl=ttl)
+    metrics.inc('token_revocations_total', type=payload.get('type', 'access'))
+
+
+def _deleted(obj):
+    session = inspect(obj).session
+    return session is not None and obj in session.deleted
+
+
+@on_commit(User, key=lambda u: (u.id, _DELETED_VERSION if _deleted(u) else u.token_version or 0))
+def _publish_versions(changes):
+    store = get_store()
+    ttl = _version_ttl()
+    for user_id, version in changes:
+        if version > 0:
+            store.update(f'{_VERSION}{user_id}', lambda old, version=version: max(old or 0, version), ttl=ttl)
+
+
+def init_app(app):
+    """检查吊销记录所用的存储并登记吊销检查"""
+    if app.config.get('JWT_REQUIRE_SHARED_STORE') and isinstance(get_store(), MemoryStore):
+        raise RuntimeError('JWT 令牌吊销需要在 worker 之间共享，请配置 SHARED_STORE_PATH')
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_revoked(jwt_payload)
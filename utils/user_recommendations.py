@@ -0,0 +1,248 @@
+# utils/user_recommendations.py
+# =============================================
+# 个性化推荐：基于评分的物品协同过滤（item-based CF）
+# - 流式读取 reviews 中的评分，构造 用户×商品 的稀疏评分矩阵 R（同一用户多次评价同一商品取平均）
+# - 商品相似度为 R 各列之间的余弦相似度：列归一化后分批计算 Rn.T[批] @ Rn，
+#   每个商品只保留前 CF_NEIGHBORS 个相似商品，全程不构造稠密矩阵
+# - 用户对商品的得分 = Σ 相似度 × (评分 - 3)，高分正向、低分反向；排除已评价商品后取前 CF_TOP_N 个
+# - 两个阶段都按批切分后交给进程池（spawn）并行计算，按用户ID区间分批写入 user_recommendations
+# - 接口按 用户 + 表版本号 缓存，批处理写入后自动失效
+# - numpy / scipy 只在批处理与计算进程的函数中导入，Web 进程读取推荐结果时不加载
+# =============================================
+
+import time
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from sqlalchemy import select, delete
+from models.database import db
+from models.models import Review, Product, UserRecommendation
+from utils import metrics
+from utils.background import register_job
+from utils.cache import LRUCache
+from utils.cache_versions import version_stamp
+from utils.shared_store import get_store
+
+_NEUTRAL = 3.0              # 评分中值：高于为正反馈，低于为负反馈
+_LOCK_KEY = 'job_lock:user_recommendations'
+_LOCK_TTL = 6 * 3600        # 任务异常退出时锁自动过期
+_READ_BATCH = 50000
+
+_cache = LRUCache('user_recommendations', maxsize=10000)
+
+# 计算进程内的只读矩阵（由进程池 initializer 设置）
+_matrix = None
+
+
+# ---------------------- 计算进程内执行 ----------------------
+def _set_matrix(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def _top_per_row(matrix, k, exclude=None):
+    """
+    稀疏矩阵每行取得分最高的 k 个正值，返回 (行, 列, 值, 名次)；exclude 中同位置的非零项不参与
+    热门商品会让得分行接近稠密，逐行 argpartition（O(非零数)）比整体排序快得多
+    """
+    import numpy as np
+    matrix = matrix.tocsr()
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+    rows, cols, vals = [], [], []
+    for r in np.flatnonzero(np.diff(indptr)):
+        values, columns = data[indptr[r]:indptr[r + 1]], indices[indptr[r]:indptr[r + 1]]
+        skip = exclude.indices[exclude.indptr[r]:exclude.indptr[r + 1]] if exclude is not None else ()
+        wanted = k + len(skip)  # 多取若干个，剔除排除项后仍够 k 个
+        top = np.argpartition(values, -wanted)[-wanted:] if len(values) > wanted else np.arange(len(values))
+        top = top[np.argsort(-values[top], kind='stable')]
+        top = top[(values[top] > 0) & ~np.isin(columns[top], skip)][:k]
+        rows.append(np.full(len(top), r))
+        cols.append(columns[top])
+        vals.append(values[top])
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float32), empty
+    row = np.concatenate(rows)
+    _, group_start, group_size = np.unique(row, return_index=True, return_counts=True)
+    rank = np.arange(len(row)) - np.repeat(group_start, group_size)
+    return row, np.concatenate(cols), np.concatenate(vals), rank
+
+
+def _similarity_block(start, stop, k):
+    """商品 [start, stop) 与所有商品的余弦相似度，每个商品保留前 k 个（不含自身）"""
+    from scipy import sparse
+    block = (_matrix[start:stop] @ _matrix.T).tocoo()
+    keep = block.row + start != block.col
+    block = sparse.coo_matrix((block.data[keep], (block.row[keep], block.col[keep])), shape=block.shape)
+    row, col, val, _ = _top_per_row(block, k)
+    return row + start, col, val
+
+
+def _score_users(ratings, k):
+    """一批用户的推荐：ratings 为该批用户的评分行，返回 (行, 商品列, 得分, 名次)"""
+    centered = ratings.copy()
+    centered.data -= _NEUTRAL
+    return _top_per_row(centered @ _matrix, k, exclude=ratings)  # 排除已评价商品
+
+
+# ---------------------- 构造矩阵 ----------------------
+def _load_ratings():
+    """流式读取评分，返回 (用户ID数组, 商品ID数组, 评分矩阵 CSR)"""
+    import numpy as np
+    from scipy import sparse
+    parts = []
+    result = db.session.execute(select(Review.user_id, Review.product_id, Review.rating)
+                                .execution_options(yield_per=_READ_BATCH))
+    for partition in result.partitions():
+        parts.append(np.array(partition, dtype=np.int64))
+    if not parts:
+        return None, None, None
+    data = np.concatenate(parts)
+
+    user_ids, u = np.unique(data[:, 0], return_inverse=True)
+    product_ids, p = np.unique(data[:, 1], return_inverse=True)
+    # 同一用户对同一商品的多条评价取平均
+    pair, inverse = np.unique(u * len(product_ids) + p, return_inverse=True)
+    mean = np.bincount(inverse, weights=data[:, 2]) / np.bincount(inverse)
+    ratings = sparse.csr_matrix((mean.astype(np.float32), (pair // len(product_ids), pair % len(product_ids))),
+                                shape=(len(user_ids), len(product_ids)))
+    return user_ids, product_ids, ratings
+
+
+def _normalize_columns(ratings):
+    """每列除以其 L2 范数，之后列向量点积即余弦相似度"""
+    import numpy as np
+    from scipy import sparse
+    norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0))).ravel().astype(np.float32)
+    norms[norms == 0] = 1
+    return (ratings @ sparse.diags(1 / norms)).tocsr()
+
+
+@contextmanager
+def _pool(matrix):
+    """返回与内置 map 同签名的并行 map；CF_WORKERS 为 0 时在当前进程内计算"""
+    workers = current_app.config['CF_WORKERS']
+    if workers <= 0:
+        _set_matrix(matrix)
+        try:
+            yield map
+        finally:
+            _set_matrix(None)
+        return
+    # 与图表渲染一致使用 spawn：Web 进程里有后台线程和数据库连接，fork 后状态不可靠
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_set_matrix, initargs=(matrix,))
+    try:
+        yield executor.map
+    finally:
+        executor.shutdown()
+
+
+def _similarity(ratings):
+    """返回 商品×商品 的稀疏相似度矩阵（每行只保留前 CF_NEIGHBORS 个）"""
+    import numpy as np
+    from scipy import sparse
+    config = current_app.config
+    items = ratings.shape[1]
+    item_rows = _normalize_columns(ratings).T.tocsr()
+    starts = range(0, items, config['CF_ITEM_CHUNK'])
+    stops = [min(start + config['CF_ITEM_CHUNK'], items) for start in starts]
+
+    rows, cols, vals = [], [], []
+    with _pool(item_rows) as pmap:
+        for row, col, val in pmap(_similarity_block, starts, stops, [config['CF_NEIGHBORS']] * len(stops)):
+            rows.append(row)
+            cols.append(col)
+            vals.append(val)
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(items, items))
+
+
+# ---------------------- 批处理任务 ----------------------
+def _write_chunk(user_ids, product_ids, lower, upper, result):
+    """替换用户ID在 [lower, upper] 区间内的推荐（区间内已无评分的用户同时被清空）"""
+    row, col, score, rank = result
+    stmt = delete(UserRecommendation).where(UserRecommendation.user_id >= lower)
+    if upper is not None:
+        stmt = stmt.where(UserRecommendation.user_id <= upper)
+    db.session.execute(stmt)
+    db.session.bulk_insert_mappings(UserRecommendation, [
+        {'user_id': u, 'rank': r + 1, 'product_id': p, 'score': round(s, 6)}
+        for u, r, p, s in zip(user_ids[row].tolist(), rank.tolist(), product_ids[col].tolist(), score.tolist())
+    ])
+    db.session.commit()
+
+
+def build_user_recommendations():
+    """全量重新计算所有用户的推荐，返回写入推荐的用户数；已有任务在运行时返回 None"""
+    import numpy as np
+    store = get_store()
+    if store.incr(_LOCK_KEY, ttl=_LOCK_TTL) > 1:
+        return None
+
+    try:
+        config = current_app.config
+        started = time.perf_counter()
+        user_ids, product_ids, ratings = _load_ratings()
+        db.session.commit()  # 读取完成后结束事务，计算期间不占用连接上的快照
+        if ratings is None:
+            db.session.execute(delete(UserRecommendation))
+            db.session.commit()
+            return 0
+
+        # 得分 = 评分行 @ 相似度矩阵的转置（商品 j 的得分汇总 j 的相似商品上的评分）
+        neighbours = _similarity(ratings).T.tocsr()
+        chunk, top_n = config['CF_USER_CHUNK'], config['CF_TOP_N']
+        starts = list(range(0, len(user_ids), chunk))
+        users, lower = 0, 0
+        with _pool(neighbours) as pmap:
+            results = pmap(_score_users, (ratings[start:start + chunk] for start in starts), [top_n] * len(starts))
+            for index, (start, result) in enumerate(zip(starts, results)):
+                # 按用户ID区间写入：第一批从 0 开始、每批紧接上一批的上界、最后一批不设上限，区间之间没有空隙
+                upper = int(user_ids[starts[index + 1] - 1]) if index + 1 < len(starts) else None
+                row = result[0]
+                _write_chunk(user_ids, product_ids, lower, upper, (row + start,) + tuple(result[1:]))
+                users += len(np.unique(row))
+                lower = upper + 1 if upper is not None else None
+
+        metrics.inc('user_recommendation_users_total', users)
+        metrics.observe('user_recommendation_job_seconds', time.perf_counter() - started)
+        return users
+    finally:
+        store.delete(_LOCK_KEY)
+
+
+# ---------------------- 读取 ----------------------
+def for_user(user_id, limit=None):
+    """某用户的个性化推荐（按名次，排除已下架），结果按用户与表版本号缓存"""
+    limit = limit or current_app.config['CF_TOP_N']
+    key = (user_id, limit, version_stamp('user_recommendations', 'products'))
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    products = Product.query.join(UserRecommendation, UserRecommendation.product_id == Product.id) \
+        .filter(UserRecommendation.user_id == user_id, Product.is_active == True) \
+        .order_by(UserRecommendation.rank).limit(limit).all()
+    items = [{'id': p.id, 'name': p.name, 'price': float(p.price), 'image_url': p.image_url} for p in products]
+    _cache.set(key, items)
+    return items
+
+
+def init_app(app):
+    """按配置调整缓存，注册命令行入口并登记定时任务"""
+    _cache.maxsize = app.config['CF_CACHE_SIZE']
+    _cache.ttl = app.config['CF_CACHE_TTL']
+
+    @app.cli.command('build-user-recommendations')
+    def build_user_recommendations_command():
+        """根据评分重新计算所有用户的个性化推荐"""
+        started = time.perf_counter()
+        users = build_user_recommendations()
+        if users is None:
+            print('已有推荐任务在运行')
+        else:
+            print(f'已为 {users} 个用户生成推荐，耗时 {time.perf_counter() - started:.1f}s')
+
+    register_job(app, 'user_recommendations', app.config.get('CF_INTERVAL_SECONDS', 0), build_user_recommendations)
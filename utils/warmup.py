@@ -0,0 +1,73 @@
+# utils/warmup.py
+# =============================================
+# 启动预热模块
+# 在开始接收流量之前：
+# - 预编译所有 Jinja 模板
+# - 以内部请求访问 WARMUP_PATHS 中的热点页面，填充目录类缓存与 SQL 编译缓存
+# - 预先建立数据库连接池中的连接
+# 预派生部署时前两步在主进程执行（fork 后各 worker 共享），连接池只在 worker 中预热
+# =============================================
+
+import time
+from models.database import db
+from utils import metrics
+
+
+def warm_templates(app):
+    """编译并缓存全部模板，返回模板数量"""
+    count = 0
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+            count += 1
+    return count
+
+
+def warm_paths(app):
+    """用测试客户端访问热点页面，返回 {路径: 状态码}"""
+    results = {}
+    with app.test_client() as client:
+        for path in app.config.get('WARMUP_PATHS', []):
+            try:
+                results[path] = client.get(path).status_code
+            except Exception as e:
+                app.logger.error(f'预热页面 {path} 失败: {str(e)}')
+                results[path] = None
+    return results
+
+
+def warm_pool(app, size=None):
+    """同时借出 size 个连接并执行 SELECT 1，归还后留在连接池中"""
+    size = size or app.config['SQLALCHEMY_ENGINE_OPTIONS'].get('pool_size', 5)
+    with app.app_context():
+        connections = []
+        try:
+            for _ in range(size):
+                conn = db.engine.connect()
+                connections.append(conn)
+                conn.exec_driver_sql('SELECT 1')
+        finally:
+            for conn in connections:
+                conn.close()
+    return len(connections)
+
+
+def warm_up(app, pool=True):
+    """执行全部预热步骤并记录耗时"""
+    started = time.perf_counter()
+    templates = warm_templates(app)
+    paths = warm_paths(app)
+    connections = warm_pool(app) if pool else 0
+    elapsed = time.perf_counter() - started
+    metrics.set_gauge('warmup_seconds', elapsed)
+    app.logger.info(f'预热完成：模板 {templates} 个，页面 {paths}，连接 {connections} 个，耗时 {elapsed:.2f}s')
+    return elapsed
+
+
+def init_app(app):
+    """注册 flask warmup 命令，便于单独检查预热效果"""
+
+    @app.cli.command('warmup')
+    def warmup_command():
+        """执行一次预热并输出耗时"""
+        print(f'预热耗时 {warm_up(app):.2f}s')
@@ -0,0 +1,21 @@
+# wsgi.py
+# =============================================
+# 生产环境 WSGI 入口
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# 由 gunicorn.conf.py 启动时，预热与后台任务在主进程/worker 的钩子中执行；
+# 其他 WSGI 服务器（uWSGI、mod_wsgi 等）直接加载本模块时在这里完成
+# =============================================
+
+import os
+
+# 多 worker 部署：JWT 吊销记录必须保存在共享存储中，未配置 SHARED_STORE_PATH 时启动失败（见 utils/tokens.py）
+os.environ.setdefault('JWT_REQUIRE_SHARED_STORE', '1')
+
+from app import create_app
+from utils import background, warmup
+
+app = create_app()
+
+if not os.environ.get('APP_PREFORK'):
+    warmup.warm_up(app)
+    background.start_jobs(app)